@@ -1,10 +1,25 @@
+from contextlib import asynccontextmanager, AsyncExitStack
+from typing import List, Optional
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+import asyncio
 import base64
+import json
 
-from src.backend.services.document_processor import process_document_image
-from src.backend.utils.comparators import compare_identity
-from openai import OpenAI
+from src.backend.services.verification import verify_document, verification_stats, VERIFICATION_MODES
+from src.backend.services.batch import (
+    batch_items_from_files, batch_items_from_zip, verify_batch, BatchTooLarge, BATCH_MAX_ITEMS, BATCH_MAX_BYTES
+)
+from src.backend.services.job_queue import job_queue
+from src.backend.utils.admission import admission, AdmissionRejected
+from src.backend.utils.callback_urls import check_callback_url, UnsafeCallbackURL
+from src.backend.utils.comparators import comparator_stats
+from src.backend.utils.ocr_pool import ocr_pool, OCRPoolFull
+from src.backend.utils.extraction_cache import extraction_cache
+from src.backend.utils.metrics import registry
+from src.backend.utils.preprocessing import check_image_header, ImageTooLarge
+from src.backend.utils.openai_client import get_async_openai_client, close_openai_clients, DeadlineExceeded
+from src.common.tracing import TracingMiddleware
 
 from dotenv import load_dotenv
 import os
@@ -13,10 +28,93 @@ load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
     raise Exception("OPENAI_API_KEY environment variable not set.")
-app = FastAPI(title='KYC Document Processor API')
 
-# Initialize OpenAI client with API key
-client = OpenAI(api_key=openai_api_key)
+# Largest accepted document upload in bytes. Starlette spools uploads to disk, so the size is known
+# before the document is read into memory.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+# Size of the chunks batch uploads are read in
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Stop the OCR worker processes and close pooled OpenAI connections when the API shuts down
+    ocr_pool.shutdown()
+    await close_openai_clients()
+
+
+app = FastAPI(title='KYC Document Processor API', lifespan=lifespan)
+# A span per request, continuing the frontend's trace (see src/common/tracing.py)
+app.add_middleware(TracingMiddleware, service="backend")
+
+# Shared async OpenAI client with a keep-alive connection pool, so LLM calls don't block the event loop
+# and don't pay a new TLS handshake per request
+client = get_async_openai_client()
+
+async def read_upload(file: UploadFile):
+    """
+    Reads an uploaded document into a single buffer after checking its size, and checks its pixel
+    count from the image header before anything is decoded (see MAX_IMAGE_PIXELS).
+
+    Returns:
+        bytes: The uploaded file.
+
+    Raises:
+        HTTPException: 413 if the file or the image is too large, 400 if it isn't a readable image
+    """
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds the maximum size of {UPLOAD_MAX_BYTES} bytes.")
+    # One byte more than allowed is enough to tell that an upload of unknown size is too large
+    file_bytes = await file.read(UPLOAD_MAX_BYTES + 1)
+    if len(file_bytes) > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds the maximum size of {UPLOAD_MAX_BYTES} bytes.")
+    try:
+        check_image_header(file_bytes)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=400, detail="File is not a readable JPEG or PNG image.")
+    return file_bytes
+
+async def read_batch_uploads(files):
+    """
+    Reads the uploads of a batch request in chunks, stopping as soon as together they exceed BATCH_MAX_BYTES.
+
+    Returns:
+        list: The contents of `files`, in order.
+
+    Raises:
+        HTTPException: 413 if the uploads are too large
+    """
+    contents = []
+    total = 0
+    for file in files:
+        chunks = []
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            total += len(chunk)
+            if total > BATCH_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"Batch exceeds the maximum size of {BATCH_MAX_BYTES} bytes.")
+            chunks.append(chunk)
+        contents.append(b"".join(chunks))
+    return contents
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that holds an admission slot until the response is done, also if the client
+    disconnects mid-stream. The body is closed first, so its work is cancelled before the slot is freed.
+    """
+
+    def __init__(self, content, admitted, **kwargs):
+        super().__init__(content, **kwargs)
+        self.admitted = admitted
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            await self.admitted.aclose()
 
 @app.post("/process_document", summary="Process a document and verify identity")
 async def process_document(
@@ -27,6 +125,7 @@ async def process_document(
     street_number: str = Form(...),
     postal_code: str = Form(...),
     city: str = Form(...),
+    mode: Optional[str] = Form(None),
 ):
     """
     Process and verify a KYC (Know Your Customer) document against provided user information.
@@ -39,17 +138,21 @@ async def process_document(
         street_number (str): User's provided street number
         postal_code (str): User's provided postal code
         city (str): User's provided city
+        mode (str, optional): Verification mode, 'two_call' or 'single_call' (defaults to VERIFICATION_MODE)
     
     Returns:
         JSONResponse: A message indicating whether verification was successful
     
     Raises:
-        HTTPException: If file type is invalid or document processing fails
+        HTTPException: If file type or size is invalid or document processing fails, 429/503
+            with a Retry-After header if the server is too busy to admit the request, and 504 if an
+            LLM call missed its deadline
     
     Process Flow:
         1. Validates the uploaded file format
         2. Processes the document using OCR and LLM
         3. Compares extracted information with user-provided data
+           (in the same LLM call in 'single_call' mode)
         4. Returns verification result
     """
     # Validate file type: Only JPEG or PNG allowed
@@ -58,48 +161,255 @@ async def process_document(
             status_code=400,
             detail="Unsupported file type. Only JPEG and PNG allowed."
         )
+    if mode is not None and mode not in VERIFICATION_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported verification mode. Use one of: {', '.join(VERIFICATION_MODES)}."
+        )
     
-    # Read the uploaded file into memory
-    file_bytes = await file.read()
+    # Read the uploaded file into memory, once it is known to be a reasonably sized image
+    file_bytes = await read_upload(file)
     
-    # Process the document image using OCR and LLM
-    # This step extracts text from the image and processes it using OpenAI
+    user_data = {
+        "first_name": first_name,
+        "last_name": last_name,
+        "street_name": street_name,
+        "street_number": street_number,
+        "postal_code": postal_code,
+        "city": city,
+    }
+
+    # Process the document image using OCR and LLM, and compare the extracted information
+    # with the user-provided data. Depending on the verification mode this is one or two LLM calls.
+    # Admission control bounds the verifications in flight and their OCR and LLM stages.
     try:
-        extracted_data = process_document_image(
-            client=client, 
-            file_bytes=file_bytes, 
-            processing='ocr'
+        async with admission.admit() as limits:
+            result = await verify_document(
+                client=client,
+                file_bytes=file_bytes,
+                user_data=user_data,
+                processing='ocr',
+                mode=mode,
+                limits=limits
+            )
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Server is busy, please try again later: {e}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except OCRPoolFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server is busy, please try again later: {e}",
+            headers={"Retry-After": str(admission.retry_after())}
+        )
+    except DeadlineExceeded as e:
+        raise HTTPException(
+            status_code=504,
+            detail=f"Document processing timed out, please try again: {e}"
         )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error processing document: {e}"
         )
-    
-    # Compare user-provided information with extracted data
-    # This verification step ensures the document matches the user's input
-    is_verified = compare_identity(
-        # User-provided information
-        user_first_name=first_name,
-        user_last_name=last_name,
-        user_street_name=street_name,
-        user_street_number=street_number,
-        user_postal_code=postal_code,
-        user_city=city,
-        
-        # Information extracted from the document
-        extracted_first_name=extracted_data.get("extracted_first_name"),
-        extracted_last_name=extracted_data.get("extracted_last_name"),
-        extracted_client_street_name=extracted_data.get("extracted_client_street_name"),
-        extracted_client_street_number=extracted_data.get("extracted_client_street_number"),
-        extracted_client_postal_code=extracted_data.get("extracted_client_postal_code"),
-        extracted_client_city=extracted_data.get("extracted_client_city"),
-    )
+    is_verified = result["is_verified"]
 
     # Return appropriate response based on verification result
     response = "Thank you very much. You have been verified successfully." if is_verified else "Verification failed, please try again."
     return JSONResponse(content=response)
 
+@app.post("/process_documents/batch", summary="Verify many documents and stream the results")
+async def process_documents_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    manifest: Optional[str] = Form(None),
+    archive: Optional[UploadFile] = File(None),
+    mode: Optional[str] = Form(None),
+):
+    """
+    Verify a batch of KYC documents, e.g. from a partner import, in one request.
+
+    The batch is sent either as
+    - multipart: the documents as repeated `files` fields plus a `manifest` field, or
+    - a zip `archive` holding the documents and a manifest.json.
+    The manifest is a JSON array with one object per document holding the user-provided fields
+    (first_name, last_name, street_name, street_number, postal_code, city), the document's file name
+    under 'file' and an optional 'id' that is echoed in the result. Without file names, multipart
+    entries are paired with the files by position.
+
+    Args:
+        mode (str, optional): Verification mode for all items, 'two_call' or 'single_call'
+
+    Returns:
+        StreamingResponse: Newline-delimited JSON with one line per document as soon as it is verified
+            (index, id, file, is_verified, mode, error, seconds), followed by a summary line.
+
+    Raises:
+        HTTPException: 400 if the batch is malformed or holds an unreadable image, 413 if it has too many
+            documents, or they or an image in it are too large (BATCH_MAX_BYTES, BATCH_MAX_FILE_BYTES,
+            MAX_IMAGE_PIXELS), and 429/503 with a Retry-After header if the server is too busy to admit
+            it; errors during verification are reported in the document's result line.
+
+    Items are processed concurrently. BATCH_OCR_CONCURRENCY and BATCH_LLM_CONCURRENCY cap how many of
+    them are in the image/OCR stage and in LLM calls at the same time, within the ADMISSION_OCR_SLOTS
+    and ADMISSION_LLM_SLOTS shared with /process_document. The batch holds one admission slot.
+    """
+    if mode is not None and mode not in VERIFICATION_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported verification mode. Use one of: {', '.join(VERIFICATION_MODES)}."
+        )
+    if (archive is None) == (manifest is None):
+        raise HTTPException(
+            status_code=400,
+            detail="Send either a zip archive or files together with a manifest."
+        )
+
+    # Uploads are read before streaming starts, since they are closed once this handler returns
+    files = files or []
+    if len(files) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch has {len(files)} files, the maximum is {BATCH_MAX_ITEMS}."
+        )
+    try:
+        if archive is not None:
+            [archive_bytes] = await read_batch_uploads([archive])
+            items = batch_items_from_zip(archive_bytes)
+        else:
+            contents = await read_batch_uploads(files)
+            uploads = [(file.filename, file.content_type, content) for file, content in zip(files, contents)]
+            items = batch_items_from_files(manifest, uploads)
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch: {e}")
+
+    # A batch takes one admission slot for as long as it streams, and its items share the
+    # process-wide OCR and LLM budgets with the interactive requests
+    admitted = AsyncExitStack()
+    try:
+        limits = await admitted.enter_async_context(admission.admit())
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Server is busy, please try again later: {e}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    async def result_lines():
+        async for result in verify_batch(client, items, processing='ocr', mode=mode, limits=limits):
+            yield json.dumps(result) + "\n"
+
+    return AdmittedStreamingResponse(result_lines(), admitted, media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=202, summary="Queue a document verification job")
+async def create_job(
+    file: UploadFile = File(...),
+    first_name: str = Form(...),
+    last_name: str = Form(...),
+    street_name: str = Form(...),
+    street_number: str = Form(...),
+    postal_code: str = Form(...),
+    city: str = Form(...),
+    mode: Optional[str] = Form(None),
+    callback_url: Optional[str] = Form(None),
+):
+    """
+    Queue the verification of a KYC document and return immediately, instead of holding the
+    connection open through OCR and the LLM calls. The job is processed by a job worker
+    (python -m src.backend.services.job_worker) that reads the same job queue.
+
+    Args:
+        Same as /process_document, plus
+        callback_url (str, optional): URL that receives a POST with the job's id, status, result and
+            error once the job has succeeded or finally failed
+
+    Returns:
+        dict: The 'job_id' to poll at GET /jobs/{job_id}, and the job's 'status' ('queued').
+
+    Raises:
+        HTTPException: If the file type or size, verification mode or callback URL is invalid
+    """
+    if file.content_type not in ["image/jpeg", "image/png"]:
+        raise HTTPException(
+            status_code=400,
+            detail="Unsupported file type. Only JPEG and PNG allowed."
+        )
+    if mode is not None and mode not in VERIFICATION_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported verification mode. Use one of: {', '.join(VERIFICATION_MODES)}."
+        )
+    if callback_url is not None:
+        try:
+            await check_callback_url(callback_url)
+        except UnsafeCallbackURL as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    file_bytes = await read_upload(file)
+    user_data = {
+        "first_name": first_name,
+        "last_name": last_name,
+        "street_name": street_name,
+        "street_number": street_number,
+        "postal_code": postal_code,
+        "city": city,
+    }
+    job_id = await asyncio.to_thread(job_queue.submit, file_bytes, user_data, mode, callback_url)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}", summary="Status and result of a verification job")
+async def get_job(job_id: str):
+    """
+    Returns:
+        dict: The job's 'id', 'status' ('queued', 'running', 'succeeded' or 'failed'), 'attempts',
+            'result' (is_verified, mode and the verification message, once succeeded), 'error'
+            (of the last failed attempt), 'callback_status' and creation/update timestamps.
+
+    Raises:
+        HTTPException: If there is no job with this id (or it was purged after JOB_RETENTION)
+    """
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@app.get("/stats", summary="Runtime statistics of the processing pipeline")
+async def stats():
+    """
+    Report utilisation of the shared processing resources.
+
+    Returns:
+        dict: Statistics per resource, e.g. busy OCR workers, queue length and p50/p95 OCR task time,
+            hit/miss counters of the extraction cache, the share of comparisons escalated to the LLM,
+            per-mode verification counts and latency, the number of jobs per status, and admitted,
+            waiting and rejected requests of the admission control.
+    """
+    return {
+        "ocr_pool": ocr_pool.stats(),
+        "extraction_cache": extraction_cache.stats(),
+        "comparator": comparator_stats(),
+        "verification": verification_stats(),
+        "jobs": await asyncio.to_thread(job_queue.stats),
+        "admission": admission.stats(),
+    }
+
+@app.get("/metrics", summary="Prometheus metrics")
+async def metrics():
+    """
+    Expose the backend's metrics in the Prometheus text format: time per pipeline stage and per
+    verification, stage errors, LLM calls with their latency and token usage, extraction cache
+    lookups, comparator decisions and OCR pool utilisation.
+
+    Returns:
+        Response: The metrics as text/plain (exposition format 0.0.4).
+    """
+    # Collectors take locks and the cache may count its disk entries, so render off the event loop
+    content = await asyncio.to_thread(registry.render)
+    return Response(content, media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Run the API directly with uvicorn if this python file is executed
 if __name__ == '__main__':
     import uvicorn
@@ -0,0 +1,243 @@
+import asyncio
+import io
+import json
+import os
+import posixpath
+import time
+import zipfile
+import zlib
+
+from ...backend.services.verification import verify_document
+from ...backend.utils.preprocessing import check_image_header, ImageTooLarge
+from ...backend.utils.stage_limits import StageLimits
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Maximum number of documents accepted in one batch request.
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+# Maximum size of a single document in a batch (checked before extracting it from a zip archive).
+BATCH_MAX_FILE_BYTES = int(os.getenv("BATCH_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+# Maximum total size of a batch request: the uploaded files or archive, and the documents unpacked from an archive.
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(200 * 1024 * 1024)))
+# Maximum size of the manifest.json of a zip archive, unpacked.
+BATCH_MAX_MANIFEST_BYTES = int(os.getenv("BATCH_MAX_MANIFEST_BYTES", str(5 * 1024 * 1024)))
+
+# User-provided fields every batch item needs
+USER_FIELDS = ("first_name", "last_name", "street_name", "street_number", "postal_code", "city")
+# Name of the manifest inside a zip archive
+MANIFEST_NAME = "manifest.json"
+# Document types accepted in a batch, by file extension (zip entries carry no content type)
+IMAGE_EXTENSIONS = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+# Errors of reading a damaged or unsupported archive entry: CRC or size mismatches, truncated or corrupt
+# data, ZIP64 entries, encrypted entries (RuntimeError) and unknown compression methods (NotImplementedError)
+_ZIP_READ_ERRORS = (
+    zipfile.BadZipFile, zipfile.LargeZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError
+)
+
+
+class BatchTooLarge(ValueError):
+    """Raised when a batch, or an image in it, exceeds BATCH_MAX_BYTES, BATCH_MAX_FILE_BYTES or MAX_IMAGE_PIXELS."""
+
+
+def parse_manifest(manifest, max_items=BATCH_MAX_ITEMS):
+    """
+    Parses the manifest of a batch: a JSON array with one object per document, holding the
+    user-provided fields (see USER_FIELDS), the document's file name under 'file' and an optional
+    caller reference under 'id' that is echoed in the results. `max_items=None` allows any length.
+
+    Raises:
+        ValueError: If the manifest is not valid JSON, is empty or too long, or an entry lacks a field.
+    """
+    try:
+        entries = json.loads(manifest)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Manifest is not valid JSON: {e}")
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("Manifest must be a non-empty JSON array.")
+    if max_items is not None and len(entries) > max_items:
+        raise ValueError(f"Batch has {len(entries)} items, the maximum is {max_items}.")
+    for index, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            raise ValueError(f"Manifest entry {index} must be a JSON object.")
+        missing = [field for field in USER_FIELDS if not isinstance(entry.get(field), str)]
+        if missing:
+            raise ValueError(f"Manifest entry {index} is missing the field(s): {', '.join(missing)}.")
+    return entries
+
+
+def _check_file_name(index, name):
+    if posixpath.splitext(name.lower())[1] not in IMAGE_EXTENSIONS:
+        raise ValueError(f"Item {index} ('{name}'): unsupported file type. Only JPEG and PNG allowed.")
+
+
+def _check_image(name, file_bytes):
+    # Same checks as a single upload: size, and the pixel count from the header before anything is decoded
+    if len(file_bytes) > BATCH_MAX_FILE_BYTES:
+        raise BatchTooLarge(f"File '{name}' exceeds the maximum size of {BATCH_MAX_FILE_BYTES} bytes.")
+    try:
+        check_image_header(file_bytes)
+    except ImageTooLarge as e:
+        raise BatchTooLarge(f"File '{name}': {e}")
+    except Exception:
+        raise ValueError(f"File '{name}' is not a readable JPEG or PNG image.")
+
+
+def _make_item(index, entry, name, file_bytes):
+    _check_image(name, file_bytes)
+    return {
+        "index": index,
+        "id": entry.get("id"),
+        "file": name,
+        "file_bytes": file_bytes,
+        "user_data": {field: entry[field] for field in USER_FIELDS},
+    }
+
+
+def batch_items_from_files(manifest, files):
+    """
+    Pairs the manifest entries with uploaded files. An entry refers to its file by name ('file');
+    if no entry names a file, entries and files are paired by position.
+
+    Args:
+        manifest (str): The manifest, see parse_manifest.
+        files (list): (file name, content type, file bytes) per uploaded file, in upload order.
+
+    Returns:
+        list: The batch items, in manifest order.
+
+    Raises:
+        ValueError: If the manifest and the files don't match or a file is not a readable JPEG or PNG.
+        BatchTooLarge: If a file or its image is too large.
+    """
+    entries = parse_manifest(manifest)
+    for name, content_type, file_bytes in files:
+        if content_type not in IMAGE_EXTENSIONS.values():
+            raise ValueError(f"File '{name}': unsupported file type. Only JPEG and PNG allowed.")
+
+    if not any("file" in entry for entry in entries):
+        if len(entries) != len(files):
+            raise ValueError(f"Manifest has {len(entries)} entries but {len(files)} files were uploaded.")
+        return [_make_item(index, entry, name, file_bytes)
+                for index, (entry, (name, _, file_bytes)) in enumerate(zip(entries, files))]
+
+    by_name = {name: file_bytes for name, _, file_bytes in files}
+    items = []
+    for index, entry in enumerate(entries):
+        name = entry.get("file")
+        if name not in by_name:
+            raise ValueError(f"Manifest entry {index} refers to '{name}', which was not uploaded.")
+        items.append(_make_item(index, entry, name, by_name[name]))
+    return items
+
+
+def batch_items_from_zip(archive_bytes):
+    """
+    Reads a batch from a zip archive holding the documents and a manifest.json (see parse_manifest),
+    whose entries name their document by its path inside the archive.
+
+    Returns:
+        list: The batch items, in manifest order.
+
+    Raises:
+        ValueError: If the archive is invalid or damaged, lacks the manifest, or a document is missing
+            or not a readable JPEG or PNG.
+        BatchTooLarge: If the manifest, a document, its image or all documents together are too large.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(archive_bytes))
+    except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+        raise ValueError(f"Invalid zip archive: {e}")
+    with archive:
+        try:
+            manifest_info = archive.getinfo(MANIFEST_NAME)
+        except KeyError:
+            raise ValueError(f"Zip archive has no {MANIFEST_NAME}.")
+        if manifest_info.file_size > BATCH_MAX_MANIFEST_BYTES:
+            raise BatchTooLarge(f"{MANIFEST_NAME} exceeds the maximum size of {BATCH_MAX_MANIFEST_BYTES} bytes.")
+        entries = parse_manifest(_read_entry(archive, manifest_info))
+        items = []
+        total_bytes = 0
+        for index, entry in enumerate(entries):
+            name = entry.get("file")
+            if not isinstance(name, str):
+                raise ValueError(f"Manifest entry {index} must name its document under 'file'.")
+            _check_file_name(index, name)
+            try:
+                info = archive.getinfo(name)
+            except KeyError:
+                raise ValueError(f"Manifest entry {index} refers to '{name}', which is not in the archive.")
+            # The declared size is checked before decompressing, so an archive can't expand unboundedly
+            if info.file_size > BATCH_MAX_FILE_BYTES:
+                raise BatchTooLarge(f"File '{name}' exceeds the maximum size of {BATCH_MAX_FILE_BYTES} bytes.")
+            total_bytes += info.file_size
+            if total_bytes > BATCH_MAX_BYTES:
+                raise BatchTooLarge(f"The documents of the archive exceed the maximum of {BATCH_MAX_BYTES} bytes.")
+            items.append(_make_item(index, entry, name, _read_entry(archive, info)))
+    return items
+
+
+def _read_entry(archive, info):
+    # zipfile stops at the declared size and checks the CRC, so a lying header fails here instead of expanding
+    try:
+        return archive.read(info)
+    except _ZIP_READ_ERRORS as e:
+        raise ValueError(f"Can't read '{info.filename}' from the zip archive: {e}")
+
+
+async def _verify_item(client, item, processing, mode, limits):
+    start = time.perf_counter()
+    result = {"index": item["index"], "id": item["id"], "file": item["file"]}
+    try:
+        verification = await verify_document(
+            client=client,
+            file_bytes=item.pop("file_bytes"),
+            user_data=item["user_data"],
+            processing=processing,
+            mode=mode,
+            limits=limits,
+        )
+        result.update(is_verified=verification["is_verified"], mode=verification["mode"], error=None)
+    except Exception as e:
+        result.update(is_verified=None, mode=mode, error=f"Error processing document: {e}")
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+async def verify_batch(client, items, processing='ocr', mode=None, limits=None):
+    """
+    Verifies all items of a batch concurrently and yields one result per item as soon as it is done,
+    so results arrive in completion order, not in manifest order. The number of items in the image
+    stage and in LLM calls is capped separately by a StageLimits with the BATCH_OCR_CONCURRENCY and
+    BATCH_LLM_CONCURRENCY defaults, nested in the shared `limits` (e.g. those of admission control)
+    if given. A failing item yields an error result and does not affect the others.
+
+    Yields:
+        dict: Per item its 'index' in the manifest, 'id', 'file', 'is_verified' (None on error), 'mode',
+            'error' and 'seconds'; finally a summary with the number of 'items', 'verified' and 'errors'
+            and the total 'seconds'.
+    """
+    limits = StageLimits(parent=limits)
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(_verify_item(client, item, processing, mode, limits)) for item in items]
+    verified = errors = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            verified += int(bool(result["is_verified"]))
+            errors += int(result["error"] is not None)
+            yield result
+    finally:
+        # The client may disconnect mid-stream; don't keep processing items nobody will receive
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    yield {
+        "summary": True,
+        "items": len(items),
+        "verified": verified,
+        "errors": errors,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
@@ -0,0 +1,340 @@
+"""
+Offline verification runner for bulk backfills (e.g. nightly re-verification of existing customers)
+on the OpenAI Batch API, which processes requests within a 24h window at about half the price of
+interactive calls.
+
+The documents and user data come from a manifest in the format of POST /process_documents/batch,
+whose 'file' paths are relative to the manifest. The runner
+1. builds the extraction prompts (OCR text or image, see ocr_img_processing/llm_img_processing)
+   locally and submits them as one batch; documents whose header extraction lacks required fields
+   are resubmitted with the full page, as in process_document_image,
+2. compares the extractions locally and submits only the ambiguous comparisons as a second batch,
+3. joins the answers back to the documents by custom id and writes one JSON line per document.
+Prompts are built a chunk at a time and written to the batch input files on disk as they are
+built, so at most one chunk of documents (base64 pages in 'llm' mode) is held in memory. Complete
+extractions are also stored in the extraction cache, so later interactive requests for the same
+document skip OCR and the LLM.
+
+    python -m src.backend.services.batch_runner --manifest customers.json --output results.jsonl
+
+Set OPENAI_BASE_URL to run against a stub server instead (see src/mock_llm/main.py).
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from ...backend.services.batch import parse_manifest, USER_FIELDS
+from ...backend.services.document_processor import (
+    EXTRACTION_JSON_SCHEMA, EXTRACTION_MODELS,
+    build_extraction_messages, extraction_regions, extraction_version, has_required_fields
+)
+from ...backend.utils.comparators import (
+    COMPARATOR_MODE, COMPARISON_JSON_SCHEMA, COMPARISON_MODEL,
+    build_comparison_messages, match_identity_locally, to_compared_fields
+)
+from ...backend.utils.extraction_cache import extraction_cache, make_cache_key
+from ...backend.utils.openai_client import get_async_openai_client
+from ...backend.utils.stage_limits import StageLimits
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds between two status checks of a submitted batch.
+BATCH_API_POLL_INTERVAL = float(os.getenv("BATCH_API_POLL_INTERVAL", "30"))
+# Limits of a single batch input file; larger workloads are split into several batches.
+BATCH_API_MAX_REQUESTS = int(os.getenv("BATCH_API_MAX_REQUESTS", "50000"))
+BATCH_API_MAX_FILE_BYTES = int(os.getenv("BATCH_API_MAX_FILE_BYTES", str(190 * 1024 * 1024)))
+
+BATCH_API_ENDPOINT = "/v1/chat/completions"
+BATCH_API_COMPLETION_WINDOW = "24h"
+# Extraction prompts built at a time before they are written to the input files
+_PROMPT_CHUNK_SIZE = 64
+# Statuses after which a batch does not change anymore
+FINAL_BATCH_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+def chat_request(custom_id, model, messages, json_schema, **kwargs):
+    """
+    Returns:
+        dict: One line of a batch input file: a chat completion with a JSON schema response format.
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_API_ENDPOINT,
+        "body": {
+            "model": model,
+            "messages": messages,
+            "response_format": {"type": "json_schema", "json_schema": json_schema},
+            **kwargs,
+        },
+    }
+
+
+async def write_input_files(requests, directory, max_requests=BATCH_API_MAX_REQUESTS, max_bytes=BATCH_API_MAX_FILE_BYTES):
+    """
+    Serializes the requests (a list or an async iterator) as JSONL into batch input files in
+    `directory`, one request at a time, starting a new file whenever the API limits would be exceeded.
+
+    Returns:
+        tuple: The paths of the input files and the custom ids of the requests.
+    """
+    paths, custom_ids = [], []
+    f, count, size = None, 0, 0
+
+    async def each(requests):
+        if hasattr(requests, "__aiter__"):
+            async for request in requests:
+                yield request
+        else:
+            for request in requests:
+                yield request
+
+    try:
+        async for request in each(requests):
+            line = (json.dumps(request) + "\n").encode()
+            if f is None or count >= max_requests or size + len(line) > max_bytes:
+                if f is not None:
+                    f.close()
+                paths.append(os.path.join(directory, f"batch_input_{len(paths)}.jsonl"))
+                f, count, size = open(paths[-1], "wb"), 0, 0
+            f.write(line)
+            count += 1
+            size += len(line)
+            custom_ids.append(request["custom_id"])
+    finally:
+        if f is not None:
+            f.close()
+    return paths, custom_ids
+
+
+async def submit_batch(client, path, description):
+    """
+    Uploads a batch input file and creates the batch.
+
+    Returns:
+        str: The id of the batch.
+    """
+    with open(path, "rb") as f:
+        input_file = await client.files.create(file=(os.path.basename(path), f), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_API_ENDPOINT,
+        completion_window=BATCH_API_COMPLETION_WINDOW,
+        metadata={"description": description},
+    )
+    return batch.id
+
+
+async def wait_for_batch(client, batch_id, poll_interval=BATCH_API_POLL_INTERVAL):
+    """
+    Polls the batch until it reaches a final status.
+
+    Returns:
+        Batch: The final state of the batch.
+    """
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        if batch.status in FINAL_BATCH_STATUSES:
+            return batch
+        await asyncio.sleep(poll_interval)
+
+
+async def download_results(client, batch):
+    """
+    Reads the output and error files of a finished batch.
+
+    Returns:
+        dict: Per custom id either {'content': parsed JSON answer} or {'error': message}.
+    """
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        response = await client.files.content(file_id)
+        for line in filter(None, response.text.splitlines()):
+            line = json.loads(line)
+            response_body = (line.get("response") or {}).get("body")
+            if line.get("error") or not response_body or line["response"].get("status_code") != 200:
+                error = line.get("error") or (response_body or {}).get("error") or "no response"
+                results[line["custom_id"]] = {"error": f"Batch request failed: {error}"}
+                continue
+            try:
+                content = json.loads(response_body["choices"][0]["message"]["content"])
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                results[line["custom_id"]] = {"error": f"Invalid answer: {e}"}
+            else:
+                results[line["custom_id"]] = {"content": content}
+    return results
+
+
+async def run_batches(client, requests, description, poll_interval=BATCH_API_POLL_INTERVAL):
+    """
+    Submits the requests (a list or an async iterator, split into as many batches as needed), waits
+    for all batches and joins their results.
+
+    Returns:
+        dict: Per custom id of `requests` either {'content': parsed JSON answer} or {'error': message}.
+    """
+    with tempfile.TemporaryDirectory(prefix="kyc-batch-") as directory:
+        paths, custom_ids = await write_input_files(requests, directory)
+        if not paths:
+            return {}
+        batch_ids = [await submit_batch(client, path, description) for path in paths]
+    batches = await asyncio.gather(*(wait_for_batch(client, batch_id, poll_interval) for batch_id in batch_ids))
+
+    results = {}
+    for batch in batches:
+        results.update(await download_results(client, batch))
+    # Requests of failed, expired or cancelled batches have no line in any result file
+    statuses = ", ".join(sorted({batch.status for batch in batches}))
+    for custom_id in custom_ids:
+        results.setdefault(custom_id, {"error": f"Request was not processed (batch status: {statuses})"})
+    return results
+
+
+def load_items(manifest_path):
+    """
+    Reads a manifest (see batch.parse_manifest) whose 'file' entries are paths relative to it.
+    Documents are only referenced here and read when their prompt is built.
+
+    Returns:
+        list: The items with 'index', 'id', 'file', 'path' and 'user_data'.
+    """
+    with open(manifest_path) as f:
+        entries = parse_manifest(f.read(), max_items=None)
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    items = []
+    for index, entry in enumerate(entries):
+        if not isinstance(entry.get("file"), str):
+            raise ValueError(f"Manifest entry {index} must name its document under 'file'.")
+        items.append({
+            "index": index,
+            "id": entry.get("id"),
+            "file": entry["file"],
+            "path": os.path.join(base, entry["file"]),
+            "user_data": {field: entry[field] for field in USER_FIELDS},
+        })
+    return items
+
+
+async def _extraction_request(item, processing, region, limits):
+    """Builds the extraction request of an item, or records why it could not be built."""
+    try:
+        with open(item["path"], "rb") as f:
+            file_bytes = f.read()
+        item["cache_key"] = make_cache_key(file_bytes, processing, EXTRACTION_MODELS[processing], extraction_version(processing))
+        messages = await build_extraction_messages(None, file_bytes, processing, region, limits)
+    except Exception as e:
+        item["error"] = f"Error processing document: {e}"
+        return None
+    return chat_request(
+        f"{item['index']}:extract:{region}", EXTRACTION_MODELS[processing], messages, EXTRACTION_JSON_SCHEMA
+    )
+
+
+async def _extraction_requests(items, processing, region, limits):
+    """Yields the extraction requests of the items, building _PROMPT_CHUNK_SIZE prompts at a time."""
+    for start in range(0, len(items), _PROMPT_CHUNK_SIZE):
+        chunk = items[start:start + _PROMPT_CHUNK_SIZE]
+        for request in await asyncio.gather(*(_extraction_request(item, processing, region, limits) for item in chunk)):
+            if request is not None:
+                yield request
+
+
+async def run_backfill(client, items, processing='ocr', cache=extraction_cache, poll_interval=BATCH_API_POLL_INTERVAL):
+    """
+    Verifies the items through the Batch API, see the module docstring.
+
+    Returns:
+        list: Per item its 'index', 'id', 'file', 'is_verified' (None on error), 'extracted_data'
+            and 'error', in manifest order.
+    """
+    if processing not in EXTRACTION_MODELS:
+        raise Exception("processing parameter must either be 'ocr' or 'llm'. ")
+    limits = StageLimits()
+    for item in items:
+        item.update(extracted_data=None, is_verified=None, error=None)
+
+    # Phase 1: extraction, header first and the full page for documents with missing fields
+    pending = items
+    for region in extraction_regions():
+        requests = _extraction_requests(pending, processing, region, limits)
+        results = await run_batches(client, requests, f"kyc extraction ({region})", poll_interval)
+        retry = []
+        for item in pending:
+            result = results.get(f"{item['index']}:extract:{region}")
+            if result is None:
+                continue
+            if "error" in result:
+                # A failed full-page retry keeps the header extraction
+                if item["extracted_data"] is None:
+                    item["error"] = result["error"]
+                continue
+            item["extracted_data"] = result["content"]
+            if not has_required_fields(result["content"]):
+                retry.append(item)
+        pending = retry
+
+    extracted = [item for item in items if item["extracted_data"] is not None]
+    if cache is not None:
+        # A header extraction whose full-page retry failed lacks fields; cached, it would keep
+        # process_document_image from running its own full-page fallback
+        for item in extracted:
+            if has_required_fields(item["extracted_data"]):
+                await asyncio.to_thread(cache.set, item["cache_key"], item["extracted_data"])
+
+    # Phase 2: local comparison; only ambiguous cases go to the LLM
+    requests = []
+    for item in extracted:
+        compared_fields = to_compared_fields(item["extracted_data"])
+        decision = None
+        if COMPARATOR_MODE == "tiered":
+            decision, _ = match_identity_locally(item["user_data"], compared_fields)
+        if decision is not None:
+            item["is_verified"] = decision
+            continue
+        messages = build_comparison_messages(item["user_data"], compared_fields)
+        requests.append(chat_request(
+            f"{item['index']}:compare", COMPARISON_MODEL, messages, COMPARISON_JSON_SCHEMA, temperature=0.0
+        ))
+    results = await run_batches(client, requests, "kyc comparison", poll_interval)
+    for item in extracted:
+        result = results.get(f"{item['index']}:compare")
+        if result is None:
+            continue
+        if "error" in result:
+            item["error"] = result["error"]
+        else:
+            item["is_verified"] = bool(result["content"].get("is_verified", False))
+
+    return [
+        {key: item[key] for key in ("index", "id", "file", "is_verified", "extracted_data", "error")}
+        for item in items
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Verify many documents offline through the OpenAI Batch API.")
+    parser.add_argument("--manifest", required=True, help="JSON manifest; 'file' paths are relative to it")
+    parser.add_argument("--output", required=True, help="JSONL file that receives one result per document")
+    parser.add_argument("--processing", choices=sorted(EXTRACTION_MODELS), default="ocr")
+    parser.add_argument("--poll-interval", type=float, default=BATCH_API_POLL_INTERVAL, help="Seconds between status checks")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = asyncio.run(run_backfill(
+        get_async_openai_client(), load_items(args.manifest), args.processing, poll_interval=args.poll_interval
+    ))
+    with open(args.output, "w") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+    verified = sum(1 for result in results if result["is_verified"])
+    errors = sum(1 for result in results if result["error"])
+    print(f"{len(results)} documents: {verified} verified, {len(results) - verified - errors} not verified, "
+          f"{errors} errors in {time.perf_counter() - start:.0f}s")
@@ -1,12 +1,26 @@
+import asyncio
+import hashlib
 import io
 import json
 import os
 from PIL import Image, ImageFilter, ImageEnhance
 import pytesseract
-from openai import OpenAI
 import base64
-from ...backend.utils.llm_img_processing import llm_img_processing
-from ...backend.utils.ocr_img_processing import ocr_img_processing
+from ...backend.utils.llm_img_processing import llm_img_processing, prepare_vision_page
+from ...backend.utils.ocr_img_processing import ocr_img_processing, prepare_ocr_page
+from ...backend.utils.debug_sink import debug_sink
+from ...backend.utils.extraction_cache import extraction_cache, make_cache_key
+from ...backend.utils.openai_client import (
+    create_chat_completion, get_async_openai_client, DeadlineExceeded, OPENAI_EXTRACTION_DEADLINE
+)
+from ...backend.utils.layout import DOCUMENT_REGION, HEADER_FRACTION
+from ...backend.utils.ocr_pool import OCR_BACKEND, OCR_LANG
+from ...backend.utils.preprocessing import (
+    OCR_PREPROCESSING, DESKEW_MAX_ANGLE, OCR_TARGET_DPI, OCR_MAX_LONG_EDGE, VISION_SHORT_SIDE
+)
+from ...backend.utils.stage_limits import stage_slot
+from ...backend.utils.timing import stage
+from ...backend.utils.comparators import COMPARED_FIELDS, COMPARISON_RULES
 
 from dotenv import load_dotenv
 
@@ -15,10 +29,207 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
     raise Exception("OPENAI_API_KEY environment variable not set.")
 
-def process_document_image(
+# Model used for the structured extraction, per processing mode
+EXTRACTION_MODELS = {
+    'ocr': 'gpt-4o-mini',
+    'llm': 'gpt-4o',
+}
+# Version of the extraction prompts and schema. Bump it whenever they change, so cached extractions
+# produced by the previous prompts are not served anymore. Changes of the image pipeline's settings
+# are picked up by extraction_version without a bump.
+PROMPT_VERSION = "1"
+
+# Structured-output schema of the extraction call
+EXTRACTION_JSON_SCHEMA = {
+    "name": "refined_document_schema",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "extracted_first_name": {
+                "description": "The first name extracted from the document",
+                "type": "string"
+            },
+            "extracted_last_name": {
+                "description": "The last name extracted from the document",
+                "type": "string"
+            },
+            "extracted_client_street_name": {
+                "description": "The street name extracted from the document",
+                "type": "string"
+            },
+            "extracted_client_street_number": {
+                "description": "The street number extracted from the document",
+                "type": "string"
+            },
+            "extracted_client_postal_code": {
+                "description": "The postal code extracted from the document",
+                "type": "string"
+            },
+            "extracted_client_city": {
+                "description": "The city extracted from the document",
+                "type": "string"
+            },
+            "extracted_bank_street_name": {
+                "description": "The street name extracted from the document",
+                "type": "string"
+            },
+            "extracted_bank_street_number": {
+                "description": "The street number extracted from the document",
+                "type": "string"
+            },
+            "extracted_bank_postal_code": {
+                "description": "The postal code extracted from the document",
+                "type": "string"
+            },
+            "extracted_bank_city": {
+                "description": "The city extracted from the document",
+                "type": "string"
+            },
+            "document_date": {
+                "description": "The date of the document",
+                "type": "string"
+            }
+        },
+        "additionalProperties": False
+    }
+}
+
+# Fields that must not be empty for an extraction to be usable (plus city or postal code)
+REQUIRED_FIELDS = ("extracted_first_name", "extracted_last_name", "extracted_client_street_name")
+
+# Structured-output schema of the single-call mode: the extracted fields plus a match verdict per field
+VERIFICATION_JSON_SCHEMA = {
+    "name": "extract_and_verify_schema",
+    "schema": {
+        "type": "object",
+        "properties": {
+            **EXTRACTION_JSON_SCHEMA["schema"]["properties"],
+            "field_matches": {
+                "description": "Whether each user-provided field matches the corresponding client field of the document",
+                "type": "object",
+                "properties": {
+                    field: {"type": "boolean"} for field in COMPARED_FIELDS
+                },
+                "required": list(COMPARED_FIELDS),
+                "additionalProperties": False
+            },
+            "is_verified": {
+                "description": "True if the user data and the extracted client data refer to the same identity",
+                "type": "boolean"
+            }
+        },
+        "required": ["field_matches", "is_verified"],
+        "additionalProperties": False
+    }
+}
+
+def has_required_fields(extracted_data):
+    """
+    Checks whether an extraction contains everything the identity comparison needs:
+    first and last name, street name, and either city or postal code.
+    """
+    return all(extracted_data.get(key) for key in REQUIRED_FIELDS) and bool(
+        extracted_data.get("extracted_client_city") or extracted_data.get("extracted_client_postal_code")
+    )
+
+def extraction_regions(region=None):
+    """
+    Returns:
+        list: The page regions to try in order; header extraction falls back to the full page.
+    """
+    region = region or DOCUMENT_REGION
+    return ['header', 'full'] if region == 'header' else ['full']
+
+def extraction_version(processing, region=None):
+    """
+    Returns:
+        str: PROMPT_VERSION plus a digest of the settings that shape the extraction in `processing`
+            mode (preprocessing, OCR backend and language, downscaling, regions), the version part
+            of make_cache_key. Changing any of them invalidates the cached extractions.
+    """
+    settings = {"regions": extraction_regions(region), "header_fraction": HEADER_FRACTION}
+    if processing == 'ocr':
+        settings.update(
+            preprocessing=OCR_PREPROCESSING, deskew_max_angle=DESKEW_MAX_ANGLE, backend=OCR_BACKEND,
+            lang=OCR_LANG, target_dpi=OCR_TARGET_DPI, max_long_edge=OCR_MAX_LONG_EDGE,
+        )
+    else:
+        settings.update(vision_short_side=VISION_SHORT_SIDE)
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+    return f"{PROMPT_VERSION}-{digest}"
+
+async def prepare_page(file_bytes, processing, limits=None, debug=None):
+    """
+    Decodes (and for OCR, preprocesses) the page in a worker thread, once per document, so the
+    header attempt and the full-page fallback share it. Holds an 'ocr' slot of `limits` while doing so, if given.
+    Intermediate images go to `debug`, the request's debug capture, if given.
+
+    Returns:
+        PIL.Image.Image: The page, to pass to build_extraction_messages.
+    """
+    if processing == 'ocr':
+        prepare = prepare_ocr_page
+    elif processing == 'llm':
+        prepare = prepare_vision_page
+    else:
+        raise Exception("processing parameter must either be 'ocr' or 'llm'. ")
+    async with stage_slot(limits, 'ocr'):
+        return await asyncio.to_thread(prepare, file_bytes, debug=debug)
+
+async def build_extraction_messages(client, file_bytes, processing, region='full', limits=None, page=None,
+                                    debug=None):
+    """
+    Runs the image processing of the given mode in a worker thread and returns the prompt messages
+    for the extraction call. Holds an 'ocr' slot of `limits` while doing so, if given.
+    With a `page` from prepare_page, the page is cropped and OCR'd (or encoded) without decoding it again.
+    Pass the `debug` capture given to prepare_page, so all images of a request end up in one capture.
+    """
+    if processing == 'ocr':
+        image_processing = ocr_img_processing
+    elif processing == 'llm':
+        image_processing = llm_img_processing
+    else:
+        raise Exception("processing parameter must either be 'ocr' or 'llm'. ")
+    async with stage_slot(limits, 'ocr'):
+        return await asyncio.to_thread(image_processing, client, file_bytes, region=region, page=page, debug=debug)
+
+async def request_structured_output(client, model, messages, json_schema, limits=None, **kwargs):
+    """
+    Sends a chat completion with a JSON schema response format and parses the JSON answer.
+    Holds an 'llm' slot of `limits` while the call is in flight, if given. The call may take at most
+    OPENAI_EXTRACTION_DEADLINE seconds, otherwise DeadlineExceeded is raised.
+    """
+    try:
+        async with stage_slot(limits, 'llm'):
+            with stage("llm"):
+                completion = await create_chat_completion(
+                        client,
+                        deadline=OPENAI_EXTRACTION_DEADLINE,
+                        model=model,
+                        messages=messages,
+                        response_format={
+                            "type": "json_schema",
+                            "json_schema": json_schema
+                        },
+                        **kwargs
+                    )
+        response_content = completion.choices[0].message.content
+
+        # parse the JSON output from the LLM
+        return json.loads(response_content)
+
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise Exception(f"Error during LLM processing: {e}")
+
+async def process_document_image(
         client,
         file_bytes,
-        processing
+        processing,
+        cache=extraction_cache,
+        region=None,
+        limits=None
 ):
     """
     Processes a document image to extract the person's name, address, document date. 
@@ -29,93 +240,120 @@ def process_document_image(
     - processing='llm':
         1. directly applies multimodal LLM capabilities to read the document and extract the required information
 
+    With region='header' (the default, see DOCUMENT_REGION), only the header of the page is processed,
+    where name, addresses and date usually are. If required fields come back empty, the full page is
+    processed instead. The page is decoded and preprocessed only once for both attempts.
+
+    The CPU-bound image work (PIL/Tesseract) runs in a worker thread and the LLM call is awaited
+    (on a worker thread as well if `client` is a sync OpenAI client), so the event loop stays free
+    to serve other requests while this one is in flight.
+
+    Results are cached in `cache` (pass None to bypass it), keyed by the image content, processing mode,
+    model, prompt version and image pipeline settings (see extraction_version), so a retried upload of the same document skips OCR and the LLM call.
+
     Returns:
         dict: A dictionary containing:
             - 'extracted_name': The name extracted from the document.
             - 'extracted_address': The address extracted from the document.
             - 'document_date': The document date extracted.
     """
-    if processing == 'ocr':
-        messages = ocr_img_processing(client, file_bytes)
-    elif processing == 'llm':
-        messages = llm_img_processing(client, file_bytes)
-    else:
+    if processing not in EXTRACTION_MODELS:
         raise Exception("processing parameter must either be 'ocr' or 'llm'. ")
 
-    json_schema = {
-        "name": "refined_document_schema",
-        "schema": {
-            "type": "object",
-            "properties": {
-                "extracted_first_name": {
-                    "description": "The first name extracted from the document",
-                    "type": "string"
-                },
-                "extracted_last_name": {
-                    "description": "The last name extracted from the document",
-                    "type": "string"
-                },
-                "extracted_client_street_name": {
-                    "description": "The street name extracted from the document",
-                    "type": "string"
-                },
-                "extracted_client_street_number": {
-                    "description": "The street number extracted from the document",
-                    "type": "string"
-                },
-                "extracted_client_postal_code": {
-                    "description": "The postal code extracted from the document",
-                    "type": "string"
-                },
-                "extracted_client_city": {
-                    "description": "The city extracted from the document",
-                    "type": "string"
-                },
-                "extracted_bank_street_name": {
-                    "description": "The street name extracted from the document",
-                    "type": "string"
-                },
-                "extracted_bank_street_number": {
-                    "description": "The street number extracted from the document",
-                    "type": "string"
-                },
-                "extracted_bank_postal_code": {
-                    "description": "The postal code extracted from the document",
-                    "type": "string"
-                },
-                "extracted_bank_city": {
-                    "description": "The city extracted from the document",
-                    "type": "string"
-                },
-                "document_date": {
-                    "description": "The date of the document",
-                    "type": "string"
-                }
-            },
-            "additionalProperties": False
-        }
-    }
-    
-    try:
-        completion = client.chat.completions.create(
-                model='gpt-4o-mini' if processing=='ocr' else 'gpt-4o',
-                messages=messages,
-                response_format={
-                    "type": "json_schema",
-                    "json_schema": json_schema
-                }
-                #temperature=0.0 #low temperature for deterministic output, which is needed here
-            )
-        response_content = completion.choices[0].message.content
+    model = EXTRACTION_MODELS[processing]
+    if cache is not None:
+        cache_key = make_cache_key(file_bytes, processing, model, extraction_version(processing, region))
+        cached_data = await asyncio.to_thread(cache.get, cache_key)
+        if cached_data is not None:
+            return cached_data
 
-        # Step 6: parse the JSON output from the LLM
-        extracted_data = json.loads(response_content)
+    # One debug capture per request, for the page and every region attempt
+    debug = debug_sink.sample(processing)
+    page = await prepare_page(file_bytes, processing, limits, debug)
+    for region in extraction_regions(region):
+        messages = await build_extraction_messages(client, file_bytes, processing, region, limits, page, debug)
+        extracted_data = await request_structured_output(client, model, messages, EXTRACTION_JSON_SCHEMA, limits)
+        if has_required_fields(extracted_data):
+            break
 
-    except Exception as e:
-        raise Exception(f"Error during LLM processing: {e}")
+    if cache is not None:
+        await asyncio.to_thread(cache.set, cache_key, extracted_data)
     
     return extracted_data
 
+async def process_and_compare_document_image(
+        client,
+        file_bytes,
+        processing,
+        user_data,
+        cache=extraction_cache,
+        region=None,
+        limits=None
+):
+    """
+    Single-call variant of process_document_image followed by compare_identity: the user-provided
+    fields are sent together with the OCR text or image in one structured-output call, which returns
+    the extracted fields and the per-field match verdict at once. Header-first processing with a
+    full-page fallback works as in process_document_image.
+
+    Args:
+        user_data (dict): User-provided 'first_name', 'last_name', 'street_name', 'street_number',
+            'postal_code' and 'city'.
+
+    Returns:
+        dict: The extracted fields (see process_document_image) plus
+            - 'field_matches': A boolean per compared field.
+            - 'is_verified': Whether the document matches the user's identity.
+    """
+    if processing not in EXTRACTION_MODELS:
+        raise Exception("processing parameter must either be 'ocr' or 'llm'. ")
+
+    # Results of this mode are conditioned on the user's input, so they are cached per document and
+    # user data: a different user uploading the same file never gets an extraction steered by someone
+    # else's claims. The verdict and field matches are cached with the extraction, so a retry gets
+    # the same decision the single call made, whether or not it hits the cache.
+    model = EXTRACTION_MODELS[processing]
+    if cache is not None:
+        user_digest = hashlib.sha256(json.dumps(user_data, sort_keys=True).encode()).hexdigest()[:16]
+        cache_key = make_cache_key(
+            file_bytes, f"{processing}+verdict:{user_digest}", model, extraction_version(processing, region)
+        )
+        cached_result = await asyncio.to_thread(cache.get, cache_key)
+        if cached_result is not None:
+            return cached_result
+
+    # One debug capture per request, for the page and every region attempt
+    debug = debug_sink.sample(processing)
+    page = await prepare_page(file_bytes, processing, limits, debug)
+    for region in extraction_regions(region):
+        messages = await build_extraction_messages(client, file_bytes, processing, region, limits, page, debug)
+        messages.append(build_verification_message(user_data))
+        result = await request_structured_output(
+            client, model, messages, VERIFICATION_JSON_SCHEMA, limits, temperature=0.0
+        )
+        if has_required_fields(result):
+            break
+
+    if cache is not None:
+        await asyncio.to_thread(cache.set, cache_key, result)
+
+    return result
+
+def build_verification_message(user_data):
+    """
+    Returns:
+        dict: The message that asks the extraction call to also compare the user-provided data.
+    """
+    return {
+        "role": "user",
+        "content": (
+            "In addition, compare the client details you extracted with the following user-provided data "
+            "and decide for each field whether it refers to the same value, and whether both refer to the same identity. "
+            f"{COMPARISON_RULES}\n\n"
+            f"User Data: {json.dumps(user_data)}"
+        )
+    }
+
 
 # Conditional block that only runs when the file is executed directly, not when it is imported as a module
 if __name__ == '__main__':
@@ -123,8 +361,8 @@ if __name__ == '__main__':
 
     with open(sample_image_path, 'rb') as f:
         file_bytes = f.read()
-    client = OpenAI(api_key=openai_api_key)
+    client = get_async_openai_client()
 
-    result = process_document_image(client, file_bytes, processing='llm')
+    result = asyncio.run(process_document_image(client, file_bytes, processing='llm'))
     print("Extracted Data:")
     print(result)
\ No newline at end of file
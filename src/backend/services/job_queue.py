@@ -0,0 +1,234 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Path of the SQLite database holding the job queue. API and worker processes must share it.
+# Defaults to the repository's data directory, wherever the process is started from.
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "data", "jobs.db"
+)
+# Seconds a worker may hold a job before it is considered dead and the job is handed to another worker.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+# Attempts per job, including the first one, before it is marked as failed.
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Seconds before a failed attempt is retried; doubled with every further attempt.
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))
+# Seconds finished jobs are kept, so their status can still be fetched.
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 86400)))
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+# Finished jobs are purged once every this many submissions, to keep submissions cheap
+_PURGE_INTERVAL = 100
+
+
+class JobQueue:
+    """
+    Durable job queue in a local SQLite database, so the API can accept work without waiting for it
+    and no external broker is needed.
+
+    - The API `submit`s jobs and reads their status with `get`.
+    - Worker processes `claim` the oldest due job. A claim is a lease: if the worker dies, the job
+      becomes claimable again after `lease_seconds` and counts as a failed attempt.
+    - Failed attempts are retried with exponential backoff until `max_attempts` is reached.
+    - Uploaded files and user data are deleted from the database as soon as a job is finished.
+    Jobs survive restarts of both tiers; the database runs in WAL mode so readers don't block writers.
+    """
+
+    def __init__(self, db_path=JOB_QUEUE_DB, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS,
+                 retry_delay=JOB_RETRY_DELAY, retention=JOB_RETENTION):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retention = retention
+        self._db = None
+        self._lock = threading.Lock()
+        self._submissions = 0
+
+    def _connect(self):
+        # Opened lazily, so importing this module never creates the database file
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, file BLOB, user_data TEXT, mode TEXT, "
+                "callback_url TEXT, callback_status TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "result TEXT, error TEXT, worker TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+                "available_at REAL NOT NULL, lease_expires_at REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status_available_at ON jobs (status, available_at)")
+            self._db = db
+        return self._db
+
+    def submit(self, file_bytes, user_data, mode=None, callback_url=None):
+        """
+        Stores a new verification job.
+
+        Returns:
+            str: The id of the job.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT INTO jobs (id, status, file, user_data, mode, callback_url, callback_status, "
+                "created_at, updated_at, available_at) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, file_bytes, json.dumps(user_data), mode, callback_url,
+                 'pending' if callback_url else None, now, now, now)
+            )
+            self._submissions += 1
+            if self._submissions % _PURGE_INTERVAL == 0:
+                self._purge(now)
+        return job_id
+
+    def get(self, job_id):
+        """
+        Returns:
+            dict or None: The job's 'id', 'status', 'attempts', 'result', 'error', 'callback_status',
+                'created_at' and 'updated_at', or None if there is no such job.
+        """
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT id, status, attempts, result, error, callback_status, created_at, updated_at "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, status, attempts, result, error, callback_status, created_at, updated_at = row
+        return {
+            "id": job_id,
+            "status": status,
+            "attempts": attempts,
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "callback_status": callback_status,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def fail_expired(self):
+        """
+        Marks jobs whose lease expired with no attempts left as failed.
+
+        Returns:
+            list: (id, callback URL) of the failed jobs that have a callback to deliver.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._connect().execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker lease expired', file = NULL, user_data = NULL, "
+                "lease_expires_at = NULL, updated_at = ? "
+                "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ? "
+                "RETURNING id, callback_url",
+                (now, now, self.max_attempts)
+            ).fetchall()
+        return [(job_id, callback_url) for job_id, callback_url in rows if callback_url]
+
+    def claim(self, worker):
+        """
+        Leases the oldest due job to `worker`: a queued one, or one whose lease expired with attempts
+        left. Jobs expired with no attempts left are left to fail_expired.
+
+        Returns:
+            dict or None: The job's 'id', 'file_bytes', 'user_data', 'mode', 'callback_url' and
+                'attempts' (including this one), or None if no job is due.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connect().execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_expires_at = ?, "
+                "updated_at = ? WHERE id = ("
+                "SELECT id FROM jobs WHERE (status = 'queued' AND available_at <= ?) "
+                "OR (status = 'running' AND lease_expires_at < ? AND attempts < ?) ORDER BY available_at LIMIT 1) "
+                "RETURNING id, file, user_data, mode, callback_url, attempts",
+                (worker, now + self.lease_seconds, now, now, now, self.max_attempts)
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, file_bytes, user_data, mode, callback_url, attempts = row
+        return {
+            "id": job_id,
+            "file_bytes": file_bytes,
+            "user_data": json.loads(user_data),
+            "mode": mode,
+            "callback_url": callback_url,
+            "attempts": attempts,
+        }
+
+    def complete(self, job_id, worker, result):
+        """
+        Stores the result of a job leased to `worker` and drops its inputs.
+
+        Returns:
+            bool: False if the lease was lost in the meantime (the job belongs to another worker now).
+        """
+        with self._lock:
+            cursor = self._connect().execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, file = NULL, user_data = NULL, "
+                "lease_expires_at = NULL, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (json.dumps(result), time.time(), job_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker, error):
+        """
+        Records a failed attempt of a job leased to `worker`. The job is queued again with exponential
+        backoff while it has attempts left, otherwise it is marked as failed.
+
+        Returns:
+            str or None: The job's new status, or None if the lease was lost in the meantime.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connect().execute(
+                "UPDATE jobs SET "
+                "status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+                "file = CASE WHEN attempts < ? THEN file END, "
+                "user_data = CASE WHEN attempts < ? THEN user_data END, "
+                "available_at = ? + ? * (1 << (attempts - 1)), "
+                "error = ?, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running' RETURNING status",
+                (self.max_attempts, self.max_attempts, self.max_attempts, now, self.retry_delay,
+                 error, now, job_id, worker)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def set_callback_status(self, job_id, callback_status):
+        with self._lock:
+            self._connect().execute(
+                "UPDATE jobs SET callback_status = ? WHERE id = ?", (callback_status, job_id)
+            )
+
+    def _purge(self, now):
+        self._db.execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+            (now - self.retention,)
+        )
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number of jobs per status and the age in seconds of the oldest queued job.
+        """
+        with self._lock:
+            db = self._connect()
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = db.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        stats = {status: counts.get(status, 0) for status in JOB_STATUSES}
+        stats["oldest_queued_seconds"] = time.time() - oldest if oldest is not None else None
+        return stats
+
+
+# Shared queue of the API and the job workers
+job_queue = JobQueue()
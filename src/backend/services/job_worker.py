@@ -0,0 +1,181 @@
+"""
+Worker process for the asynchronous job API: pulls verification jobs from the SQLite job queue,
+runs them and notifies the job's callback URL, if any. Scale the processing tier by running more
+workers against the same JOB_QUEUE_DB, independently of the API. Every worker process has its own
+OCR pool, so size OCR_POOL_WORKERS per process.
+
+    python -m src.backend.services.job_worker --processes 2 --concurrency 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import signal
+import socket
+
+import httpx
+
+from ...backend.services.job_queue import job_queue
+from ...backend.services.verification import verify_document
+from ...backend.utils.callback_urls import check_callback_url, pinned_request, UnsafeCallbackURL
+from ...backend.utils.ocr_pool import ocr_pool
+from ...backend.utils.openai_client import get_async_openai_client, close_openai_clients
+from ...backend.utils.stage_limits import StageLimits
+from ...common.tracing import span
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Jobs processed at the same time by one worker process.
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+# Seconds an idle worker waits before polling the queue again.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+# Timeout in seconds and number of attempts for delivering a callback.
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+JOB_CALLBACK_ATTEMPTS = int(os.getenv("JOB_CALLBACK_ATTEMPTS", "3"))
+
+VERIFIED_MESSAGE = "Thank you very much. You have been verified successfully."
+FAILED_MESSAGE = "Verification failed, please try again."
+
+
+async def send_callback(http_client, callback_url, payload):
+    """
+    POSTs the job status to the callback URL, retrying with exponential backoff on errors and 5xx answers.
+    The URL is checked before every attempt (see check_callback_url), the request goes to the address
+    that passed the check, and redirects are not followed, so a callback can't be pointed at internal services.
+
+    Returns:
+        bool: Whether the callback was delivered (answered with a 2xx status).
+    """
+    for attempt in range(JOB_CALLBACK_ATTEMPTS):
+        try:
+            address = await check_callback_url(callback_url)
+        except UnsafeCallbackURL:
+            return False
+        try:
+            response = await http_client.post(
+                **pinned_request(callback_url, address), json=payload, timeout=JOB_CALLBACK_TIMEOUT
+            )
+            if response.is_success:
+                return True
+            if response.status_code < 500:
+                return False
+        except httpx.HTTPError:
+            pass
+        if attempt + 1 < JOB_CALLBACK_ATTEMPTS:
+            await asyncio.sleep(2 ** attempt + random.random())
+    return False
+
+
+async def process_job(client, http_client, job, worker, limits):
+    """
+    Runs one claimed job, stores its outcome and sends the callback once the job is finished.
+    """
+    try:
+        # The job's stages and LLM calls form one trace
+        with span("job", service="worker", job_id=job["id"]):
+            verification = await verify_document(
+                client=client,
+                file_bytes=job["file_bytes"],
+                user_data=job["user_data"],
+                processing='ocr',
+                mode=job["mode"],
+                limits=limits,
+            )
+    except Exception as e:
+        status = await asyncio.to_thread(
+            job_queue.fail, job["id"], worker, f"Error processing document: {e}"
+        )
+    else:
+        is_verified = verification["is_verified"]
+        result = {
+            "is_verified": is_verified,
+            "mode": verification["mode"],
+            "message": VERIFIED_MESSAGE if is_verified else FAILED_MESSAGE,
+        }
+        completed = await asyncio.to_thread(job_queue.complete, job["id"], worker, result)
+        status = 'succeeded' if completed else None
+
+    # Retried jobs and jobs whose lease was lost are reported by whichever attempt finishes them
+    if job["callback_url"] and status in ('succeeded', 'failed'):
+        await deliver_callback(http_client, job["id"], job["callback_url"])
+
+
+async def deliver_callback(http_client, job_id, callback_url):
+    """
+    Sends the status of a finished job to its callback URL and records whether that worked.
+    """
+    job_status = await asyncio.to_thread(job_queue.get, job_id)
+    payload = {key: job_status[key] for key in ("id", "status", "result", "error")}
+    delivered = await send_callback(http_client, callback_url, payload)
+    await asyncio.to_thread(job_queue.set_callback_status, job_id, 'delivered' if delivered else 'failed')
+
+
+async def run_worker(concurrency=JOB_WORKER_CONCURRENCY, stop=None):
+    """
+    Claims and processes up to `concurrency` jobs at a time until `stop` is set.
+    Running jobs are finished before returning.
+    """
+    stop = stop or asyncio.Event()
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    client = get_async_openai_client()
+    limits = StageLimits()
+    running = set()
+
+    async with httpx.AsyncClient() as http_client:
+        while not stop.is_set():
+            job = None
+            if len(running) < concurrency:
+                # Jobs whose worker died on their last attempt are failed here, and their callbacks sent
+                for job_id, callback_url in await asyncio.to_thread(job_queue.fail_expired):
+                    task = asyncio.create_task(deliver_callback(http_client, job_id, callback_url))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+                job = await asyncio.to_thread(job_queue.claim, worker)
+            if job is not None:
+                task = asyncio.create_task(process_job(client, http_client, job, worker, limits))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                continue
+            # Nothing to claim or no free slot: wait for a job to finish, the poll interval or the stop signal
+            waiters = {asyncio.create_task(stop.wait()), *running}
+            await asyncio.wait(waiters, timeout=JOB_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in waiters - running:
+                waiter.cancel()
+        if running:
+            await asyncio.wait(running)
+
+    await close_openai_clients()
+
+
+def _run_process(concurrency):
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        await run_worker(concurrency, stop)
+
+    try:
+        asyncio.run(main())
+    finally:
+        ocr_pool.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Process verification jobs from the job queue.")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to start")
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY, help="Jobs per process at a time")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        _run_process(args.concurrency)
+    else:
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=_run_process, args=(args.concurrency,)) for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+from ...backend.services.document_processor import process_document_image, process_and_compare_document_image
+from ...backend.utils.comparators import compare_identity_data, to_compared_fields
+from ...backend.utils.metrics import Counter, Histogram
+from ...backend.utils.timing import stage
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How a verification is carried out:
+# - 'two_call': extraction call, then the (tiered) comparison in compare_identity
+# - 'single_call': one structured-output call that extracts the fields and compares them with the user's input
+VERIFICATION_MODES = ('two_call', 'single_call')
+VERIFICATION_MODE = os.getenv("VERIFICATION_MODE", "two_call")
+
+# Per-mode counters, so both flows can be compared side by side (A/B)
+_stats_lock = threading.Lock()
+_stats = {mode: {"requests": 0, "verified": 0, "total_seconds": 0.0} for mode in VERIFICATION_MODES}
+
+verifications = Counter("kyc_verifications_total", "Verifications by mode, processing and result.",
+                        ["mode", "processing", "result"])
+verification_seconds = Histogram("kyc_verification_seconds", "End-to-end time of a verification.",
+                                 ["mode", "processing"])
+
+
+async def verify_document(client, file_bytes, user_data, processing='ocr', mode=None, limits=None):
+    """
+    Verifies a user's identity against an uploaded bank statement.
+
+    Args:
+        client: OpenAI client (sync or async) used for the LLM calls.
+        file_bytes (bytes): The uploaded document image.
+        user_data (dict): User-provided 'first_name', 'last_name', 'street_name', 'street_number',
+            'postal_code' and 'city'.
+        processing (str): 'ocr' or 'llm', see process_document_image.
+        mode (str): 'two_call' or 'single_call'; defaults to VERIFICATION_MODE.
+        limits (StageLimits, optional): Concurrency limits for the image stage and the LLM calls.
+
+    Returns:
+        dict: A dictionary containing:
+            - 'extracted_data': The fields extracted from the document.
+            - 'field_matches': A boolean per compared field (single-call mode only, else None).
+            - 'is_verified': Whether the document matches the user's identity.
+            - 'mode': The verification mode that was used.
+    """
+    mode = mode or VERIFICATION_MODE
+    if mode not in VERIFICATION_MODES:
+        raise ValueError(f"mode must be one of {', '.join(VERIFICATION_MODES)}.")
+
+    start = time.perf_counter()
+    try:
+        if mode == 'single_call':
+            result = await process_and_compare_document_image(
+                client, file_bytes, processing, user_data, limits=limits
+            )
+            field_matches = result.pop("field_matches")
+            is_verified = result.pop("is_verified")
+            extracted_data = result
+        else:
+            extracted_data = await process_document_image(
+                client=client, file_bytes=file_bytes, processing=processing, limits=limits
+            )
+            with stage("compare"):
+                is_verified = await compare_identity_data(
+                    user_data, to_compared_fields(extracted_data), client=client, limits=limits
+                )
+            field_matches = None
+    except Exception:
+        verifications.inc(mode=mode, processing=processing, result="error")
+        raise
+    duration = time.perf_counter() - start
+
+    with _stats_lock:
+        _stats[mode]["requests"] += 1
+        _stats[mode]["verified"] += int(is_verified)
+        _stats[mode]["total_seconds"] += duration
+    verifications.inc(mode=mode, processing=processing, result="verified" if is_verified else "rejected")
+    verification_seconds.observe(duration, mode=mode, processing=processing)
+
+    return {
+        "extracted_data": extracted_data,
+        "field_matches": field_matches,
+        "is_verified": is_verified,
+        "mode": mode,
+    }
+
+
+def verification_stats():
+    """
+    Returns:
+        dict: Number of verifications, verification rate and mean latency (in seconds) per mode.
+    """
+    with _stats_lock:
+        stats = {}
+        for mode, counters in _stats.items():
+            requests = counters["requests"]
+            stats[mode] = {
+                "requests": requests,
+                "verified_rate": counters["verified"] / requests if requests else None,
+                "mean_seconds": counters["total_seconds"] / requests if requests else None,
+            }
+    stats["default_mode"] = VERIFICATION_MODE
+    return stats
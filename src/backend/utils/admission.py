@@ -0,0 +1,155 @@
+import asyncio
+import contextlib
+import math
+import os
+import time
+
+from ...backend.utils.metrics import registry
+from ...backend.utils.ocr_pool import OCR_POOL_WORKERS
+from ...backend.utils.stage_limits import StageLimits
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Verifications that may run in the pipeline at the same time; further requests wait for a free slot.
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+# Requests that may wait for a slot. Beyond that, requests are rejected right away with a 429.
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+# Seconds a request may wait for a slot before it is rejected with a 503.
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# Budgets of the two stages among the admitted verifications: requests in the image stage
+# (decoding, preprocessing, OCR) and requests waiting on an LLM call.
+ADMISSION_OCR_SLOTS = int(os.getenv("ADMISSION_OCR_SLOTS", str(max(OCR_POOL_WORKERS, 1))))
+ADMISSION_LLM_SLOTS = int(os.getenv("ADMISSION_LLM_SLOTS", "16"))
+
+# Bounds of the Retry-After estimate, in seconds
+_MIN_RETRY_AFTER = 1
+_MAX_RETRY_AFTER = 60
+# Weight of the latest verification in the moving average of the service time
+_EWMA_WEIGHT = 0.1
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is not admitted: status_code 429 if the wait queue is full, 503 if the
+    request waited ADMISSION_QUEUE_TIMEOUT seconds without getting a slot.
+    `retry_after` is the number of seconds after which a retry has a fair chance.
+    """
+
+    def __init__(self, message, status_code, retry_after):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limiter in front of the verification pipeline. At most `max_concurrency` requests are
+    admitted at a time and at most `max_queue` wait for admission, so a traffic spike is turned away
+    quickly instead of piling up work on Tesseract and OpenAI. Admitted requests share the OCR and LLM
+    stage budgets of `limits`.
+    """
+
+    def __init__(self, max_concurrency=ADMISSION_MAX_CONCURRENCY, max_queue=ADMISSION_MAX_QUEUE,
+                 queue_timeout=ADMISSION_QUEUE_TIMEOUT, ocr_slots=ADMISSION_OCR_SLOTS, llm_slots=ADMISSION_LLM_SLOTS):
+        if max_concurrency < 1 or max_queue < 0:
+            raise ValueError("Admission needs at least one slot and a non-negative queue length.")
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.limits = StageLimits(ocr=ocr_slots, llm=llm_slots)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = {"queue_full": 0, "timeout": 0}
+        self._service_time = None
+
+    def retry_after(self):
+        """
+        Returns:
+            int: Seconds until the current backlog has likely been worked off, from the average
+                verification time, the number of waiting requests and the number of slots.
+        """
+        service_time = self._service_time or 1.0
+        estimate = math.ceil(service_time * (self._waiting + 1) / self.max_concurrency)
+        return min(max(estimate, _MIN_RETRY_AFTER), _MAX_RETRY_AFTER)
+
+    @contextlib.asynccontextmanager
+    async def admit(self):
+        """
+        Holds an admission slot for the duration of the block.
+
+        Yields:
+            StageLimits: The shared OCR and LLM budgets, to pass on to verify_document.
+
+        Raises:
+            AdmissionRejected: If the wait queue is full or no slot became free in time.
+        """
+        if self._semaphore.locked():
+            if self._waiting >= self.max_queue:
+                self._rejected["queue_full"] += 1
+                raise AdmissionRejected(
+                    f"{self._waiting} requests are already waiting.", 429, self.retry_after()
+                )
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._rejected["timeout"] += 1
+                raise AdmissionRejected(
+                    f"No verification slot became free within {self.queue_timeout:g} seconds.", 503, self.retry_after()
+                )
+            finally:
+                self._waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self._in_flight += 1
+        self._admitted += 1
+        start = time.perf_counter()
+        try:
+            yield self.limits
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+            duration = time.perf_counter() - start
+            self._service_time = (duration if self._service_time is None
+                                  else (1 - _EWMA_WEIGHT) * self._service_time + _EWMA_WEIGHT * duration)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Admitted and waiting requests, rejection counters and the current Retry-After estimate.
+        """
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "admitted": self._admitted,
+            "rejected_queue_full": self._rejected["queue_full"],
+            "rejected_timeout": self._rejected["timeout"],
+            "ocr_slots": self.limits.limits["ocr"],
+            "llm_slots": self.limits.limits["llm"],
+            "mean_service_seconds": self._service_time,
+            "retry_after": self.retry_after(),
+        }
+
+
+# Shared controller used by /process_document
+admission = AdmissionController()
+
+
+@registry.register_collector
+def _admission_metrics():
+    stats = admission.stats()
+    return [
+        ("kyc_admission_in_flight", "gauge", "Verifications admitted to the pipeline.", [({}, stats["in_flight"])]),
+        ("kyc_admission_waiting", "gauge", "Requests waiting for admission.", [({}, stats["waiting"])]),
+        ("kyc_admission_rejected_total", "counter", "Requests turned away by admission control.", [
+            ({"reason": "queue_full"}, stats["rejected_queue_full"]),
+            ({"reason": "timeout"}, stats["rejected_timeout"]),
+        ]),
+    ]
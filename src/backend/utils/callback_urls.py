@@ -0,0 +1,93 @@
+import asyncio
+import ipaddress
+import os
+import socket
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Comma-separated hosts job callbacks may be sent to, e.g. "hooks.example.com,.partner.example" (a leading
+# dot allows all subdomains). Unset allows any host that resolves to public addresses only.
+JOB_CALLBACK_ALLOWED_HOSTS = [
+    host.strip().lower() for host in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()
+]
+
+
+class UnsafeCallbackURL(ValueError):
+    """Raised for callback URLs that are malformed, not allowed, or point to a private or reserved address."""
+
+
+def _host_allowed(host, allowed_hosts):
+    return any(host == allowed or (allowed.startswith(".") and host.endswith(allowed)) for allowed in allowed_hosts)
+
+
+async def check_callback_url(url, allowed_hosts=None):
+    """
+    Checks that a job callback can't be used to reach internal services (SSRF): the URL must be
+    http(s), and its host must be in JOB_CALLBACK_ALLOWED_HOSTS or, without an allowlist, resolve to
+    public addresses only (no loopback, private, link-local e.g. 169.254.169.254, or reserved ranges).
+    Checked when a job is submitted and again before every delivery, since DNS answers can change.
+    Deliveries go to the returned address (see pinned_request), so a host can't pass the check with
+    a public address and then answer the client's own lookup with an internal one (DNS rebinding).
+
+    Returns:
+        str or None: The checked address the host resolved to, or None for allowlisted hosts, which
+            are trusted and resolved as usual.
+
+    Raises:
+        UnsafeCallbackURL: If the URL may not be called.
+    """
+    allowed_hosts = JOB_CALLBACK_ALLOWED_HOSTS if allowed_hosts is None else allowed_hosts
+    try:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+    except ValueError as e:
+        raise UnsafeCallbackURL(f"Invalid callback URL: {e}")
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise UnsafeCallbackURL("Callback URL must be an http:// or https:// URL.")
+    if parts.username or parts.password:
+        raise UnsafeCallbackURL("Callback URL must not contain credentials.")
+
+    host = parts.hostname.lower()
+    if allowed_hosts:
+        if not _host_allowed(host, allowed_hosts):
+            raise UnsafeCallbackURL(f"Callback host '{host}' is not in JOB_CALLBACK_ALLOWED_HOSTS.")
+        return None
+
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise UnsafeCallbackURL(f"Callback host '{host}' can't be resolved: {e}")
+    checked = []
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%", 1)[0])
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise UnsafeCallbackURL(f"Callback host '{host}' resolves to the non-public address {address}.")
+        checked.append(address)
+    if not checked:
+        raise UnsafeCallbackURL(f"Callback host '{host}' has no addresses.")
+    return str(checked[0])
+
+
+def pinned_request(url, address):
+    """
+    Points a request for `url` at `address` (from check_callback_url) instead of letting the HTTP client
+    resolve the host again. The Host header, and for https the SNI and certificate check, keep the
+    URL's host name.
+
+    Returns:
+        dict: The 'url', 'headers' and 'extensions' arguments for httpx.AsyncClient.post.
+    """
+    if address is None:
+        return {"url": url, "headers": {}, "extensions": {}}
+    url = httpx.URL(url)
+    return {
+        "url": url.copy_with(host=address),
+        "headers": {"Host": url.netloc.decode("ascii")},
+        "extensions": {"sni_hostname": url.host},
+    }
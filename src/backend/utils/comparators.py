@@ -1,15 +1,193 @@
 
+import asyncio
 import json
 import os
-from openai import OpenAI
+import re
+import threading
+import unicodedata
+from difflib import SequenceMatcher
 from dotenv import load_dotenv
+from ...backend.utils.metrics import registry
+from ...backend.utils.openai_client import (
+    create_chat_completion, get_async_openai_client, DeadlineExceeded, OPENAI_COMPARISON_DEADLINE
+)
+from ...backend.utils.stage_limits import stage_slot
+from ...backend.utils.street_suffixes import STREET_SUFFIXES
 
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
     raise Exception("OPENAI_API_KEY environment variable not set.")
 
-def compare_identity(
+# 'tiered' decides clear cases locally and only escalates ambiguous ones to the LLM; 'llm' always asks the LLM.
+COMPARATOR_MODE = os.getenv("COMPARATOR_MODE", "tiered")
+# Local decision thresholds on the weakest required field score (0..1).
+# At or above ACCEPT the identity is verified locally, below REJECT it is rejected locally,
+# anything in between is escalated to the LLM.
+COMPARATOR_ACCEPT_THRESHOLD = float(os.getenv("COMPARATOR_ACCEPT_THRESHOLD", "0.95"))
+COMPARATOR_REJECT_THRESHOLD = float(os.getenv("COMPARATOR_REJECT_THRESHOLD", "0.6"))
+# Fields that must match exactly (after normalization) to verify locally. On long names a one-letter
+# difference still scores above the accept threshold, so near-matches of these go to the LLM.
+EXACT_MATCH_FIELDS = ("first_name", "last_name", "street_number")
+
+# Fields compared between the user's input and the document, and the extraction key each one is read from
+EXTRACTED_FIELD_NAMES = {
+    "first_name": "extracted_first_name",
+    "last_name": "extracted_last_name",
+    "street_name": "extracted_client_street_name",
+    "street_number": "extracted_client_street_number",
+    "postal_code": "extracted_client_postal_code",
+    "city": "extracted_client_city",
+}
+COMPARED_FIELDS = tuple(EXTRACTED_FIELD_NAMES)
+
+# Matching rules shared by every LLM prompt that compares identities
+COMPARISON_RULES = (
+    "Consider that abbreviations such as 'St' and 'Street', 'Ave' and 'Avenue', 'Ct' and 'Court' are equivalent. "
+    "Also consider that either city or postal code need to be the same, as they are equivalent information. This accounts for manual typos."
+)
+
+# Model of the LLM comparison tier and the JSON schema of its response
+COMPARISON_MODEL = "gpt-4o-mini"
+COMPARISON_JSON_SCHEMA = {
+    "name": "comparison_schema",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "is_verified": {
+                "type": "boolean",
+                "description": "True if the user data and extracted data match considering common abbreviations; false otherwise."
+            }
+        },
+        "required": ["is_verified"],
+        "additionalProperties": False
+    }
+}
+
+# Counters of how compare_identity reached its decisions
+_stats_lock = threading.Lock()
+_stats = {
+    "total": 0,
+    "accepted_locally": 0,
+    "rejected_locally": 0,
+    "escalated": 0,
+}
+
+
+@registry.register_collector
+def _comparator_metrics():
+    with _stats_lock:
+        stats = dict(_stats)
+    return [
+        ("kyc_comparator_decisions_total", "counter", "How compare_identity reached its decisions.", [
+            ({"decision": decision}, stats[decision]) for decision in ("accepted_locally", "rejected_locally", "escalated")
+        ]),
+    ]
+
+
+def to_compared_fields(extracted_data):
+    """Maps the output of process_document_image to the field names used for the comparison."""
+    return {field: extracted_data.get(key) for field, key in EXTRACTED_FIELD_NAMES.items()}
+
+
+def normalize_text(value):
+    """
+    Unicode and case normalization: strips accents, case-folds (e.g. 'ß' -> 'ss'),
+    replaces punctuation with spaces and collapses whitespace.
+    """
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(c for c in value if not unicodedata.combining(c)).casefold()
+    value = re.sub(r"[^\w]+", " ", value)
+    return " ".join(value.split())
+
+
+def normalize_street(value):
+    """Normalizes a street name and expands abbreviated suffixes, e.g. 'Coventry Av.' -> 'coventry avenue'."""
+    return " ".join(STREET_SUFFIXES.get(token, token) for token in normalize_text(value).split())
+
+
+def normalize_code(value):
+    """Normalizes street numbers and postal codes, where spacing and punctuation carry no meaning."""
+    return normalize_text(value).replace(" ", "")
+
+
+def similarity(a, b):
+    """
+    Returns:
+        float: 1.0 for identical strings, 0.0 if either is empty, else the difflib similarity ratio.
+    """
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def score_identity(user_data, extracted_data):
+    """
+    Scores how well every field of the user-provided data matches the extracted data.
+
+    Returns:
+        dict: A similarity score between 0 and 1 per field.
+    """
+    normalizers = {
+        "first_name": normalize_text,
+        "last_name": normalize_text,
+        "street_name": normalize_street,
+        "street_number": normalize_code,
+        "postal_code": normalize_code,
+        "city": normalize_text,
+    }
+    return {
+        field: similarity(normalize(user_data.get(field)), normalize(extracted_data.get(field)))
+        for field, normalize in normalizers.items()
+    }
+
+
+def match_identity_locally(user_data, extracted_data):
+    """
+    Deterministic first tier of the identity comparison.
+    Names, street name and street number all have to match, while either city or postal code is enough,
+    as they are equivalent information (this accounts for manual typos). A clear match also needs the
+    EXACT_MATCH_FIELDS to be equal after normalization; near-matches of them are ambiguous.
+
+    Returns:
+        tuple: The decision (True for a clear match, False for a clear mismatch, None if ambiguous)
+            and the per-field scores.
+    """
+    scores = score_identity(user_data, extracted_data)
+    weakest = min(
+        scores["first_name"],
+        scores["last_name"],
+        scores["street_name"],
+        scores["street_number"],
+        max(scores["city"], scores["postal_code"]),
+    )
+    if weakest >= COMPARATOR_ACCEPT_THRESHOLD and all(scores[field] == 1.0 for field in EXACT_MATCH_FIELDS):
+        return True, scores
+    if weakest < COMPARATOR_REJECT_THRESHOLD:
+        return False, scores
+    return None, scores
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats["total"] += 1
+        _stats[outcome] += 1
+
+
+def comparator_stats():
+    """
+    Returns:
+        dict: Decision counters of compare_identity and the fraction of comparisons escalated to the LLM.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["mode"] = COMPARATOR_MODE
+    stats["escalation_rate"] = stats["escalated"] / stats["total"] if stats["total"] else None
+    return stats
+
+async def compare_identity(
     # User-provided data:
     user_first_name: str,
     user_last_name: str,
@@ -24,10 +202,18 @@ def compare_identity(
     extracted_client_street_number: str,
     extracted_client_postal_code: str,
     extracted_client_city: str,
+    # OpenAI client (sync or async) used for escalated comparisons; defaults to the shared pooled client
+    client=None,
 ) -> bool:
     """
-    Uses OpenAI's API to compare user-provided identity and address details with the extracted details.
-    The prompt instructs the model to consider common abbreviations (e.g., "St" vs. "Street") as equivalent.
+    Compares user-provided identity and address details with the extracted details in two tiers:
+    1. A local, deterministic matcher (see match_identity_locally) decides clear matches and mismatches.
+    2. Only borderline cases are escalated to OpenAI's API. The prompt instructs the model to consider
+       common abbreviations (e.g., "St" vs. "Street") as equivalent.
+    With COMPARATOR_MODE='llm' every comparison goes to the LLM.
+
+    Escalated comparisons use the injected `client` (e.g. the one the API already created),
+    or the shared connection-pooled client if none is given.
     
     Returns:
         bool: True if the model determines that the data match (i.e. identity is verified), otherwise False.
@@ -50,15 +236,21 @@ def compare_identity(
         "city": extracted_client_city,
     }
 
-    # Prepare the messages for the chat completion
-    messages = [
+    return await compare_identity_data(user_data, extracted_data, client=client)
+
+
+def build_comparison_messages(user_data, extracted_data):
+    """
+    Returns:
+        list: The prompt messages of the LLM comparison tier.
+    """
+    return [
         {
             "role": "developer",
             "content": (
                 "You are a highly accurate identity verification assistant. "
                 "Compare two sets of personal data (user-provided and extracted from a bank statement) and determine if they refer to the same identity. "
-                "Consider that abbreviations such as 'St' and 'Street', 'Ave' and 'Avenue', 'Ct' and 'Court' are equivalent. "
-                "Also consider that either city or postal code need to be the same, as they are equivalent information. This accounts for manual typos. "
+                f"{COMPARISON_RULES} "
                 "Return your answer as a JSON object with a single boolean field 'is_verified', which is true if the data match and false otherwise."
             )
         },
@@ -68,50 +260,55 @@ def compare_identity(
         }
     ]
 
-    # Define the expected JSON schema for the response
-    json_schema = {
-        "name": "comparison_schema",
-        "schema": {
-            "type": "object",
-            "properties": {
-                "is_verified": {
-                    "type": "boolean",
-                    "description": "True if the user data and extracted data match considering common abbreviations; false otherwise."
-                }
-            },
-            "required": ["is_verified"],
-            "additionalProperties": False
-        }
-    }
 
-    # Ensure that the OpenAI API key is set
-    # openai_api_key = os.getenv("OPENAI_API_KEY")
-    # if not openai_api_key:
-    #     raise Exception("OPENAI_API_KEY environment variable not set.")
-    # openai.api_key = openai_api_key
+async def compare_identity_data(user_data, extracted_data, client=None, limits=None):
+    """
+    Same as compare_identity, but takes both sides as dicts keyed by COMPARED_FIELDS.
+    An escalated comparison holds an 'llm' slot of `limits` (see stage_limits.StageLimits) if given.
+
+    Returns:
+        bool: True if the identity is verified, otherwise False.
+    """
+    # Tier 1: decide clear cases locally, without an LLM round trip
+    if COMPARATOR_MODE == "tiered":
+        decision, _ = match_identity_locally(user_data, extracted_data)
+        if decision is not None:
+            _count("accepted_locally" if decision else "rejected_locally")
+            return decision
+    _count("escalated")
+
+    # Tier 2: ask the LLM
+    messages = build_comparison_messages(user_data, extracted_data)
 
-    client = OpenAI(api_key=openai_api_key)
+    # Reuse the shared client (and its open connections) unless one was injected
+    if client is None:
+        client = get_async_openai_client()
 
     try:
         # Call the OpenAI ChatCompletion API with the JSON schema response format.
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",  # Adjust the model name as needed
-            messages=messages,
-            temperature=0.0,  # Low temperature for deterministic output
-            response_format={
-                "type": "json_schema",
-                "json_schema": json_schema
-            }
-        )
+        async with stage_slot(limits, 'llm'):
+            completion = await create_chat_completion(
+                client,
+                deadline=OPENAI_COMPARISON_DEADLINE,
+                model=COMPARISON_MODEL,
+                messages=messages,
+                temperature=0.0,  # Low temperature for deterministic output
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": COMPARISON_JSON_SCHEMA
+                }
+            )
         response_content = completion.choices[0].message.content
         result = json.loads(response_content)
         return result.get("is_verified", False)
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         raise Exception(f"Error during identity comparison: {e}")
 
 if __name__ == '__main__':
     # Example test case
-    is_verified = compare_identity(
+    is_verified = asyncio.run(compare_identity(
         user_first_name='John',
         user_last_name='Smith',
         user_street_name='Coventry Avenue',
@@ -124,5 +321,5 @@ if __name__ == '__main__':
         extracted_client_street_number='2450',
         extracted_client_postal_code='78521',
         extracted_client_city='Brownsville',
-    )
+    ))
     print(is_verified)
@@ -0,0 +1,116 @@
+import os
+import queue
+import random
+import threading
+import uuid
+from collections import deque
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Directory that receives intermediate images of sampled requests. Unset disables the sink.
+DEBUG_SINK_DIR = os.getenv("DEBUG_SINK_DIR")
+# Fraction of requests whose intermediate images are written (0..1).
+DEBUG_SINK_SAMPLE_RATE = float(os.getenv("DEBUG_SINK_SAMPLE_RATE", "0.01"))
+# Maximum number of files kept in the directory; the oldest ones are deleted beyond that.
+DEBUG_SINK_MAX_FILES = int(os.getenv("DEBUG_SINK_MAX_FILES", "500"))
+# Maximum number of images waiting to be written; further images are dropped instead of piling up.
+DEBUG_SINK_QUEUE_SIZE = int(os.getenv("DEBUG_SINK_QUEUE_SIZE", "32"))
+
+
+class _NullCapture:
+    """Capture of a request that was not sampled: every call is a no-op."""
+    active = False
+
+    def add(self, stage, image):
+        pass
+
+
+class _Capture:
+    active = True
+
+    def __init__(self, sink, label):
+        self._sink = sink
+        self._prefix = f"{uuid.uuid4().hex[:12]}_{label}"
+        self._index = 0
+
+    def add(self, stage, image):
+        """Queues a copy of `image` to be written as the next intermediate stage of this request."""
+        self._index += 1
+        self._sink._enqueue(f"{self._prefix}_{self._index:02d}_{stage}.png", image.copy())
+
+
+class DebugSink:
+    """
+    Opt-in sink for intermediate preprocessing images (original, enhanced, binarized, ...).
+    Only a sampled fraction of requests is captured; images are written by a background thread,
+    so the request path never waits on disk I/O, and the directory is capped at `max_files` files.
+    """
+
+    def __init__(self, directory=DEBUG_SINK_DIR, sample_rate=DEBUG_SINK_SAMPLE_RATE,
+                 max_files=DEBUG_SINK_MAX_FILES, queue_size=DEBUG_SINK_QUEUE_SIZE):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._files = deque()
+        self._writer = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.directory) and self.sample_rate > 0
+
+    def sample(self, label):
+        """
+        Decides whether the current request is captured.
+
+        Returns:
+            A capture object whose `add(stage, image)` records intermediate images
+            (a no-op if the sink is disabled or the request was not sampled).
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            return _NullCapture()
+        self._ensure_writer()
+        return _Capture(self, label)
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is None:
+                os.makedirs(self.directory, exist_ok=True)
+                # Files left by earlier runs count towards the limit as well, oldest first
+                existing = sorted(
+                    (os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".png")),
+                    key=os.path.getmtime
+                )
+                self._files.extend(existing)
+                self._writer = threading.Thread(target=self._write_loop, name="debug-sink", daemon=True)
+                self._writer.start()
+
+    def _enqueue(self, filename, image):
+        try:
+            self._queue.put_nowait((filename, image))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            filename, image = self._queue.get()
+            path = os.path.join(self.directory, filename)
+            try:
+                image.save(path, format="PNG")
+            except Exception:
+                self.dropped += 1
+                continue
+            self._files.append(path)
+            while len(self._files) > self.max_files:
+                try:
+                    os.remove(self._files.popleft())
+                except OSError:
+                    pass
+
+
+# Shared sink used by the image preprocessing steps
+debug_sink = DebugSink()
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from ...backend.utils.metrics import registry
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Number of extractions kept in memory. 0 disables the cache.
+EXTRACTION_CACHE_SIZE = int(os.getenv("EXTRACTION_CACHE_SIZE", "256"))
+# Path of the optional on-disk SQLite tier. Unset keeps the cache in memory only.
+EXTRACTION_CACHE_DB = os.getenv("EXTRACTION_CACHE_DB")
+# Seconds after which a cached extraction expires, in both tiers.
+EXTRACTION_CACHE_TTL = float(os.getenv("EXTRACTION_CACHE_TTL", "86400"))
+# Maximum number of rows in the SQLite tier; the least recently used rows are evicted beyond that.
+EXTRACTION_CACHE_DB_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_DB_MAX_ENTRIES", "10000"))
+
+# The SQLite tier is pruned once every this many writes, to keep writes cheap
+_EVICTION_INTERVAL = 100
+
+
+def make_cache_key(file_bytes, processing, model, prompt_version):
+    """
+    Builds a content-addressed key: the same image processed the same way always maps to the same key,
+    while a different processing mode, model or prompt version invalidates earlier results.
+    """
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    return f"{digest}:{processing}:{model}:{prompt_version}"
+
+
+class ExtractionCache:
+    """
+    Two-tier cache for structured extraction results.
+    - Memory tier: LRU of at most `max_entries` results.
+    - Disk tier (optional): SQLite database at `db_path`, which survives restarts and is shared
+      between worker processes. Pruned by TTL and to at most `max_db_entries` rows.
+    Both tiers drop entries older than `ttl` seconds.
+    """
+
+    def __init__(self, max_entries=EXTRACTION_CACHE_SIZE, db_path=EXTRACTION_CACHE_DB,
+                 ttl=EXTRACTION_CACHE_TTL, max_db_entries=EXTRACTION_CACHE_DB_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_db_entries = max_db_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._hits_memory = 0
+        self._hits_disk = 0
+        self._misses = 0
+
+        self._db = None
+        if db_path and max_entries > 0:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS extractions_accessed_at ON extractions (accessed_at)")
+            self._evict_disk()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, key):
+        """
+        Returns:
+            dict or None: The cached extraction, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._hits_memory += 1
+                    return json.loads(value)
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM extractions WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    value, created_at = row
+                    self._db.execute("UPDATE extractions SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._store_memory(key, created_at, value)
+                    self._hits_disk += 1
+                    return json.loads(value)
+
+            self._misses += 1
+            return None
+
+    def set(self, key, extracted_data):
+        if not self.enabled:
+            return
+        now = time.time()
+        value = json.dumps(extracted_data)
+
+        with self._lock:
+            self._store_memory(key, now, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extractions (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now)
+                )
+                self._db.commit()
+                self._writes += 1
+                if self._writes % _EVICTION_INTERVAL == 0:
+                    self._evict_disk()
+
+    def _store_memory(self, key, created_at, value):
+        # Values are stored serialized, so callers can't mutate cached results
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        self._db.execute("DELETE FROM extractions WHERE created_at <= ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM extractions WHERE key IN ("
+            "SELECT key FROM extractions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_db_entries,)
+        )
+        self._db.commit()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters per tier and the current number of cached entries.
+        """
+        with self._lock:
+            hits = self._hits_memory + self._hits_disk
+            lookups = hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries_memory": len(self._memory),
+                "entries_disk": (self._db.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+                                 if self._db is not None else None),
+                "hits_memory": self._hits_memory,
+                "hits_disk": self._hits_disk,
+                "misses": self._misses,
+                "hit_rate": hits / lookups if lookups else None,
+            }
+
+
+# Shared cache used by process_document_image
+extraction_cache = ExtractionCache()
+
+
+@registry.register_collector
+def _extraction_cache_metrics():
+    stats = extraction_cache.stats()
+    return [
+        ("kyc_extraction_cache_lookups_total", "counter", "Extraction cache lookups by result.", [
+            ({"result": "hit_memory"}, stats["hits_memory"]),
+            ({"result": "hit_disk"}, stats["hits_disk"]),
+            ({"result": "miss"}, stats["misses"]),
+        ]),
+        ("kyc_extraction_cache_entries", "gauge", "Cached extractions per tier.", [
+            ({"tier": tier}, stats[f"entries_{tier}"]) for tier in ("memory", "disk") if stats[f"entries_{tier}"] is not None
+        ]),
+    ]
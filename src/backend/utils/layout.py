@@ -0,0 +1,72 @@
+import os
+
+import numpy as np
+
+from ...backend.utils.preprocessing import grayscale, otsu_threshold, to_array
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Part of the page sent for extraction: 'header' (the text blocks at the top of the page, with a
+# full-page fallback when required fields come back empty) or 'full'.
+DOCUMENT_REGION = os.getenv("DOCUMENT_REGION", "header")
+# Text blocks starting within this top fraction of the page belong to the header.
+HEADER_FRACTION = float(os.getenv("HEADER_FRACTION", "0.4"))
+
+# Width the page is reduced to for the layout analysis; line positions are scaled back afterwards
+_ANALYSIS_WIDTH = 600
+# Rows with less ink than this fraction of the page width count as blank (specks, scan noise)
+_MIN_ROW_INK = 0.005
+# Margin kept around the header crop, as a fraction of the page height
+_MARGIN = 0.01
+
+
+def find_text_lines(image):
+    """
+    Cheap layout analysis: binarizes a reduced copy of the page and projects the ink onto the
+    vertical axis. Runs of inked rows are text lines (or lines of a table); blank runs separate them.
+
+    Returns:
+        list: (top, bottom) pixel rows of every text line in the original image, top to bottom.
+    """
+    factor = max(1, image.width // _ANALYSIS_WIDTH)
+    small = image.reduce(factor) if factor > 1 else image
+    gray = grayscale(to_array(small))
+    ink = gray <= otsu_threshold(gray)
+
+    inked_rows = ink.sum(axis=1) > max(1, _MIN_ROW_INK * ink.shape[1])
+    # Start/end indices of consecutive runs of inked rows
+    edges = np.diff(np.concatenate(([0], inked_rows.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    scale = image.height / ink.shape[0]
+    return [(int(top * scale), int(np.ceil(bottom * scale))) for top, bottom in zip(starts, ends)]
+
+
+def header_box(image):
+    """
+    The header runs from the first text line down to HEADER_FRACTION of the page height. The cut is
+    moved to the end of the text line it would otherwise go through, so no line is split.
+
+    Returns:
+        tuple or None: The (left, top, right, bottom) box of the header region,
+            or None if the page has no text lines.
+    """
+    height = image.height
+    lines = find_text_lines(image)
+    if not lines:
+        return None
+    cut = int(HEADER_FRACTION * height)
+    for top, bottom in lines:
+        if top <= cut < bottom:
+            cut = bottom
+            break
+    margin = int(_MARGIN * height)
+    return 0, max(0, lines[0][0] - margin), image.width, min(height, cut + margin)
+
+
+def crop_to_header(image):
+    """Crops the page to its header region, or returns it unchanged if none was found."""
+    box = header_box(image)
+    return image.crop(box) if box else image
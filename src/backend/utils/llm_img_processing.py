@@ -5,24 +5,63 @@ from PIL import Image, ImageFilter, ImageEnhance
 import pytesseract
 from openai import OpenAI
 import base64
+from ...backend.utils.debug_sink import debug_sink
+from ...backend.utils.preprocessing import open_image, vision_target_size
+from ...backend.utils.layout import crop_to_header
+from ...backend.utils.timing import stage
 
-def llm_img_processing(client, file_bytes):
+def prepare_vision_page(file_bytes, downscale=True, debug=None):
+    """
+    Decodes the page for the vision model. Done once per document, so a header attempt and its
+    full-page fallback share the work.
+    With `downscale`, the image is decoded at the resolution the vision model actually uses
+    (see VISION_SHORT_SIDE), which keeps the base64 payload small.
+
+    Returns:
+        PIL.Image.Image: The decoded page.
+    """
+    if debug is None:
+        debug = debug_sink.sample("llm")
+    try:
+        with stage("decode"):
+            image = open_image(file_bytes, vision_target_size if downscale else None)
+            image.load()
+    except Exception as e:
+        raise Exception(f"Error opening image: {e}")
+    debug.add("original", image)
+    return image
+
+
+def llm_img_processing(client, file_bytes, downscale=True, region='full', page=None, debug=None):
     """
     Called to process an image by directly taking an image as an input and passing it to a multimodal llm, 
     followed by extracting relevant information in JSON format using an LLM.
+    Preprocessing has no side effects; intermediate images of sampled requests go to the debug sink.
+    With region='header', only the header region of the page (name, addresses, date) is sent.
+    `page` is the output of prepare_vision_page, if the page was already decoded.
+    `debug` is the request's debug capture, if it was already sampled (e.g. for prepare_vision_page).
     """
+    if debug is None:
+        debug = debug_sink.sample("llm")
 
+    if page is None:
+        page = prepare_vision_page(file_bytes, downscale, debug)
+    image = page
     try: 
-        image = Image.open(io.BytesIO(file_bytes))
-        image = image.convert("RGB")
-        image = image.filter(ImageFilter.SHARPEN)
-        image = ImageEnhance.Contrast(image).enhance(7)
-        image.show()
-
-        # Convert image to JPEG bytes
-        buffer = io.BytesIO()
-        image.save(buffer, format="JPEG")
-        file_bytes = base64.b64encode(buffer.getvalue()).decode("utf-8")
+        with stage("preprocess"):
+            if region == 'header':
+                image = crop_to_header(image)
+                debug.add("header", image)
+            image = image.convert("RGB")
+            image = image.filter(ImageFilter.SHARPEN)
+            image = ImageEnhance.Contrast(image).enhance(7)
+        debug.add("enhanced", image)
+
+        # Convert image to JPEG bytes and encode them as a data URL, straight from the buffer without copying it
+        with stage("prompt_build"):
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG")
+            image_url = "data:image/jpeg;base64," + base64.b64encode(buffer.getbuffer()).decode("ascii")
     except Exception as e:
         raise Exception(f"Error opening image: {e}")
 
@@ -45,7 +84,7 @@ def llm_img_processing(client, file_bytes):
                 },
                 {
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{file_bytes}"}
+                    "image_url": {"url": image_url}
                 },
             ]
         },
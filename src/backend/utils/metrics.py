@@ -0,0 +1,136 @@
+import bisect
+import math
+import threading
+
+# Upper bounds (in seconds) of the latency histogram buckets, from local image stages to slow LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Registry:
+    """
+    Metrics of this process, rendered in the Prometheus text exposition format.
+    Besides metrics updated in the hot path, collectors (callables) can report counters that a
+    module already keeps, e.g. for its /stats output; they only run when the metrics are scraped.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """
+        Args:
+            collector (callable): Returns a list of (name, type, help, samples) families, where
+                samples is a list of (labels dict, value) pairs.
+        """
+        self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        """
+        Returns:
+            str: All metrics in the Prometheus text format (version 0.0.4).
+        """
+        lines = []
+        families = [(m.name, m.type, m.documentation, m.samples()) for m in self._metrics]
+        for collector in self._collectors:
+            families.extend(collector())
+        for name, metric_type, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample in samples:
+                # Histograms report samples with their own suffixed name, e.g. name_bucket
+                sample_name, labels, value = sample if len(sample) == 3 else (name, *sample)
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of this process, exposed by the backend's /metrics endpoint
+registry = Registry()
+
+
+class Counter:
+    """A monotonically increasing value per label combination. Thread-safe."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(dict(zip(self.labelnames, key)), value) for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """
+    Counts observations into cumulative buckets per label combination, plus their sum and count.
+    An observation costs a bisect and a short lock, so it is safe to use per request.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket plus +Inf, then the sum of all observations
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        samples = []
+        for key, counts in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, counts[-1]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
@@ -0,0 +1,63 @@
+import pytesseract
+
+
+class PytesseractEngine:
+    """
+    Default engine: shells out to the tesseract binary through pytesseract.
+    Every call starts a new process, reloads the language model and round-trips the image through a temp file.
+    """
+    name = "pytesseract"
+
+    def __init__(self, lang="eng"):
+        self.lang = lang
+
+    def image_to_string(self, image, timeout):
+        return pytesseract.image_to_string(image, lang=self.lang, timeout=timeout)
+
+
+class TesserocrEngine:
+    """
+    Persistent engine built on tesserocr (optional dependency, `pip install tesserocr`).
+    The Tesseract API and its language model are loaded once per worker process and kept for its
+    lifetime; images are handed over as raw pixel buffers in memory, without any temp files.
+    """
+    name = "tesserocr"
+
+    def __init__(self, lang="eng"):
+        try:
+            import tesserocr
+        except ImportError as e:
+            raise Exception("OCR backend 'tesserocr' requires the tesserocr package (pip install tesserocr).") from e
+        self.lang = lang
+        self._api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def image_to_string(self, image, timeout):
+        if image.mode not in ("L", "RGB"):
+            image = image.convert("RGB")
+        bytes_per_pixel = 1 if image.mode == "L" else 3
+        width, height = image.size
+        self._api.SetImageBytes(image.tobytes(), width, height, bytes_per_pixel, width * bytes_per_pixel)
+        # Recognize takes its timeout in milliseconds; 0 means no limit
+        if not self._api.Recognize(int(timeout * 1000) if timeout else 0):
+            raise RuntimeError("Tesseract recognition failed or timed out")
+        text = self._api.GetUTF8Text()
+        self._api.Clear()
+        return text
+
+
+OCR_ENGINES = {
+    PytesseractEngine.name: PytesseractEngine,
+    TesserocrEngine.name: TesserocrEngine,
+}
+
+
+def create_engine(name, lang="eng"):
+    """
+    Instantiates the OCR engine registered under `name`.
+
+    Raises:
+        Exception: If no engine with that name exists.
+    """
+    if name not in OCR_ENGINES:
+        raise Exception(f"Unknown OCR backend '{name}'. Available backends: {', '.join(OCR_ENGINES)}")
+    return OCR_ENGINES[name](lang=lang)
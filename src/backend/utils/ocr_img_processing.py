@@ -5,26 +5,67 @@ from PIL import Image, ImageFilter, ImageEnhance
 import pytesseract
 from openai import OpenAI
 import base64
+from ...backend.utils.ocr_pool import ocr_pool, OCRPoolFull
+from ...backend.utils.debug_sink import debug_sink
+from ...backend.utils.preprocessing import ocr_pipeline, run_pipeline, open_image, ocr_target_size
+from ...backend.utils.layout import crop_to_header
+from ...backend.utils.timing import stage
 
-def ocr_img_processing(client, file_bytes):
-    """
-    Called to process an image by extracting the text using OCR first, 
-    followed by extracting relevant information in JSON format using an LLM.
+def prepare_ocr_page(file_bytes, downscale=True, debug=None):
     """
+    Decodes and preprocesses the page for OCR. Done once per document, so a header attempt and
+    its full-page fallback share the work.
+    With `downscale`, oversized scans are decoded at reduced resolution (see OCR_TARGET_DPI and OCR_MAX_LONG_EDGE).
 
-    # Step 1: Load the image from bytes
+    Returns:
+        PIL.Image.Image: The preprocessed page.
+    """
+    if debug is None:
+        debug = debug_sink.sample("ocr")
     try:
-        image = Image.open(io.BytesIO(file_bytes))
+        with stage("decode"):
+            image = open_image(file_bytes, ocr_target_size if downscale else None)
+            image.load()
+        debug.add("original", image)
         # Preprocess images because they could be of bad quality
-        image = image.convert("RGB")
-        image = ImageEnhance.Contrast(image).enhance(2)
-        image.show()
+        # (by default the legacy RGB and contrast chain; see OCR_PREPROCESSING)
+        with stage("preprocess"):
+            return run_pipeline(image, ocr_pipeline, debug=debug)
     except Exception as e:
         raise Exception(f"Error opening image: {e}")
+
+
+def ocr_img_processing(client, file_bytes, pool=ocr_pool, downscale=True, region='full', page=None, debug=None):
+    """
+    Called to process an image by extracting the text using OCR first, 
+    followed by extracting relevant information in JSON format using an LLM.
+    OCR runs in `pool`, which defaults to the shared OCR pool and its configured backend.
+    Preprocessing has no side effects; intermediate images of sampled requests go to the debug sink.
+    With region='header', only the header region of the page (name, addresses, date) is OCR'd.
+    `page` is the output of prepare_ocr_page, if the page was already decoded and preprocessed.
+    `debug` is the request's debug capture, if it was already sampled (e.g. for prepare_ocr_page).
+    """
+    if debug is None:
+        debug = debug_sink.sample("ocr")
+
+    # Step 1: Load and preprocess the image, unless that was done already
+    if page is None:
+        page = prepare_ocr_page(file_bytes, downscale, debug)
+    image = page
+    if region == 'header':
+        try:
+            with stage("preprocess"):
+                image = crop_to_header(page)
+            debug.add("header", image)
+        except Exception as e:
+            raise Exception(f"Error opening image: {e}")
     
-    #Step 2: Extract text from the image using OCR (with pytesseract)
+    #Step 2: Extract text from the image using OCR, in the OCR process pool
     try:
-        ocr_text = pytesseract.image_to_string(image)
+        with stage("ocr"):
+            ocr_text = pool.image_to_string(image)
+    except OCRPoolFull:
+        raise
     except Exception as e:
         raise Exception(f"Error during OCR processing: {e}")
 
@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+from PIL import Image
+
+from ...backend.utils.metrics import registry
+from ...backend.utils.ocr_engines import create_engine
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# OCR engine used by the workers: 'pytesseract' (one tesseract process per page) or 'tesserocr' (persistent).
+OCR_BACKEND = os.getenv("OCR_BACKEND", "pytesseract")
+# Tesseract language model(s) to load.
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+# Number of OCR worker processes. 0 runs Tesseract inline in the calling thread (handy for debugging).
+OCR_POOL_WORKERS = int(os.getenv("OCR_POOL_WORKERS", os.cpu_count() or 1))
+# Maximum number of seconds a single Tesseract run may take before it is killed.
+OCR_TASK_TIMEOUT = float(os.getenv("OCR_TASK_TIMEOUT", "60"))
+# Maximum number of tasks allowed to wait for a free worker before new work is rejected.
+OCR_POOL_MAX_QUEUE = int(os.getenv("OCR_POOL_MAX_QUEUE", str(2 * max(OCR_POOL_WORKERS, 1))))
+# Niceness added to worker processes so OCR yields the CPU to the API workers under contention.
+OCR_WORKER_NICE = int(os.getenv("OCR_WORKER_NICE", "5"))
+
+
+# Seconds a caller waits for a task beyond the Tesseract timeouts of the tasks ahead of it,
+# for pickling the image and starting a replacement worker
+_RESULT_TIMEOUT_MARGIN = 5
+
+
+class OCRPoolFull(Exception):
+    """Raised when the OCR queue already holds the maximum number of waiting tasks."""
+
+
+# OCR engine of the current process, loaded once and then reused for every task it runs
+_engine = None
+
+
+def _init_worker(nice, backend, lang):
+    """
+    Runs once in every worker process. Tesseract spawns one OpenMP thread per core by default,
+    which oversubscribes the machine when several workers run in parallel, so it is pinned to one thread.
+    The OCR engine is loaded here, so persistent backends keep their language model for the worker's lifetime.
+    """
+    global _engine
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    if nice:
+        os.nice(nice)
+    _engine = create_engine(backend, lang)
+
+
+def _ocr_task(mode, size, pixels, timeout):
+    """
+    Executed inside a worker process: rebuilds the image from its raw pixels and runs OCR on it.
+
+    Returns:
+        tuple: The extracted text and the time in seconds spent on OCR (excluding queue wait).
+    """
+    start = time.perf_counter()
+    image = Image.frombuffer(mode, size, pixels, "raw", mode, 0, 1)
+    text = _engine.image_to_string(image, timeout)
+    return text, time.perf_counter() - start
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class OCRPool:
+    """
+    Bounded process pool that runs Tesseract off the API process.
+
+    - `workers` processes run OCR in parallel, so the work is spread across all cores of the container.
+    - At most `max_queue` tasks may wait for a free worker; beyond that `OCRPoolFull` is raised
+      instead of queueing unbounded work.
+    - Each Tesseract run is killed after `task_timeout` seconds, and a caller stops waiting for a
+      task shortly after the timeouts of the tasks ahead of it, so a stuck worker can't hang a request.
+    - If a worker crashes (e.g. is OOM-killed), the broken pool is replaced for the next task.
+    - `backend` selects the OCR engine (see ocr_engines.OCR_ENGINES); images are passed to the
+      workers as raw pixel buffers.
+    """
+
+    def __init__(self, workers=OCR_POOL_WORKERS, task_timeout=OCR_TASK_TIMEOUT, max_queue=OCR_POOL_MAX_QUEUE,
+                 backend=OCR_BACKEND, lang=OCR_LANG):
+        self.workers = workers
+        self.backend = backend
+        self.lang = lang
+        self.task_timeout = task_timeout
+        self.max_queue = max_queue
+        self._executor = None
+        # Inline mode keeps one engine per calling thread, since engines are not thread-safe
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        # Rolling window of recent task durations, used for the percentiles in stats()
+        self._durations = deque(maxlen=1000)
+
+    def _get_executor(self):
+        # Created lazily so that importing this module never spawns processes
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(OCR_WORKER_NICE, self.backend, self.lang),
+            )
+        return self._executor
+
+    def image_to_string(self, image):
+        """
+        Runs OCR on a PIL image in the pool and blocks until the text is available.
+        Meant to be called from a worker thread, not directly on the event loop.
+
+        Raises:
+            OCRPoolFull: If the wait queue is full.
+            TimeoutError: If the task didn't finish in time.
+        """
+        if self.workers <= 0:
+            start = time.perf_counter()
+            text = self._get_inline_engine().image_to_string(image, self.task_timeout)
+            self._record(time.perf_counter() - start)
+            return text
+
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self._rejected += 1
+                raise OCRPoolFull(f"OCR queue is full ({self.max_queue} tasks waiting).")
+            # Rounds of tasks that may run before this one finishes, each taking at most task_timeout
+            rounds = self._in_flight // self.workers + 1
+            self._in_flight += 1
+            executor = self._get_executor()
+
+        try:
+            future = executor.submit(_ocr_task, image.mode, image.size, image.tobytes(), self.task_timeout)
+            text, duration = future.result(timeout=rounds * self.task_timeout + _RESULT_TIMEOUT_MARGIN)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self._failed += 1
+            raise TimeoutError(f"OCR task did not finish within {rounds * self.task_timeout + _RESULT_TIMEOUT_MARGIN:g} seconds.")
+        except BrokenProcessPool:
+            # A worker died; the pool refuses all further work, so the next task gets a new one
+            with self._lock:
+                self._failed += 1
+                if self._executor is executor:
+                    self._executor = None
+                    executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        self._record(duration)
+        return text
+
+    def _get_inline_engine(self):
+        engine = getattr(self._local, "engine", None)
+        if engine is None:
+            engine = self._local.engine = create_engine(self.backend, self.lang)
+        return engine
+
+    def _record(self, duration):
+        with self._lock:
+            self._completed += 1
+            self._durations.append(duration)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Current pool utilisation and task time percentiles (in seconds) over recent tasks.
+        """
+        with self._lock:
+            durations = sorted(self._durations)
+            in_flight = self._in_flight
+            return {
+                "backend": self.backend,
+                "workers": self.workers,
+                "busy_workers": min(in_flight, self.workers),
+                "queue_length": max(in_flight - self.workers, 0),
+                "max_queue": self.max_queue,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "task_time_p50": _percentile(durations, 0.50),
+                "task_time_p95": _percentile(durations, 0.95),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Shared pool used by ocr_img_processing
+ocr_pool = OCRPool()
+
+
+@registry.register_collector
+def _ocr_pool_metrics():
+    stats = ocr_pool.stats()
+    return [
+        ("kyc_ocr_pool_busy_workers", "gauge", "OCR worker processes currently running a task.",
+         [({}, stats["busy_workers"])]),
+        ("kyc_ocr_pool_queue_length", "gauge", "OCR tasks waiting for a worker.", [({}, stats["queue_length"])]),
+        ("kyc_ocr_tasks_total", "counter", "OCR tasks by outcome.", [
+            ({"outcome": outcome}, stats[outcome]) for outcome in ("completed", "failed", "rejected")
+        ]),
+    ]
@@ -0,0 +1,273 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient
+
+from ...backend.utils.metrics import Counter, Histogram
+from ...backend.utils.rate_limiter import rate_limiter, estimate_request_tokens, retry_delay, llm_retries, OPENAI_MAX_RETRIES
+from ...common.tracing import span
+
+from dotenv import load_dotenv
+
+load_dotenv()
+openai_api_key = os.getenv("OPENAI_API_KEY")
+# Base URL of the OpenAI-compatible API. Unset uses api.openai.com; point it at the mock server
+# (e.g. http://localhost:8080/v1, see src/mock_llm/main.py) for load tests without network access.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Connection pool of the shared clients. Keep-alive connections are reused across requests,
+# so calls skip the TCP and TLS handshake.
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+# Multiplex concurrent requests over one connection with HTTP/2 (requires `pip install httpx[http2]`).
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "false").lower() in ("1", "true", "yes")
+# Overall timeout of a single OpenAI request, in seconds.
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+# Seconds the extraction (or single-call verification) and the comparison call may take in total,
+# including quota waits and retries; a slow call then fails fast instead of holding the verification.
+OPENAI_EXTRACTION_DEADLINE = float(os.getenv("OPENAI_EXTRACTION_DEADLINE", "45"))
+OPENAI_COMPARISON_DEADLINE = float(os.getenv("OPENAI_COMPARISON_DEADLINE", "20"))
+# Hedged requests: a call still unanswered after the OPENAI_HEDGE_QUANTILE of recent latencies (at least
+# OPENAI_HEDGE_MIN_DELAY seconds) is sent a second time and the first answer wins. Costs the tokens of the
+# duplicates (see kyc_llm_hedge_tokens_total); with the 0.95 quantile about 5% of the calls are duplicated.
+OPENAI_HEDGING = os.getenv("OPENAI_HEDGING", "false").lower() in ("1", "true", "yes")
+OPENAI_HEDGE_QUANTILE = float(os.getenv("OPENAI_HEDGE_QUANTILE", "0.95"))
+OPENAI_HEDGE_MIN_DELAY = float(os.getenv("OPENAI_HEDGE_MIN_DELAY", "1"))
+# Recent latencies per model the quantile is computed from, and how many are needed before hedging starts
+OPENAI_HEDGE_WINDOW = 500
+OPENAI_HEDGE_MIN_SAMPLES = 20
+
+_async_client = None
+_sync_client = None
+
+llm_requests = Counter("kyc_llm_requests_total", "Chat completion calls by model and outcome.", ["model", "outcome"])
+llm_request_seconds = Histogram("kyc_llm_request_seconds", "Latency of chat completion calls.", ["model"])
+llm_tokens = Counter("kyc_llm_tokens_total", "Tokens used by chat completion calls, from completion.usage.",
+                     ["model", "type"])
+llm_hedges = Counter("kyc_llm_hedges_total", "Hedge requests sent, and whether the hedge or the original answered first.",
+                     ["model", "outcome"])
+llm_hedge_tokens = Counter("kyc_llm_hedge_tokens_total", "Estimated tokens spent on hedge requests.", ["model"])
+
+# Recent successful call latencies per model, for the hedge delay
+_latencies = {}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a chat completion did not finish within its deadline."""
+
+
+def _http_client_options():
+    return {
+        "limits": httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        "http2": OPENAI_HTTP2,
+        "timeout": OPENAI_TIMEOUT,
+    }
+
+
+def get_async_openai_client():
+    """
+    Returns:
+        AsyncOpenAI: The process-wide async client, created on first use with a shared connection pool.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=openai_api_key,
+            base_url=OPENAI_BASE_URL,
+            http_client=DefaultAsyncHttpxClient(**_http_client_options()),
+        )
+    return _async_client
+
+
+def get_openai_client():
+    """
+    Returns:
+        OpenAI: The process-wide sync client, created on first use with a shared connection pool.
+    """
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = OpenAI(
+            api_key=openai_api_key,
+            base_url=OPENAI_BASE_URL,
+            http_client=DefaultHttpxClient(**_http_client_options()),
+        )
+    return _sync_client
+
+
+async def close_openai_clients():
+    """Closes the shared clients and their connection pools, e.g. on application shutdown."""
+    global _async_client, _sync_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
+
+
+def _latency_quantile(model, quantile):
+    latencies = sorted(_latencies.get(model, ()))
+    if len(latencies) < OPENAI_HEDGE_MIN_SAMPLES:
+        return None
+    return latencies[min(int(quantile * len(latencies)), len(latencies) - 1)]
+
+
+def hedge_delay(model):
+    """
+    Returns:
+        float or None: Seconds after which a duplicate of a still unanswered call to `model` is sent:
+            the OPENAI_HEDGE_QUANTILE of its recent latencies, but at least OPENAI_HEDGE_MIN_DELAY.
+            None (no hedging) until OPENAI_HEDGE_MIN_SAMPLES latencies have been seen.
+    """
+    quantile = _latency_quantile(model, OPENAI_HEDGE_QUANTILE)
+    if quantile is None:
+        return None
+    return max(quantile, OPENAI_HEDGE_MIN_DELAY)
+
+
+async def _send_chat_completion(client, kwargs, deadline_at):
+    if hasattr(client, "with_options"):
+        # Retries are handled by create_chat_completion, so they respect the shared rate limiter.
+        # The HTTP timeout ends at the deadline, which also stops calls running in a worker thread.
+        # Also applies to wrappers forwarding with_options, e.g. the benchmarks' PayloadCounter.
+        options = {"max_retries": 0}
+        if deadline_at is not None:
+            options["timeout"] = max(deadline_at - time.monotonic(), 0.001)
+        client = client.with_options(**options)
+    if isinstance(client, OpenAI):
+        return await asyncio.to_thread(client.chat.completions.create, **kwargs)
+    return await client.chat.completions.create(**kwargs)
+
+
+async def _create_with_retries(client, kwargs, estimated, deadline_at):
+    """
+    Sends one chat completion, waiting for quota in the shared rate limiter before every attempt and
+    retrying 429s, 5xx and connection errors with backoff (see retry_delay).
+
+    Returns:
+        tuple: The completion and the number of attempts it took.
+    """
+    model = kwargs.get("model")
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        await rate_limiter.acquire(estimated)
+        start = time.perf_counter()
+        try:
+            completion = await _send_chat_completion(client, kwargs, deadline_at)
+        except Exception as e:
+            llm_requests.inc(model=model, outcome=type(e).__name__)
+            # Failed calls don't count against the token quota
+            rate_limiter.settle(estimated, 0)
+            delay = retry_delay(e, attempt)
+            if delay is None or attempt == OPENAI_MAX_RETRIES:
+                raise
+            if isinstance(e, openai.RateLimitError):
+                rate_limiter.pause(delay)
+            llm_retries.inc(model=model, error=type(e).__name__)
+            await asyncio.sleep(delay)
+            continue
+
+        duration = time.perf_counter() - start
+        llm_request_seconds.observe(duration, model=model)
+        _latencies.setdefault(model, deque(maxlen=OPENAI_HEDGE_WINDOW)).append(duration)
+        llm_requests.inc(model=model, outcome="ok")
+        usage = getattr(completion, "usage", None)
+        if usage is not None:
+            rate_limiter.settle(estimated, usage.total_tokens)
+            llm_tokens.inc(usage.prompt_tokens, model=model, type="prompt")
+            llm_tokens.inc(usage.completion_tokens, model=model, type="completion")
+        return completion, attempt + 1
+
+
+async def _create_hedged(client, kwargs, estimated, deadline_at):
+    """
+    Sends the call and, if it hasn't been answered after hedge_delay, a duplicate of it. The first
+    successful answer wins and the other request is cancelled, which closes its connection; if one of
+    them fails, the other one is still awaited. Only used with async clients: a call on a sync client
+    runs in a worker thread that cancelling can't stop.
+
+    Returns:
+        tuple: The completion and the number of attempts of the request that won.
+    """
+    model = kwargs.get("model")
+    primary = asyncio.create_task(_create_with_retries(client, kwargs, estimated, deadline_at))
+    tasks = {primary}
+    hedged = False
+    try:
+        delay = hedge_delay(model)
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                tasks.add(asyncio.create_task(_create_with_retries(client, kwargs, estimated, deadline_at)))
+                hedged = True
+                llm_hedges.inc(model=model, outcome="sent")
+                llm_hedge_tokens.inc(estimated, model=model)
+
+        error = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if hedged:
+                        llm_hedges.inc(model=model, outcome="won" if task is not primary else "lost")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # The losing request (or both, on a deadline) is cancelled and awaited, so no request outlives the call
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def create_chat_completion(client, deadline=None, **kwargs):
+    """
+    Creates a chat completion on either a sync or an async client.
+    Calls on a sync OpenAI client are run in a worker thread, so they don't block the event loop.
+    Every attempt first waits for quota in the shared rate limiter, using the estimated prompt and
+    completion tokens (see estimate_request_tokens). Calls failing with a 429, a 5xx or a connection
+    error are retried up to OPENAI_MAX_RETRIES times with exponential backoff and jitter; after a 429,
+    all calls hold off for the backoff.
+    With OPENAI_HEDGING, a call on an async client that is slower than usual is duplicated (see _create_hedged).
+    Counts the call, its latency, retries, hedges and token usage in the kyc_llm_* metrics.
+
+    Args:
+        client: OpenAI client (sync or async).
+        deadline (float, optional): Seconds the call may take in total, including quota waits, retries
+            and hedges (e.g. OPENAI_EXTRACTION_DEADLINE); None or 0 for no deadline beyond OPENAI_TIMEOUT.
+        **kwargs: Arguments of chat.completions.create.
+
+    Raises:
+        DeadlineExceeded: If the call didn't finish within `deadline`.
+    """
+    model = kwargs.get("model")
+    estimated = estimate_request_tokens(kwargs)
+    deadline_at = time.monotonic() + deadline if deadline else None
+    # Hedging needs cancellable requests; a sync client's worker thread would keep the duplicate running
+    create = _create_hedged if OPENAI_HEDGING and not isinstance(client, OpenAI) else _create_with_retries
+    with span("chat_completion", model=model) as trace_span:
+        timeout = asyncio.timeout(deadline or None)
+        try:
+            async with timeout:
+                completion, attempts = await create(client, kwargs, estimated, deadline_at)
+        except (TimeoutError, openai.APITimeoutError):
+            # The HTTP timeout of the last attempt may fire just before the deadline itself
+            if not timeout.expired() and not (deadline_at and time.monotonic() >= deadline_at - 0.01):
+                raise
+            llm_requests.inc(model=model, outcome="DeadlineExceeded")
+            raise DeadlineExceeded(f"The {model} call did not finish within its deadline of {deadline:g} seconds.")
+        if trace_span is not None:
+            trace_span.set_attribute("attempts", attempts)
+            usage = getattr(completion, "usage", None)
+            if usage is not None:
+                trace_span.set_attribute("prompt_tokens", usage.prompt_tokens)
+                trace_span.set_attribute("completion_tokens", usage.completion_tokens)
+    return completion
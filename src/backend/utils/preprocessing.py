@@ -0,0 +1,369 @@
+import io
+import math
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Comma-separated preprocessing stages applied before OCR (see PREPROCESSING_STAGES), or 'legacy' for the
+# PIL chain (RGB conversion plus contrast enhancement). 'legacy' stays the default until a NumPy pipeline
+# measurably beats it in both CPU time and OCR quality (see src/benchmarks/preprocessing.py).
+OCR_PREPROCESSING = os.getenv("OCR_PREPROCESSING", "legacy")
+LEGACY_PIPELINE = "legacy"
+# Maximum skew (in degrees) that the deskew stage searches for.
+DESKEW_MAX_ANGLE = float(os.getenv("DESKEW_MAX_ANGLE", "5"))
+
+# Resolution handed to Tesseract: scans are downscaled to at most OCR_TARGET_DPI (when the file
+# records its DPI) and to at most OCR_MAX_LONG_EDGE pixels on the long edge. Tesseract reads
+# ~300 DPI text best; more pixels only cost time.
+OCR_TARGET_DPI = float(os.getenv("OCR_TARGET_DPI", "300"))
+OCR_MAX_LONG_EDGE = int(os.getenv("OCR_MAX_LONG_EDGE", "3300"))
+# Short side of images sent to the vision model. In high detail mode OpenAI scales images to fit
+# 2048x2048 and then to a 768px short side anyway and bills 170 tokens per 512px tile, so larger
+# uploads only add bytes. Lower values trade legibility for fewer tiles.
+VISION_SHORT_SIDE = int(os.getenv("VISION_SHORT_SIDE", "768"))
+VISION_MAX_LONG_EDGE = 2048
+VISION_TILE_SIZE = 512
+# Largest image (width x height) that is decoded. Checked from the image header before decoding, so a small
+# file that expands into a huge bitmap (a decompression bomb) is rejected. An A4 page at 600 DPI has 35M pixels.
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "50000000"))
+# Images are only resized if that removes at least 20% of their pixels; for smaller gains the
+# resize costs more CPU time than the saved bytes and OCR work are worth.
+_MIN_RESIZE_RATIO = 0.8
+
+
+def ocr_target_size(image):
+    """
+    Returns:
+        tuple: The (width, height) Tesseract should see, never larger than the original.
+    """
+    width, height = image.size
+    scale = OCR_MAX_LONG_EDGE / max(width, height)
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0]:
+        scale = min(scale, OCR_TARGET_DPI / float(dpi[0]))
+    scale = min(scale, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _vision_size(width, height, short_side):
+    scale = min(1.0, VISION_MAX_LONG_EDGE / max(width, height), short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def vision_target_size(image):
+    """
+    Replicates the high-detail resizing of the OpenAI vision models (fit into 2048x2048, then
+    scale the short side down to VISION_SHORT_SIDE), so the image is uploaded at the size the model uses.
+
+    Returns:
+        tuple: The (width, height) to upload, never larger than the original.
+    """
+    return _vision_size(image.width, image.height, VISION_SHORT_SIDE)
+
+
+def vision_image_tokens(width, height):
+    """
+    Returns:
+        int: The number of input tokens a high-detail image of this size costs (85 base + 170 per 512px tile).
+    """
+    width, height = _vision_size(width, height, 768)
+    tiles = math.ceil(width / VISION_TILE_SIZE) * math.ceil(height / VISION_TILE_SIZE)
+    return 85 + 170 * tiles
+
+
+class ImageTooLarge(Exception):
+    """Raised for images with more than MAX_IMAGE_PIXELS pixels."""
+
+
+def check_image_header(file_bytes, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Opens an image lazily, reading only its header, and checks its pixel count before anything is decoded.
+    The BytesIO wraps `file_bytes` without copying them.
+
+    Returns:
+        PIL.Image.Image: The not yet decoded image.
+
+    Raises:
+        ImageTooLarge: If the image has more than `max_pixels` pixels.
+    """
+    try:
+        image = Image.open(io.BytesIO(file_bytes))
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    if image.width * image.height > max_pixels:
+        raise ImageTooLarge(
+            f"Image of {image.width}x{image.height} pixels exceeds the maximum of {max_pixels} pixels."
+        )
+    return image
+
+
+def open_image(file_bytes, target_size=None):
+    """
+    Opens an uploaded image, optionally downscaled to `target_size(image)`.
+    JPEGs are decoded in draft mode, where libjpeg scales by 1/2, 1/4 or 1/8 while decoding, so a
+    large scan is never decoded at full resolution. The remaining reduction uses a Lanczos resize.
+
+    Args:
+        file_bytes (bytes): The uploaded file.
+        target_size (callable, optional): Maps the (lazily opened) image to its maximum (width, height).
+
+    Returns:
+        PIL.Image.Image: The decoded image.
+
+    Raises:
+        ImageTooLarge: If the image has more than MAX_IMAGE_PIXELS pixels (checked before decoding).
+    """
+    image = check_image_header(file_bytes)
+    if target_size is None:
+        return image
+    size = target_size(image)
+    if size[0] * size[1] >= _MIN_RESIZE_RATIO * image.width * image.height:
+        return image
+    # Only has an effect for JPEG; the draft size is always at least the requested size
+    image.draft(None, size)
+    if image.mode in ("1", "P"):
+        # Palette images can only be resized with nearest-neighbour sampling
+        image = image.convert("RGB")
+    if image.size != size:
+        image = image.resize(size, Image.LANCZOS, reducing_gap=2.0)
+    return image
+
+
+def to_array(image):
+    """
+    Converts a PIL image into a uint8 NumPy array of shape (height, width) for grayscale images
+    or (height, width, 3) for everything else (palette and alpha images are flattened to RGB).
+    """
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    return np.asarray(image, dtype=np.uint8).copy()
+
+
+def to_image(array):
+    return Image.fromarray(array)
+
+
+def grayscale(array):
+    """
+    ITU-R 601 luma in fixed-point integer arithmetic (weights 77/150/29 out of 256),
+    which avoids a full-resolution float copy of the image.
+    """
+    if array.ndim == 2:
+        return array
+    luma = array[..., 0].astype(np.uint16)
+    luma *= 77
+    luma += array[..., 1].astype(np.uint16) * 150
+    luma += array[..., 2].astype(np.uint16) * 29
+    luma >>= 8
+    return luma.astype(np.uint8)
+
+
+def contrast(array, factor=2.0):
+    """
+    Stretches pixel values away from the mean grey level, like PIL's ImageEnhance.Contrast.
+    Kept so the previous preprocessing can be reproduced and benchmarked as a pipeline.
+    """
+    mean = int(grayscale(array).mean() + 0.5)
+    lut = np.clip(mean + factor * (np.arange(256) - mean), 0, 255).astype(np.uint8)
+    return lut[array]
+
+
+# Compare-exchange network (Paeth) that leaves the median of nine values at position 4
+_MEDIAN9_NETWORK = (
+    (1, 2), (4, 5), (7, 8), (0, 1), (3, 4), (6, 7), (1, 2), (4, 5), (7, 8), (0, 3),
+    (5, 8), (4, 7), (3, 6), (1, 4), (2, 5), (4, 7), (4, 2), (6, 4), (4, 2),
+)
+
+
+def denoise(array):
+    """
+    3x3 median filter on a grayscale image, which removes salt-and-pepper scan noise while keeping
+    character edges sharp. The median is computed with a fixed compare-exchange network of
+    element-wise min/max operations over the nine shifted neighbourhood views, which is much
+    faster than sorting every neighbourhood.
+    """
+    array = grayscale(array)
+    height, width = array.shape
+    padded = np.pad(array, 1, mode="edge")
+    views = [padded[dy:dy + height, dx:dx + width].copy() for dy in range(3) for dx in range(3)]
+    for i, j in _MEDIAN9_NETWORK:
+        low = np.minimum(views[i], views[j])
+        np.maximum(views[i], views[j], out=views[j])
+        views[i] = low
+    array[...] = views[4]
+    return array
+
+
+def otsu_threshold(array):
+    """
+    Returns:
+        int: The grey level that best separates foreground (text) from background,
+            computed from the 256-bin histogram with Otsu's method.
+    """
+    histogram = np.bincount(array.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_background = np.cumsum(histogram)
+    weight_foreground = weight_background[-1] - weight_background
+    cumulative_mean = np.cumsum(histogram * levels)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_background = cumulative_mean / weight_background
+        mean_foreground = (cumulative_mean[-1] - cumulative_mean) / weight_foreground
+        between_class_variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+    return int(np.nanargmax(between_class_variance))
+
+
+def otsu(array):
+    """Global binarization at the Otsu threshold: text becomes 0 (black), background 255 (white)."""
+    array = grayscale(array)
+    threshold = otsu_threshold(array)
+    lut = np.where(np.arange(256) <= threshold, 0, 255).astype(np.uint8)
+    np.take(lut, array, out=array)
+    return array
+
+
+def adaptive(array, block_size=31, offset=10, band_rows=128):
+    """
+    Local binarization: a pixel is text if it is more than `offset` grey levels darker than the mean
+    of its `block_size` x `block_size` neighbourhood. Handles uneven lighting and shadows better than
+    a global threshold. Neighbourhood means come from an integral image, so the cost does not
+    depend on the block size.
+    The integral image is the only full-page temporary. It is accumulated in place in uint32:
+    page totals may wrap around, but the differences of a neighbourhood sum are exact as long as
+    the sum itself fits. The threshold is then applied in bands of `band_rows` rows.
+    """
+    array = grayscale(array)
+    height, width = array.shape
+    radius = block_size // 2
+    integral = np.zeros((height + 1, width + 1), dtype=np.uint32)
+    integral[1:, 1:] = array
+    np.cumsum(integral, axis=0, out=integral)
+    np.cumsum(integral, axis=1, out=integral)
+
+    left = np.clip(np.arange(width) - radius, 0, width)
+    right = np.clip(np.arange(width) + radius + 1, 0, width)
+    widths = (right - left).astype(np.int32)
+    for start in range(0, height, band_rows):
+        rows = np.arange(start, min(start + band_rows, height))
+        top = np.clip(rows - radius, 0, height)
+        bottom = np.clip(rows + radius + 1, 0, height)
+        sums = integral[bottom][:, right] - integral[top][:, right]
+        sums -= integral[bottom][:, left]
+        sums += integral[top][:, left]
+        areas = np.outer((bottom - top).astype(np.int32), widths)
+        # A pixel is text if pixel * area < sum - offset * area; at most 255 * block_size^2, so int32 fits
+        threshold = sums.astype(np.int32)
+        threshold -= offset * areas
+        band = array[start:start + len(rows)]
+        foreground = band * areas < threshold
+        band.fill(255)
+        band[foreground] = 0
+    return array
+
+
+def estimate_skew(array, max_angle=DESKEW_MAX_ANGLE, step=0.25, max_samples=20_000):
+    """
+    Estimates the skew of the text lines in degrees. For every candidate angle the dark pixels are
+    projected onto the rotated vertical axis; text lines that are aligned with the axis produce the
+    most sharply peaked projection profile (highest variance).
+    """
+    ys, xs = np.nonzero(grayscale(array) < 128)
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > max_samples:
+        # A fixed subsample keeps the estimate fast and deterministic on large scans
+        pick = np.linspace(0, len(ys) - 1, max_samples).astype(np.int64)
+        ys, xs = ys[pick], xs[pick]
+
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    offsets = np.outer(np.tan(np.radians(angles)), xs)
+    rows = np.rint(ys[None, :] - offsets).astype(np.int64)
+    rows -= rows.min()
+    n_rows = rows.max() + 1
+    rows += np.arange(len(angles))[:, None] * n_rows
+    profiles = np.bincount(rows.ravel(), minlength=len(angles) * n_rows).reshape(len(angles), n_rows)
+    return float(angles[np.argmax(profiles.var(axis=1))])
+
+
+def deskew(array):
+    """Rotates the page so text lines are horizontal; pixels uncovered by the rotation are white."""
+    angle = estimate_skew(array)
+    if abs(angle) < 0.1:
+        return array
+    fill = 255 if array.ndim == 2 else (255, 255, 255)
+    rotated = to_image(array).rotate(-angle, resample=Image.BILINEAR, fillcolor=fill)
+    return np.asarray(rotated, dtype=np.uint8).copy()
+
+
+PREPROCESSING_STAGES = {
+    "grayscale": grayscale,
+    "contrast": contrast,
+    "denoise": denoise,
+    "otsu": otsu,
+    "adaptive": adaptive,
+    "deskew": deskew,
+}
+
+
+def build_pipeline(spec=OCR_PREPROCESSING):
+    """
+    Parses a comma-separated list of stage names, e.g. "grayscale,denoise,otsu,deskew".
+
+    Returns:
+        list or None: (name, function) pairs in the order they are applied; None for the 'legacy' chain.
+
+    Raises:
+        Exception: If a stage name is unknown.
+    """
+    if spec.strip() == LEGACY_PIPELINE:
+        return None
+    stages = []
+    for name in (part.strip() for part in spec.split(",")):
+        if not name:
+            continue
+        if name not in PREPROCESSING_STAGES:
+            raise Exception(f"Unknown preprocessing stage '{name}'. Available stages: {', '.join(PREPROCESSING_STAGES)}")
+        stages.append((name, PREPROCESSING_STAGES[name]))
+    return stages
+
+
+def run_pipeline(image, stages, debug=None, timings=None):
+    """
+    Applies the preprocessing stages to a PIL image. Stages work on one NumPy array and modify it
+    in place where they can.
+
+    Args:
+        image (PIL.Image.Image): The decoded document image.
+        stages (list or None): Output of build_pipeline; None applies the legacy PIL chain.
+        debug: Optional debug-sink capture that receives the output of every stage.
+        timings (dict, optional): Receives the seconds spent per stage.
+
+    Returns:
+        PIL.Image.Image: The preprocessed image.
+    """
+    if stages is None:
+        start = time.perf_counter()
+        image = ImageEnhance.Contrast(image.convert("RGB")).enhance(2)
+        if timings is not None:
+            timings[LEGACY_PIPELINE] = timings.get(LEGACY_PIPELINE, 0.0) + time.perf_counter() - start
+        if debug is not None and debug.active:
+            debug.add("enhanced", image)
+        return image
+    array = to_array(image)
+    for name, stage in stages:
+        start = time.perf_counter()
+        array = stage(array)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+        if debug is not None and debug.active:
+            debug.add(name, to_image(array))
+    return to_image(array)
+
+
+# Pipeline applied before OCR
+ocr_pipeline = build_pipeline()
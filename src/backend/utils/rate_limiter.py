@@ -0,0 +1,207 @@
+import asyncio
+import base64
+import io
+import json
+import os
+import random
+import time
+
+import openai
+from PIL import Image
+
+from ...backend.utils.metrics import registry, Counter, Histogram
+from ...backend.utils.preprocessing import vision_image_tokens
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# OpenAI quotas of this process, in requests and tokens per minute; 0 disables the limit.
+# The limits apply per process, so split the account's quota between the API and the job workers.
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+# Seconds of quota that may be used in a burst. Smaller values spread calls more evenly over the minute.
+OPENAI_RATE_BURST_SECONDS = float(os.getenv("OPENAI_RATE_BURST_SECONDS", "5"))
+# Retries of calls that failed with a 429, a 5xx or a connection error, with exponential backoff and jitter.
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "20"))
+
+# Completion tokens counted against the TPM quota when a call doesn't set max_tokens; our answers are short JSON.
+_COMPLETION_TOKENS_ESTIMATE = 300
+# Tokens per message for the chat format's role and separators
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+rate_limit_wait_seconds = Histogram("kyc_openai_rate_limit_wait_seconds",
+                                    "Time chat completion calls waited for OpenAI quota.")
+llm_retries = Counter("kyc_llm_retries_total", "Retried chat completion calls by model and error.", ["model", "error"])
+
+
+def _image_tokens(url):
+    # Only the header is parsed to learn the size; the pixels are never decoded
+    try:
+        image = Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1])))
+        return vision_image_tokens(image.width, image.height)
+    except Exception:
+        # Worst case for an image within the 2048x768 scaling of high detail mode
+        return vision_image_tokens(2048, 768)
+
+
+def estimate_request_tokens(request):
+    """
+    Estimates what a chat completion counts against the TPM quota before it is sent: about 4
+    characters per text token, the tile cost of every image (see vision_image_tokens), and the
+    completion tokens the call may produce.
+
+    Args:
+        request (dict): The keyword arguments of chat.completions.create.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    tokens = 0
+    for message in request.get("messages", []):
+        tokens += _MESSAGE_OVERHEAD_TOKENS
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += len(content) // 4
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                tokens += len(part.get("text", "")) // 4
+            elif part.get("type") == "image_url":
+                url = part.get("image_url", {}).get("url", "")
+                tokens += _image_tokens(url) if url.startswith("data:") else vision_image_tokens(2048, 768)
+    if "response_format" in request:
+        tokens += len(json.dumps(request["response_format"])) // 4
+    completion = request.get("max_completion_tokens") or request.get("max_tokens") or _COMPLETION_TOKENS_ESTIMATE
+    return tokens + completion
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute` / 60 units per second up to `burst_seconds` worth of units. Reservations
+    may take the level below zero; the caller then waits until the refill has covered them, so
+    concurrent callers are spaced out in the order they arrived.
+    """
+
+    def __init__(self, per_minute, burst_seconds):
+        self.enabled = per_minute > 0
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount):
+        """
+        Returns:
+            float: Seconds until the reserved `amount` is covered. Amounts above the capacity count as a full bucket.
+        """
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        self.level -= min(amount, self.capacity)
+        return max(-self.level / self.rate, 0.0)
+
+    def adjust(self, amount):
+        """Gives back `amount` units (or takes them, if negative), e.g. once the actual usage is known."""
+        if not self.enabled:
+            return
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def headroom(self):
+        """
+        Returns:
+            float or None: Units available right now (negative while reservations are waiting), None if disabled.
+                Read-only, so it is safe to call from the metrics thread.
+        """
+        if not self.enabled:
+            return None
+        return min(self.capacity, self.level + (time.monotonic() - self._updated) * self.rate)
+
+
+class RateLimiter:
+    """
+    Client-side OpenAI quota: a request bucket (RPM) and a token bucket (TPM). Calls reserve one
+    request and their estimated tokens before they are sent, and hold off together after a 429.
+    Changed from the event loop only, so it needs no locking; /metrics only reads it (see TokenBucket.headroom).
+    """
+
+    def __init__(self, rpm=OPENAI_RPM_LIMIT, tpm=OPENAI_TPM_LIMIT, burst_seconds=OPENAI_RATE_BURST_SECONDS):
+        self.requests = TokenBucket(rpm, burst_seconds)
+        self.tokens = TokenBucket(tpm, burst_seconds)
+        self._paused_until = 0.0
+
+    async def acquire(self, tokens):
+        """
+        Waits until one request and `tokens` tokens of quota are available.
+
+        Returns:
+            float: The seconds waited.
+        """
+        wait = max(
+            self.requests.reserve(1),
+            self.tokens.reserve(tokens),
+            self._paused_until - time.monotonic(),
+        )
+        if wait > 0:
+            await asyncio.sleep(wait)
+        wait = max(wait, 0.0)
+        rate_limit_wait_seconds.observe(wait)
+        return wait
+
+    def settle(self, estimated, used):
+        """Corrects the token bucket by the difference between the estimated and the `used` tokens."""
+        self.tokens.adjust(estimated - used)
+
+    def pause(self, seconds):
+        """Holds off all calls for `seconds`, e.g. after OpenAI answered with a 429."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def retry_delay(error, attempt):
+    """
+    Returns:
+        float or None: Seconds to wait before retrying a call that failed with `error` on its
+            `attempt`-th try (0-based), or None if the error is not worth retrying. The delay is drawn
+            from [0, OPENAI_BACKOFF_BASE * 2^attempt] (full jitter, capped at OPENAI_BACKOFF_MAX), but is
+            at least the Retry-After the server asked for.
+    """
+    if isinstance(error, openai.APIStatusError):
+        if not isinstance(error, openai.RateLimitError) and error.status_code < 500:
+            return None
+    elif not isinstance(error, openai.APIConnectionError):
+        return None
+
+    delay = random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt))
+    response = getattr(error, "response", None)
+    headers = response.headers if response is not None else {}
+    try:
+        if headers.get("retry-after-ms"):
+            delay = max(delay, float(headers["retry-after-ms"]) / 1000)
+        elif headers.get("retry-after"):
+            delay = max(delay, float(headers["retry-after"]))
+    except ValueError:
+        pass
+    return min(delay, OPENAI_BACKOFF_MAX)
+
+
+# Shared limiter used by create_chat_completion
+rate_limiter = RateLimiter()
+
+
+@registry.register_collector
+def _rate_limiter_metrics():
+    headroom = [(quota, bucket.headroom()) for quota, bucket in (("requests", rate_limiter.requests),
+                                                                ("tokens", rate_limiter.tokens))]
+    return [
+        ("kyc_openai_quota_headroom", "gauge",
+         "OpenAI quota available right now (requests or tokens); negative while calls wait for quota.",
+         [({"quota": quota}, value) for quota, value in headroom if value is not None]),
+    ]
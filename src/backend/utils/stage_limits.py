@@ -0,0 +1,61 @@
+import asyncio
+import contextlib
+import os
+
+from ...backend.utils.ocr_pool import OCR_POOL_WORKERS
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Items of a batch that may be in their image stage (decoding, preprocessing, OCR) at the same time.
+# Defaults to the number of OCR workers, so a batch keeps the pool busy without overflowing its queue.
+BATCH_OCR_CONCURRENCY = int(os.getenv("BATCH_OCR_CONCURRENCY", str(max(OCR_POOL_WORKERS, 1))))
+# Items of a batch that may wait on an LLM call at the same time.
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+STAGES = ('ocr', 'llm')
+
+
+class StageLimits:
+    """
+    Separate concurrency limits for the two stages of a verification: the CPU-bound image stage
+    ('ocr') and the I/O-bound LLM calls ('llm'). A request holds a stage slot only while it is in that
+    stage, so while some items wait on the LLM, others can already use the free OCR workers.
+    With a `parent` (e.g. the process-wide limits of admission control), a slot also holds a slot of
+    the parent, so a batch stays within its own budget and shares the process's budget with the
+    interactive requests.
+    """
+
+    def __init__(self, ocr=BATCH_OCR_CONCURRENCY, llm=BATCH_LLM_CONCURRENCY, parent=None):
+        if ocr < 1 or llm < 1:
+            raise ValueError("Stage concurrency limits must be at least 1.")
+        self.limits = {'ocr': ocr, 'llm': llm}
+        self.parent = parent
+        self._semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in self.limits.items()}
+
+    def slot(self, stage):
+        """
+        Returns:
+            An async context manager that holds one slot of `stage` ('ocr' or 'llm').
+        """
+        if self.parent is None:
+            return self._semaphores[stage]
+        return self._nested_slot(stage)
+
+    @contextlib.asynccontextmanager
+    async def _nested_slot(self, stage):
+        # Own slot first, so waiting items of a batch don't queue up on the parent's semaphore
+        async with self._semaphores[stage]:
+            async with self.parent.slot(stage):
+                yield
+
+
+def stage_slot(limits, stage):
+    """
+    Returns:
+        An async context manager holding a slot of `stage` in `limits`, or a no-op one if `limits` is None.
+    """
+    if limits is None:
+        return contextlib.nullcontext()
+    return limits.slot(stage)
@@ -0,0 +1,22 @@
+# Shared with the mock LLM server, which runs without the OPENAI_API_KEY that comparators requires.
+
+# Common street suffix abbreviations and their canonical spelling
+STREET_SUFFIXES = {
+    "st": "street", "str": "street",
+    "ave": "avenue", "av": "avenue", "avn": "avenue",
+    "ct": "court", "crt": "court",
+    "rd": "road",
+    "blvd": "boulevard", "bd": "boulevard",
+    "dr": "drive", "drv": "drive",
+    "ln": "lane",
+    "pl": "place",
+    "sq": "square",
+    "ter": "terrace", "terr": "terrace",
+    "cir": "circle",
+    "hwy": "highway",
+    "pkwy": "parkway",
+    "pk": "park",
+    "trl": "trail",
+    "cres": "crescent",
+    "n": "north", "s": "south", "e": "east", "w": "west",
+}
@@ -0,0 +1,56 @@
+import contextlib
+import contextvars
+import time
+
+from ...backend.utils.metrics import Counter, Histogram
+from ...common.tracing import span
+
+# Stage timings of the current request, if someone is collecting them (see collect_stage_timings).
+# Context variables are copied into asyncio.to_thread workers, so stages that run in a worker
+# thread are recorded into the same collector as the request that started them.
+_stage_timings = contextvars.ContextVar("stage_timings", default=None)
+
+# Pipeline stages, in the order a request passes through them
+STAGES = ("decode", "preprocess", "ocr", "prompt_build", "llm", "compare")
+
+stage_seconds = Histogram("kyc_stage_seconds", "Time spent per pipeline stage.", ["stage"])
+stage_errors = Counter("kyc_stage_errors_total", "Pipeline stages that raised, by exception type.", ["stage", "error"])
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Times a pipeline stage (one of STAGES) into the kyc_stage_seconds histogram, and counts it in
+    kyc_stage_errors_total if it raises. The stage is also recorded as a tracing span.
+    For collect_stage_timings, durations of repeated stages, e.g. the header and the full-page
+    attempt, add up.
+    """
+    timings = _stage_timings.get()
+    start = time.perf_counter()
+    try:
+        with span(name):
+            yield
+    except Exception as e:
+        stage_errors.inc(stage=name, error=type(e).__name__)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        stage_seconds.observe(duration, stage=name)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + duration
+
+
+@contextlib.contextmanager
+def collect_stage_timings():
+    """
+    Collects the stage timings of everything run inside the block.
+
+    Yields:
+        dict: Filled with the seconds spent per stage name.
+    """
+    timings = {}
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
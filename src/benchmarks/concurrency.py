@@ -0,0 +1,116 @@
+"""
+Concurrency check for POST /process_document.
+
+Fires N overlapping requests at the backend app (in-process, via httpx's ASGI transport) while the
+OpenAI client is replaced by a stand-in whose completions just sleep for a fixed latency. If the
+pipeline is truly async, the N requests finish in roughly the time of the slowest one; if anything
+blocks the event loop, the total approaches the sum of all of them.
+
+Run from the repository root of a checkout with the backend requirements and Tesseract installed:
+    python -m src.benchmarks.concurrency --requests 8 --latency 1.0
+The backend image ships neither src/benchmarks nor data/documents; to run it there, mount both:
+    docker compose run --rm -v "$PWD/src/benchmarks:/app/src/benchmarks" \
+        -v "$PWD/data/documents:/app/data/documents" backend python -m src.benchmarks.concurrency
+tests/test_concurrency.py runs the same check without Tesseract, as part of the test suite.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import httpx
+
+# The backend modules refuse to import without an API key; no real call is made here.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+# Every request uploads the same sample, so the extraction cache would short-circuit the pipeline
+os.environ.setdefault("EXTRACTION_CACHE_SIZE", "0")
+
+from src.backend.api import main as backend_main
+
+SAMPLE_PATH = os.path.join("data", "documents", "scan_1.jpg")
+
+FAKE_EXTRACTION = {
+    "extracted_first_name": "John",
+    "extracted_last_name": "Smith",
+    "extracted_client_street_name": "Coventry Avenue",
+    "extracted_client_street_number": "2450",
+    "extracted_client_postal_code": "78521",
+    "extracted_client_city": "Brownsville",
+    "extracted_bank_street_name": "",
+    "extracted_bank_street_number": "",
+    "extracted_bank_postal_code": "",
+    "extracted_bank_city": "",
+    "document_date": "",
+}
+
+
+class FakeAsyncOpenAI:
+    """
+    Minimal stand-in for AsyncOpenAI: chat completions sleep for `latency` seconds and return a
+    response that matches the JSON schema that was asked for.
+    """
+
+    def __init__(self, latency, **kwargs):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        schema_name = kwargs["response_format"]["json_schema"]["name"]
+        content = {"is_verified": True} if schema_name == "comparison_schema" else FAKE_EXTRACTION
+        message = SimpleNamespace(content=json.dumps(content))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+async def _post(client, file_bytes):
+    start = time.perf_counter()
+    response = await client.post(
+        "/process_document",
+        files={"file": ("scan_1.jpg", file_bytes, "image/jpeg")},
+        data={
+            "first_name": "John",
+            "last_name": "Smith",
+            "street_name": "Coventry Avenue",
+            "street_number": "2450",
+            "postal_code": "78521",
+            "city": "Brownsville",
+        },
+    )
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run(n_requests, latency):
+    """
+    Sends one warm-up request, then `n_requests` overlapping ones, and prints the wall time of the
+    burst next to the slowest and the summed per-request latency.
+    """
+    fake_client = FakeAsyncOpenAI(latency)
+    backend_main.client = fake_client
+
+    with open(SAMPLE_PATH, "rb") as f:
+        file_bytes = f.read()
+
+    transport = httpx.ASGITransport(app=backend_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=None) as client:
+        await _post(client, file_bytes)
+
+        start = time.perf_counter()
+        durations = await asyncio.gather(*(_post(client, file_bytes) for _ in range(n_requests)))
+        wall = time.perf_counter() - start
+
+    print(f"requests:          {n_requests}")
+    print(f"wall time:         {wall:.2f}s")
+    print(f"slowest request:   {max(durations):.2f}s")
+    print(f"sum of requests:   {sum(durations):.2f}s")
+    print(f"overlap factor:    {sum(durations) / wall:.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check that overlapping /process_document requests run concurrently.")
+    parser.add_argument("--requests", type=int, default=8, help="Number of overlapping requests")
+    parser.add_argument("--latency", type=float, default=1.0, help="Simulated latency of each LLM call in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.latency))
@@ -0,0 +1,297 @@
+"""
+End-to-end benchmark of the verification pipeline on the samples in data/documents.
+
+Every sample runs through verify_document with processing='ocr' and processing='llm'. Per run the
+harness records the wall time of each stage (decode, preprocess, ocr, prompt_build, llm, compare,
+see utils/timing.py), the peak RSS of the process and the bytes sent to the LLM. With --upscale,
+the samples are re-encoded at a multiple of their resolution, to measure memory on large uploads. Results are printed
+as a table and can be written as JSON, so runs can be compared. With --baseline, the run is
+compared against an earlier JSON result and the exit code is 1 if any case got slower than
+--threshold.
+
+By default the LLM is answered in-process with the canned answers of the mock LLM server and
+--llm-latency seconds of simulated latency, so the numbers only reflect local work. Set
+OPENAI_BASE_URL to measure against the mock server or a real API instead. OCR runs inline
+(OCR_POOL_WORKERS=0), so its time and memory are measured in this process; Tesseract must be installed.
+
+Run from the repository root:
+    python -m src.benchmarks.e2e --repeat 3 --output before.json
+    python -m src.benchmarks.e2e --repeat 3 --baseline before.json
+"""
+import argparse
+import asyncio
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import threading
+import time
+from types import SimpleNamespace
+
+# The backend modules refuse to import without an API key; no real call is made with the in-process LLM.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+# Every case is repeated, so the extraction cache would short-circuit the pipeline
+os.environ.setdefault("EXTRACTION_CACHE_SIZE", "0")
+os.environ.setdefault("OCR_POOL_WORKERS", "0")
+
+from openai.types.chat import ChatCompletion
+from PIL import Image
+
+from src.backend.services.verification import verify_document, VERIFICATION_MODES
+from src.backend.utils.openai_client import get_async_openai_client, OPENAI_BASE_URL
+from src.backend.utils.timing import STAGES, collect_stage_timings
+from src.mock_llm.responses import canned_content, chat_completion, sample_user_data
+
+SAMPLES_GLOB = os.path.join("data", "documents", "*.jpg")
+PROCESSING_MODES = ("ocr", "llm")
+# Settings that change what is measured, recorded with every run
+RECORDED_SETTINGS = ("OCR_BACKEND", "OCR_PREPROCESSING", "OCR_TARGET_DPI", "OCR_MAX_LONG_EDGE", "VISION_SHORT_SIDE",
+                     "DOCUMENT_REGION", "HEADER_FRACTION", "COMPARATOR_MODE", "OPENAI_BASE_URL")
+# Differences below this many seconds are noise and never count as a regression
+MIN_REGRESSION_SECONDS = 0.005
+
+
+class InProcessLLM:
+    """
+    Async OpenAI stand-in that answers with the mock server's canned answers after `latency` seconds.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatCompletion.model_validate(chat_completion(kwargs, canned_content(kwargs)))
+
+
+class PayloadCounter:
+    """Wraps an OpenAI client and counts the chat completion calls and their request body bytes."""
+
+    def __init__(self, client, parent=None):
+        self._client = client
+        self._parent = parent
+        self.calls = 0
+        self.payload_bytes = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **options):
+        """
+        Forwards OpenAI's with_options, so create_chat_completion can disable the SDK's retries and
+        bound the HTTP timeout as it does for an unwrapped client. Calls are still counted here.
+        """
+        if not hasattr(self._client, "with_options"):
+            return self
+        return PayloadCounter(self._client.with_options(**options), parent=self._parent or self)
+
+    async def _create(self, **kwargs):
+        counter = self._parent or self
+        counter.calls += 1
+        counter.payload_bytes += len(json.dumps(kwargs))
+        return await self._client.chat.completions.create(**kwargs)
+
+
+def current_rss():
+    """
+    Returns:
+        int: The resident set size of this process in bytes (the lifetime peak where /proc is unavailable).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if platform.system() == "Darwin" else maxrss * 1024
+
+
+class PeakRSS:
+    """Samples the RSS in a background thread while the block runs and keeps the maximum."""
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.start = self.peak = 0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.start = self.peak = current_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            time.sleep(self.interval)
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def upscaled(file_bytes, factor):
+    """
+    Returns:
+        bytes: The sample re-encoded as JPEG at `factor` times its resolution (and DPI, if recorded).
+    """
+    image = Image.open(io.BytesIO(file_bytes))
+    dpi = image.info.get("dpi")
+    image = image.resize((round(image.width * factor), round(image.height * factor)), Image.LANCZOS)
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90, **({"dpi": (dpi[0] * factor, dpi[1] * factor)} if dpi else {}))
+    return buffer.getvalue()
+
+
+async def run_case(client, file_bytes, user_data, processing, mode):
+    """
+    Returns:
+        dict: Wall time, seconds per stage, RSS, LLM calls and payload bytes of one verification.
+    """
+    counter = PayloadCounter(client)
+    error = None
+    with PeakRSS() as rss, collect_stage_timings() as timings:
+        start = time.perf_counter()
+        try:
+            result = await verify_document(counter, file_bytes, user_data, processing=processing, mode=mode)
+        except Exception as e:
+            result, error = None, str(e)
+        wall = time.perf_counter() - start
+    return {
+        "wall": wall,
+        "stages": {name: timings.get(name, 0.0) for name in STAGES},
+        "peak_rss_mb": rss.peak / 2**20,
+        "rss_increase_mb": (rss.peak - rss.start) / 2**20,
+        "llm_calls": counter.calls,
+        "payload_bytes": counter.payload_bytes,
+        "is_verified": result["is_verified"] if result else None,
+        "error": error,
+    }
+
+
+async def run(samples, processing_modes, verification_modes, repeat, client, upscale=1.0):
+    results = []
+    for path in samples:
+        sample = os.path.basename(path)
+        with open(path, "rb") as f:
+            file_bytes = f.read()
+        if upscale != 1.0:
+            file_bytes = upscaled(file_bytes, upscale)
+        user_data = sample_user_data(sample)
+        for processing in processing_modes:
+            for mode in verification_modes:
+                # Warm-up run: imports, engine start-up and first-use allocations are not measured
+                await run_case(client, file_bytes, user_data, processing, mode)
+                runs = [await run_case(client, file_bytes, user_data, processing, mode) for _ in range(repeat)]
+                results.append({
+                    "sample": sample,
+                    "processing": processing,
+                    "mode": mode,
+                    "upload_bytes": len(file_bytes),
+                    "wall": statistics.median(r["wall"] for r in runs),
+                    "stages": {name: statistics.median(r["stages"][name] for r in runs) for name in STAGES},
+                    "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+                    "rss_increase_mb": max(r["rss_increase_mb"] for r in runs),
+                    "llm_calls": runs[-1]["llm_calls"],
+                    "payload_bytes": runs[-1]["payload_bytes"],
+                    "is_verified": runs[-1]["is_verified"],
+                    "error": runs[-1]["error"],
+                })
+    return results
+
+
+def run_metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "repeat": args.repeat,
+        "upscale": args.upscale,
+        "llm": OPENAI_BASE_URL or f"in-process ({args.llm_latency}s latency)",
+        "settings": {name: os.getenv(name) for name in RECORDED_SETTINGS},
+    }
+
+
+def print_results(results):
+    print(f"{'sample':<12} {'proc':<4} {'mode':<11} {'wall ms':>8} "
+          + " ".join(f"{name[:8] + ' ms':>11}" for name in STAGES)
+          + f" {'rss MB':>7} {'+rss MB':>7} {'calls':>5} {'payload KB':>10}")
+    for r in results:
+        if r["error"]:
+            print(f"{r['sample']:<12} {r['processing']:<4} {r['mode']:<11} error: {r['error']}")
+            continue
+        print(f"{r['sample']:<12} {r['processing']:<4} {r['mode']:<11} {r['wall'] * 1000:>8.1f} "
+              + " ".join(f"{r['stages'][name] * 1000:>11.1f}" for name in STAGES)
+              + f" {r['peak_rss_mb']:>7.0f} {r['rss_increase_mb']:>7.1f} {r['llm_calls']:>5} {r['payload_bytes'] / 1024:>10.1f}")
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """
+    Prints the wall time change per case against the baseline.
+
+    Returns:
+        list: The (sample, processing, mode) keys of cases that got slower than `threshold` allows.
+    """
+    previous = {(r["sample"], r["processing"], r["mode"]): r for r in baseline["results"] if not r["error"]}
+    regressions = []
+    print(f"\ncompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for r in results:
+        key = (r["sample"], r["processing"], r["mode"])
+        if r["error"] or key not in previous:
+            continue
+        before, after = previous[key]["wall"], r["wall"]
+        change = (after - before) / before if before else 0.0
+        regressed = after - before > MIN_REGRESSION_SECONDS and change > threshold
+        slowest = max(STAGES, key=lambda name: r["stages"][name] - previous[key]["stages"].get(name, 0.0))
+        note = f"  REGRESSION (most added time in '{slowest}')" if regressed else ""
+        print(f"  {' '.join(key):<30} {before * 1000:>8.1f} -> {after * 1000:>8.1f} ms ({change:+.0%}){note}")
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the verification pipeline end to end, per stage.")
+    parser.add_argument("--repeat", type=int, default=3, help="Measured runs per case; the median is reported")
+    parser.add_argument("--processing", nargs="+", choices=PROCESSING_MODES, default=list(PROCESSING_MODES))
+    parser.add_argument("--modes", nargs="+", choices=VERIFICATION_MODES, default=["two_call"],
+                        help="Verification modes to run")
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="Simulated latency of the in-process LLM in seconds (ignored with OPENAI_BASE_URL)")
+    parser.add_argument("--upscale", type=float, default=1.0,
+                        help="Re-encode the samples at this multiple of their resolution, e.g. 3 for large scans")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative wall time increase that counts as a regression")
+    args = parser.parse_args()
+
+    client = get_async_openai_client() if OPENAI_BASE_URL else InProcessLLM(args.llm_latency)
+    results = asyncio.run(run(sorted(glob.glob(SAMPLES_GLOB)), args.processing, args.modes, args.repeat, client,
+                              args.upscale))
+    print_results(results)
+
+    report = {"meta": run_metadata(args), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+            raise SystemExit(1)
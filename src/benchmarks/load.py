@@ -0,0 +1,214 @@
+"""
+Load test for a running backend (POST /process_document) or frontend (POST /submit).
+
+Replays the samples in data/documents, each with user data that matches the sample, at a series
+of load levels: either a target request rate (open loop, requests are sent on schedule whether or
+not earlier ones have finished) or a number of concurrent clients (closed loop, each client sends
+its next request when the previous one is answered). Every level runs for --duration seconds and
+reports throughput, error rate and p50/p95/p99 latency; together the levels form the throughput
+curve of the service. With --output, the results and a per-second timeline are written as JSON.
+
+For deterministic capacity planning, point the backend at the mock LLM server with a fixed seed.
+The samples repeat, so disable the extraction cache unless cache hits are what you want to measure:
+    MOCK_SEED=1 uvicorn src.mock_llm.main:app --port 8080
+    OPENAI_BASE_URL=http://localhost:8080/v1 EXTRACTION_CACHE_SIZE=0 uvicorn src.backend.api.main:app --port 8000
+
+Run from the repository root:
+    python -m src.benchmarks.load --rps 1 2 4 8 --duration 30
+    python -m src.benchmarks.load --concurrency 1 4 16 --target frontend --url http://localhost:9000
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import json
+import math
+import os
+import time
+
+import httpx
+
+from src.mock_llm.responses import sample_user_data
+
+SAMPLES_GLOB = os.path.join("data", "documents", "*.jpg")
+# Path and form field prefix of the endpoint under test
+TARGETS = {
+    "backend": ("/process_document", ""),
+    "frontend": ("/submit", "user_"),
+}
+
+
+def percentile(values, q):
+    """
+    Returns:
+        float or None: The nearest-rank `q` percentile (0-100) of `values`, None if there are none.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def load_samples():
+    """
+    Returns:
+        list: (file name, file bytes, user data) of every sample document.
+    """
+    samples = []
+    for path in sorted(glob.glob(SAMPLES_GLOB)):
+        name = os.path.basename(path)
+        with open(path, "rb") as f:
+            samples.append((name, f.read(), sample_user_data(name)))
+    if not samples:
+        raise Exception(f"No sample documents found at {SAMPLES_GLOB}")
+    return samples
+
+
+class LoadRun:
+    """Sends requests for one load level and records their outcome."""
+
+    def __init__(self, client, target, samples, mode):
+        self.client = client
+        self.path, self.prefix = TARGETS[target]
+        self.samples = itertools.cycle(samples)
+        self.mode = mode
+        self.records = []
+
+    async def send(self):
+        name, file_bytes, user_data = next(self.samples)
+        data = {self.prefix + field: value for field, value in user_data.items()}
+        if self.mode:
+            data["mode"] = self.mode
+        start = time.perf_counter()
+        try:
+            response = await self.client.post(self.path, files={"file": (name, file_bytes, "image/jpeg")}, data=data)
+            error = f"HTTP {response.status_code}" if response.status_code >= 400 else None
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        self.records.append({"start": start, "latency": time.perf_counter() - start, "error": error})
+
+
+async def run_rps(run, rps, duration):
+    """Open loop: starts a request every 1/rps seconds for `duration` seconds, then waits for all of them."""
+    start = time.perf_counter()
+    tasks = []
+    for i in range(int(rps * duration)):
+        delay = start + i / rps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run.send()))
+    await asyncio.gather(*tasks)
+
+
+async def run_concurrency(run, concurrency, duration):
+    """Closed loop: `concurrency` clients send requests back to back until `duration` seconds have passed."""
+    end = time.perf_counter() + duration
+
+    async def client_loop():
+        while time.perf_counter() < end:
+            await run.send()
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+
+
+def summarize(records, level, elapsed):
+    """
+    Returns:
+        dict: Request counts, error rate, throughput and latency percentiles of one load level.
+            Percentiles are over successful requests only; failures are often fast and would hide slowness.
+    """
+    latencies = [r["latency"] for r in records if not r["error"]]
+    errors = {}
+    for r in records:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    first = min((r["start"] for r in records), default=0.0)
+    timeline = {}
+    for r in records:
+        second = int(r["start"] + r["latency"] - first)
+        timeline.setdefault(second, {"completed": 0, "errors": 0})
+        timeline[second]["errors" if r["error"] else "completed"] += 1
+    return {
+        "level": level,
+        "requests": len(records),
+        "succeeded": len(latencies),
+        "error_rate": (len(records) - len(latencies)) / len(records) if records else 0.0,
+        "errors": errors,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies, default=None),
+        "timeline": [{"second": second, **counts} for second, counts in sorted(timeline.items())],
+    }
+
+
+async def run(url, target, levels, by_rps, duration, warmup, mode, timeout):
+    samples = load_samples()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        if warmup:
+            # One request per sample: connections, model loading and caches of the service
+            warmup_run = LoadRun(client, target, samples, mode)
+            await asyncio.gather(*(warmup_run.send() for _ in samples))
+        results = []
+        print_header("rps" if by_rps else "clients")
+        for level in levels:
+            load_run = LoadRun(client, target, samples, mode)
+            start = time.perf_counter()
+            if by_rps:
+                await run_rps(load_run, level, duration)
+            else:
+                await run_concurrency(load_run, int(level), duration)
+            summary = summarize(load_run.records, level, time.perf_counter() - start)
+            print_summary(summary)
+            results.append(summary)
+    return results
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:>8.0f}" if seconds is not None else f"{'-':>8}"
+
+
+def print_header(unit):
+    print(f"{unit:>8} {'requests':>8} {'ok/s':>7} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+
+
+def print_summary(summary):
+    print(f"{summary['level']:>8g} {summary['requests']:>8} {summary['throughput']:>7.2f} {summary['error_rate']:>7.1%} "
+          f"{_ms(summary['p50'])} {_ms(summary['p95'])} {_ms(summary['p99'])} {_ms(summary['max'])}"
+          + (f"  {summary['errors']}" if summary["errors"] else ""))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test /process_document or the frontend's /submit.")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the service under test")
+    parser.add_argument("--target", choices=TARGETS, default="backend")
+    load = parser.add_mutually_exclusive_group(required=True)
+    load.add_argument("--rps", type=float, nargs="+", help="Target request rates, one load level each")
+    load.add_argument("--concurrency", type=int, nargs="+", help="Numbers of concurrent clients, one load level each")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per load level")
+    parser.add_argument("--mode", help="Verification mode sent with every request (backend default if omitted)")
+    parser.add_argument("--timeout", type=float, default=120, help="Client timeout per request in seconds")
+    parser.add_argument("--no-warmup", dest="warmup", action="store_false", help="Skip the warm-up requests")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    levels = args.rps or args.concurrency
+    results = asyncio.run(run(args.url, args.target, levels, bool(args.rps), args.duration, args.warmup,
+                              args.mode, args.timeout))
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "url": args.url,
+                "target": args.target,
+                "load": "rps" if args.rps else "concurrency",
+                "duration": args.duration,
+                "mode": args.mode,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
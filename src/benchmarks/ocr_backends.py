@@ -0,0 +1,70 @@
+"""
+Benchmark of the OCR backends behind ocr_img_processing.
+
+Runs every sample in data/documents through ocr_img_processing once per backend and repetition,
+and prints per-backend latency next to the amount of text that was recognised.
+
+Run from the repository root:
+    python -m src.benchmarks.ocr_backends --backends pytesseract tesserocr --workers 2 --repeat 3
+"""
+import argparse
+import glob
+import os
+import statistics
+import time
+
+from src.backend.utils.ocr_engines import OCR_ENGINES
+from src.backend.utils.ocr_img_processing import ocr_img_processing
+from src.backend.utils.ocr_pool import OCRPool
+
+SAMPLES_GLOB = os.path.join("data", "documents", "*.jpg")
+
+
+def benchmark_backend(backend, workers, repeat, samples):
+    """
+    Returns:
+        dict: Latency statistics (in seconds) and the number of OCR'd characters for one backend.
+    """
+    pool = OCRPool(workers=workers, backend=backend)
+    try:
+        # Warm-up run, so process start-up and model loading are not counted for persistent backends
+        ocr_img_processing(None, samples[0][1], pool=pool)
+
+        durations = []
+        characters = 0
+        for _ in range(repeat):
+            for _, file_bytes in samples:
+                start = time.perf_counter()
+                messages = ocr_img_processing(None, file_bytes, pool=pool)
+                durations.append(time.perf_counter() - start)
+                characters += len(messages[-1]["content"])
+    finally:
+        pool.shutdown()
+
+    return {
+        "backend": backend,
+        "runs": len(durations),
+        "mean": statistics.mean(durations),
+        "p50": statistics.median(durations),
+        "max": max(durations),
+        "characters_per_run": characters // len(durations),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare OCR backends on the sample documents.")
+    parser.add_argument("--backends", nargs="+", default=list(OCR_ENGINES), choices=list(OCR_ENGINES))
+    parser.add_argument("--workers", type=int, default=1, help="OCR worker processes (0 runs inline)")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the sample documents")
+    args = parser.parse_args()
+
+    samples = []
+    for path in sorted(glob.glob(SAMPLES_GLOB)):
+        with open(path, "rb") as f:
+            samples.append((os.path.basename(path), f.read()))
+
+    print(f"{'backend':<12} {'runs':>5} {'mean':>8} {'p50':>8} {'max':>8} {'chars':>7}")
+    for backend in args.backends:
+        result = benchmark_backend(backend, args.workers, args.repeat, samples)
+        print(f"{result['backend']:<12} {result['runs']:>5} {result['mean']:>7.3f}s {result['p50']:>7.3f}s "
+              f"{result['max']:>7.3f}s {result['characters_per_run']:>7}")
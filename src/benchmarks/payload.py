@@ -0,0 +1,96 @@
+"""
+Before/after measurement of the resolution-aware downscaling on the samples in data/documents.
+
+- 'llm' processing: time spent in llm_img_processing, size of the request payload (base64 JPEG in the
+  messages) and the estimated upload time at a given bandwidth.
+- 'ocr' processing: time to decode and preprocess the image, and the number of pixels handed to Tesseract.
+  With --ocr, the full ocr_img_processing (including Tesseract, run inline) is timed as well.
+- --region header measures the header-only processing (see layout.py) instead of the full page.
+
+Run from the repository root:
+    python -m src.benchmarks.payload --repeat 5 --bandwidth-mbps 20
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import time
+
+from src.backend.utils.llm_img_processing import llm_img_processing
+from src.backend.utils.ocr_img_processing import ocr_img_processing
+from src.backend.utils.ocr_pool import OCRPool
+from src.backend.utils.layout import crop_to_header
+from src.backend.utils.preprocessing import (
+    ocr_pipeline, ocr_target_size, open_image, run_pipeline, vision_image_tokens
+)
+
+SAMPLES_GLOB = os.path.join("data", "documents", "*.jpg")
+
+
+def _mean_seconds(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def measure_llm(file_bytes, downscale, repeat, region):
+    seconds, messages = _mean_seconds(
+        lambda: llm_img_processing(None, file_bytes, downscale=downscale, region=region), repeat
+    )
+    image_url = messages[0]["content"][1]["image_url"]["url"]
+    uploaded = open_image(base64.b64decode(image_url.split(",", 1)[1]))
+    return {
+        "seconds": seconds,
+        "payload_bytes": len(json.dumps(messages)),
+        "image_tokens": vision_image_tokens(*uploaded.size),
+    }
+
+
+def measure_ocr(file_bytes, downscale, repeat, pool, region):
+    def preprocess():
+        image = open_image(file_bytes, ocr_target_size if downscale else None)
+        image = run_pipeline(image, ocr_pipeline)
+        return crop_to_header(image) if region == 'header' else image
+
+    seconds, image = _mean_seconds(preprocess, repeat)
+    result = {"seconds": seconds, "pixels": image.width * image.height}
+    if pool is not None:
+        result["ocr_seconds"], _ = _mean_seconds(
+            lambda: ocr_img_processing(None, file_bytes, pool=pool, downscale=downscale, region=region), repeat
+        )
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure payload size and latency with and without downscaling.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per sample; timings are averaged")
+    parser.add_argument("--bandwidth-mbps", type=float, default=20.0, help="Uplink bandwidth for the upload estimate")
+    parser.add_argument("--ocr", action="store_true", help="Also time the full OCR path (requires Tesseract)")
+    parser.add_argument("--region", choices=["full", "header"], default="full", help="Page region that is processed")
+    args = parser.parse_args()
+
+    pool = OCRPool(workers=0) if args.ocr else None
+    bytes_per_second = args.bandwidth_mbps * 1e6 / 8
+    totals = {False: 0, True: 0}
+
+    print(f"{'sample':<12} {'mode':<9} {'llm ms':>8} {'payload KB':>11} {'upload ms':>10} {'tokens':>7} "
+          f"{'ocr prep ms':>12} {'ocr Mpx':>8}" + (f" {'ocr ms':>8}" if args.ocr else ""))
+    for path in sorted(glob.glob(SAMPLES_GLOB)):
+        with open(path, "rb") as f:
+            file_bytes = f.read()
+        for downscale in (False, True):
+            llm = measure_llm(file_bytes, downscale, args.repeat, args.region)
+            ocr = measure_ocr(file_bytes, downscale, args.repeat, pool, args.region)
+            totals[downscale] += llm["payload_bytes"]
+            line = (f"{os.path.basename(path):<12} {'after' if downscale else 'before':<9} "
+                    f"{llm['seconds'] * 1000:>8.1f} {llm['payload_bytes'] / 1024:>11.1f} "
+                    f"{llm['payload_bytes'] / bytes_per_second * 1000:>10.1f} {llm['image_tokens']:>7} "
+                    f"{ocr['seconds'] * 1000:>12.1f} {ocr['pixels'] / 1e6:>8.2f}")
+            if args.ocr:
+                line += f" {ocr['ocr_seconds'] * 1000:>8.1f}"
+            print(line)
+
+    print(f"\ntotal llm payload: before {totals[False] / 1024:.1f} KB, after {totals[True] / 1024:.1f} KB "
+          f"({(1 - totals[True] / totals[False]) * 100:.0f}% smaller)")
@@ -0,0 +1,76 @@
+"""
+Per-stage benchmark of the OCR preprocessing pipelines on the samples in data/documents.
+
+For every pipeline, prints the CPU time per stage and sample. With --ocr, the preprocessed images are
+also run through Tesseract and the recognised text is scored. The score is the number of word-like
+tokens, a cheap proxy for OCR quality that does not need ground truth. 'legacy' is the PIL chain
+(RGB conversion plus contrast enhancement), the default OCR_PREPROCESSING and the baseline a NumPy
+pipeline has to beat on both time and words before it becomes the default.
+
+Run from the repository root:
+    python -m src.benchmarks.preprocessing --pipelines legacy grayscale,otsu grayscale,denoise,otsu,deskew --ocr
+"""
+import argparse
+import glob
+import os
+import re
+
+from PIL import Image
+
+from src.backend.utils.preprocessing import build_pipeline, run_pipeline
+
+SAMPLES_GLOB = os.path.join("data", "documents", "*.jpg")
+WORD_PATTERN = re.compile(r"[A-Za-z]{3,}|\d{2,}")
+
+
+def ocr_score(image):
+    import pytesseract
+    text = pytesseract.image_to_string(image)
+    return len(WORD_PATTERN.findall(text))
+
+
+def benchmark(spec, samples, repeat, run_ocr):
+    """
+    Returns:
+        list: One row per sample with the mean seconds per stage and, optionally, the OCR score.
+    """
+    stages = build_pipeline(spec)
+    rows = []
+    for name, image in samples:
+        timings = {}
+        for _ in range(repeat):
+            output = run_pipeline(image, stages, timings=timings)
+        row = {"sample": name, **{stage: seconds / repeat for stage, seconds in timings.items()}}
+        row["total"] = sum(seconds for stage, seconds in row.items() if stage != "sample")
+        if run_ocr:
+            row["words"] = ocr_score(output)
+        rows.append(row)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark OCR preprocessing pipelines per stage.")
+    parser.add_argument("--pipelines", nargs="+", default=["legacy", "grayscale,denoise,otsu,deskew"],
+                        help="Comma-separated stage lists, or 'legacy' for the PIL chain")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per sample; timings are averaged")
+    parser.add_argument("--ocr", action="store_true", help="Also OCR the output and count recognised words")
+    args = parser.parse_args()
+
+    samples = []
+    for path in sorted(glob.glob(SAMPLES_GLOB)):
+        image = Image.open(path)
+        image.load()
+        samples.append((os.path.basename(path), image))
+
+    for spec in args.pipelines:
+        rows = benchmark(spec, samples, args.repeat, args.ocr)
+        print(f"\npipeline: {spec}")
+        for row in rows:
+            timings = "  ".join(
+                f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in row.items() if stage not in ("sample", "words")
+            )
+            words = f"  words={row['words']}" if "words" in row else ""
+            print(f"  {row['sample']:<12} {timings}{words}")
+        total = sum(row["total"] for row in rows)
+        words = f", {sum(row['words'] for row in rows)} words" if args.ocr else ""
+        print(f"  {'all':<12} total={total * 1000:.1f}ms{words}")
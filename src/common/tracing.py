@@ -0,0 +1,245 @@
+"""
+Lightweight tracing with W3C trace context propagation, shared by the frontend and the backend.
+
+A trace follows one user request across services: the frontend's /submit, its httpx call to the
+backend, and the backend's pipeline stages and OpenAI calls. Spans are recorded like
+OpenTelemetry spans (trace id, span id, parent span id, name, start, duration, status,
+attributes). The trace context travels between services in the `traceparent` header.
+
+Spans of a request are buffered until its local root span (the request's server span) ends. Then
+a tail sampling decision keeps the trace if it was slow (TRACE_SLOW_SECONDS), failed, or falls
+into the random TRACE_SAMPLE_RATE share. Each service decides for its own part of the trace.
+The random share is derived from the trace id, so frontend and backend keep the same traces.
+Spans that end after their root (e.g. work cancelled after a client disconnected) follow the
+decision made for their trace and are exported on their own. Buffers whose root never ends are
+dropped after a while, so nothing accumulates.
+"""
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Where kept traces go: 'none' (tracing off), 'console' (a span tree per trace on stderr) or 'file' (JSON lines).
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none")
+# File the 'file' exporter appends spans to, one JSON object per line.
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+# Traces at least this slow (in seconds) are always kept.
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "5"))
+# Share of the remaining successful traces that is kept anyway, as a baseline for comparison.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Finished spans per trace id, until the trace's local root span ends, with the time the first one ended
+_pending = {}
+# Sampling decisions of recently finished traces, for spans that end after their root
+_decided = collections.OrderedDict()
+_lock = threading.Lock()
+# Seconds after which the spans of a trace whose root never ended are dropped
+_PENDING_MAX_AGE = 600
+# Sampling decisions remembered for late spans
+_MAX_DECIDED = 10_000
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, local_root, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.local_root = local_root
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+def parse_traceparent(value):
+    """
+    Returns:
+        tuple or None: (trace id, parent span id) of a valid `traceparent` header value, else None.
+    """
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if not match or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    return match.group(1), match.group(2)
+
+
+def current_traceparent():
+    """
+    Returns:
+        str or None: The `traceparent` header value that continues the current span in another service.
+    """
+    current = _current_span.get()
+    if current is None:
+        return None
+    return f"00-{current.trace_id}-{current.span_id}-01"
+
+
+def inject(headers=None):
+    """
+    Adds the `traceparent` of the current span to `headers`, for outgoing HTTP requests.
+
+    Returns:
+        dict: The headers.
+    """
+    headers = dict(headers or {})
+    traceparent = current_traceparent()
+    if traceparent:
+        headers["traceparent"] = traceparent
+    return headers
+
+
+@contextlib.contextmanager
+def span(name, traceparent=None, **attributes):
+    """
+    Records a span around the block, as a child of the current span. Without a current span it
+    starts a local root: continuing the trace of `traceparent` (from an incoming request) if given,
+    otherwise a new trace. When tracing is off (TRACE_EXPORTER=none) this only costs a context lookup.
+
+    Yields:
+        Span or None: The span, e.g. to add attributes; None when tracing is off.
+    """
+    if TRACE_EXPORTER == "none":
+        yield None
+        return
+
+    parent = _current_span.get()
+    if parent is not None:
+        current = Span(name, parent.trace_id, parent.span_id, False, attributes)
+    else:
+        remote = parse_traceparent(traceparent)
+        trace_id, parent_id = remote or (secrets.token_hex(16), None)
+        current = Span(name, trace_id, parent_id, True, attributes)
+
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_span.reset(token)
+        _finish(current)
+
+
+def _finish(finished):
+    with _lock:
+        keep = _decided.get(finished.trace_id)
+        if keep is None:
+            now = time.monotonic()
+            _, spans = _pending.setdefault(finished.trace_id, (now, []))
+            spans.append(finished)
+            if not finished.local_root:
+                _evict_stale(now)
+                return
+            del _pending[finished.trace_id]
+    if keep is not None:
+        # A span that ended after its root: exported on its own if the trace was kept
+        if keep:
+            _export([finished])
+        return
+    keep = _keep(finished, spans)
+    with _lock:
+        _decided[finished.trace_id] = keep
+        while len(_decided) > _MAX_DECIDED:
+            _decided.popitem(last=False)
+    if keep:
+        _export(spans)
+
+
+def _evict_stale(now):
+    # Buffers are in the order their first span ended, so only the oldest ones need checking
+    while _pending:
+        trace_id, (started, _) = next(iter(_pending.items()))
+        if now - started < _PENDING_MAX_AGE:
+            return
+        del _pending[trace_id]
+
+
+def _keep(root, spans):
+    """Tail sampling: slow or failed traces, plus a share of the rest chosen by trace id."""
+    if root.duration >= TRACE_SLOW_SECONDS or any(s.error for s in spans):
+        return True
+    return int(root.trace_id[-8:], 16) / 0xFFFFFFFF < TRACE_SAMPLE_RATE
+
+
+def _export(spans):
+    if TRACE_EXPORTER == "file":
+        lines = "".join(json.dumps(s.to_dict()) + "\n" for s in spans)
+        with _lock, open(TRACE_FILE, "a") as f:
+            f.write(lines)
+    elif TRACE_EXPORTER == "console":
+        children = {}
+        for s in spans:
+            children.setdefault(s.parent_id, []).append(s)
+        root = spans[-1]
+        lines = [f"trace {root.trace_id} ({root.duration * 1000:.1f} ms)"]
+
+        def add(s, depth):
+            offset = (s.start - root.start) * 1000
+            status = f" ERROR {s.error}" if s.error else ""
+            lines.append(f"{'  ' * depth}{s.name}  +{offset:.1f} ms  {s.duration * 1000:.1f} ms{status}")
+            for child in sorted(children.get(s.span_id, []), key=lambda c: c.start):
+                add(child, depth + 1)
+
+        add(root, 1)
+        print("\n".join(lines), file=sys.stderr)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that records a server span per HTTP request, continuing the trace of the
+    incoming `traceparent` header. The span covers the whole response, including streamed bodies.
+    """
+
+    def __init__(self, app, service):
+        self.app = app
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or TRACE_EXPORTER == "none":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode("latin-1")
+        name = f"{scope['method']} {scope['path']}"
+        with span(name, traceparent=traceparent, service=self.service) as server_span:
+            async def send_with_status(message):
+                if message["type"] == "http.response.start":
+                    server_span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        server_span.error = f"HTTP {message['status']}"
+                await send(message)
+
+            await self.app(scope, receive, send_with_status)
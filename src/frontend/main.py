@@ -1,15 +1,124 @@
-from fastapi import FastAPI, Request, Form, UploadFile, File
-from fastapi.responses import HTMLResponse
+from contextlib import asynccontextmanager
+import os
+import secrets
+
+from fastapi import FastAPI, Request, Form, UploadFile, File, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 import httpx
 import uvicorn
 
-app = FastAPI()
-templates = Jinja2Templates(directory="/app/src/frontend/templates")
+from src.common.tracing import TracingMiddleware, inject, span
 
 # API endpoint for the backend service
 API_URL = "http://backend:8000/process_document"
 
+# Connection pool towards the backend. Keep-alive connections are reused across submissions,
+# so a form post doesn't pay for a new TCP connection.
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "100"))
+BACKEND_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("BACKEND_MAX_KEEPALIVE_CONNECTIONS", "20"))
+BACKEND_KEEPALIVE_EXPIRY = float(os.getenv("BACKEND_KEEPALIVE_EXPIRY", "60"))
+# Timeouts in seconds. Connecting should be fast; the response takes OCR plus up to two LLM calls,
+# so reading waits longer than the backend's own OpenAI timeout.
+BACKEND_CONNECT_TIMEOUT = float(os.getenv("BACKEND_CONNECT_TIMEOUT", "5"))
+BACKEND_READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", "150"))
+# Retries of requests that failed to connect. The backend never saw them, so they are safe to repeat.
+BACKEND_CONNECT_RETRIES = int(os.getenv("BACKEND_CONNECT_RETRIES", "3"))
+# Largest accepted form submission in bytes (statement plus form fields), enforced while it is received.
+FRONTEND_MAX_UPLOAD_BYTES = int(os.getenv("FRONTEND_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# Size of the chunks an upload is forwarded to the backend in
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def create_backend_client():
+    """
+    Returns:
+        httpx.AsyncClient: Client with a keep-alive connection pool for the calls to the backend.
+    """
+    return httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(
+            retries=BACKEND_CONNECT_RETRIES,
+            limits=httpx.Limits(
+                max_connections=BACKEND_MAX_CONNECTIONS,
+                max_keepalive_connections=BACKEND_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=BACKEND_KEEPALIVE_EXPIRY,
+            ),
+        ),
+        timeout=httpx.Timeout(BACKEND_READ_TIMEOUT, connect=BACKEND_CONNECT_TIMEOUT),
+    )
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware that rejects request bodies larger than `max_bytes` with a 413: up front if the
+    Content-Length says so, otherwise as soon as the received body exceeds the limit, so an
+    oversized upload is never read completely.
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope.get("headers") or []).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = JSONResponse({"detail": f"Upload exceeds {self.max_bytes} bytes."}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised while the form is parsed; FastAPI turns it into the response
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds {self.max_bytes} bytes.")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _quote(value):
+    # Form-data header parameters can't contain quotes or line breaks
+    return value.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+async def multipart_body(fields, file, boundary):
+    """
+    Yields a multipart/form-data body with the text `fields` and the upload `file`, reading the file in
+    UPLOAD_CHUNK_SIZE chunks. Starlette spools uploads above 1 MB to disk, so an upload in flight
+    takes at most that spool buffer plus one chunk of memory, whatever the document's size.
+    """
+    for name, value in fields.items():
+        yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'
+               f'{value}\r\n').encode()
+    yield (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{_quote(file.filename or "upload")}"\r\n'
+           f'Content-Type: {_quote(file.content_type or "application/octet-stream")}\r\n\r\n').encode()
+    await file.seek(0)
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+    yield f'\r\n--{boundary}--\r\n'.encode()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One client for the lifetime of the app, closed (with its connections) on shutdown
+    app.state.backend_client = create_backend_client()
+    yield
+    await app.state.backend_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+# A span per request; the trace continues in the backend via the traceparent header
+app.add_middleware(TracingMiddleware, service="frontend")
+app.add_middleware(UploadLimitMiddleware, max_bytes=FRONTEND_MAX_UPLOAD_BYTES)
+templates = Jinja2Templates(directory="/app/src/frontend/templates")
+
 @app.get('/', response_class=HTMLResponse)
 async def index(request: Request):
     """
@@ -52,29 +161,29 @@ async def submit(
     
     Note:
         The function performs the following steps:
-        1. Reads the uploaded file
-        2. Sends the file and user data to the backend API
-        3. Returns the processed results to the user
+        1. Streams the uploaded file and user data to the backend API, chunk by chunk
+        2. Returns the processed results to the user
+        Uploads larger than FRONTEND_MAX_UPLOAD_BYTES are rejected with a 413 while they are received.
     """
-    # Read the contents of the uploaded file
-    file_bytes = await file.read()
+    fields = {
+        # User personal information
+        "first_name": user_first_name,
+        "last_name": user_last_name,
+        # User address information
+        "street_name": user_street_name,
+        "street_number": user_street_number,
+        "postal_code": user_postal_code,
+        "city": user_city,
+    }
+    boundary = secrets.token_hex(16)
 
-    # Make a POST request to the backend API
-    async with httpx.AsyncClient() as client:
-        # Send both the file and form data to the backend for processing
-        response = await client.post(
+    # Make a POST request to the backend API over the shared connection pool.
+    # Send both the file and form data to the backend for processing, in a span that is continued by the backend
+    with span("POST /process_document", peer="backend"):
+        response = await request.app.state.backend_client.post(
             API_URL,
-            files={'file': (file.filename, file_bytes, file.content_type)},
-            data={
-                # User personal information
-                "first_name": user_first_name,
-                "last_name": user_last_name,
-                # User address information
-                "street_name": user_street_name,
-                "street_number": user_street_number,
-                "postal_code": user_postal_code,
-                "city": user_city,
-            }
+            headers=inject({"Content-Type": f"multipart/form-data; boundary={boundary}"}),
+            content=multipart_body(fields, file, boundary),
         )
 
     # Parse the JSON response from the backend
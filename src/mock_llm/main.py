@@ -0,0 +1,316 @@
+"""
+Local stand-in for the parts of the OpenAI API the backend uses, so it can be load-tested and
+benchmarked without network access or cost. Point the backend at it with
+OPENAI_BASE_URL=http://localhost:8080/v1.
+
+- Chat completions: POST /v1/chat/completions answers the JSON-schema requests of the extraction,
+  single-call verification and comparison prompts with canned answers for the samples in
+  data/documents (see responses.py), after a latency drawn from MOCK_LATENCY_DISTRIBUTION.
+  MOCK_ERROR_RATE, MOCK_RATE_LIMIT_RATE and MOCK_TIMEOUT_RATE inject 500s, 429s and hanging requests.
+- Files: POST /v1/files, GET /v1/files/{id}, GET /v1/files/{id}/content
+- Batches: POST /v1/batches, GET /v1/batches/{id}, POST /v1/batches/{id}/cancel.
+  A batch is processed in the background after MOCK_BATCH_DELAY seconds; every request line gets
+  a canned answer, or an error with probability MOCK_BATCH_ERROR_RATE.
+- GET /mock/stats reports request, error and latency counters; GET/PUT /mock/config reads and
+  changes the latency and error settings at runtime, e.g. between load-test scenarios.
+
+    uvicorn src.mock_llm.main:app --port 8080
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import time
+import uuid
+from collections import deque
+
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+
+from src.mock_llm.responses import canned_content, chat_completion
+
+# Latency of chat completions: 'fixed' (always the median), 'uniform' (0 to twice the median),
+# 'exponential' or 'lognormal' (median and MOCK_LATENCY_SIGMA), in seconds.
+MOCK_LATENCY_DISTRIBUTION = os.getenv("MOCK_LATENCY_DISTRIBUTION", "lognormal")
+MOCK_LATENCY_MEDIAN = float(os.getenv("MOCK_LATENCY_MEDIAN", "0.8"))
+MOCK_LATENCY_SIGMA = float(os.getenv("MOCK_LATENCY_SIGMA", "0.4"))
+# Extra seconds per 1000 prompt tokens, so larger prompts (e.g. full-page images) take longer.
+MOCK_LATENCY_PER_1K_TOKENS = float(os.getenv("MOCK_LATENCY_PER_1K_TOKENS", "0.2"))
+# Upper bound of a single latency sample, in seconds.
+MOCK_LATENCY_MAX = float(os.getenv("MOCK_LATENCY_MAX", "30"))
+# Fractions of chat completions that fail with a 500, are rate limited with a 429, or hang (0..1).
+MOCK_ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", "0"))
+MOCK_RATE_LIMIT_RATE = float(os.getenv("MOCK_RATE_LIMIT_RATE", "0"))
+MOCK_TIMEOUT_RATE = float(os.getenv("MOCK_TIMEOUT_RATE", "0"))
+# Seconds a hanging request waits before it is answered; longer than the client timeout.
+MOCK_TIMEOUT_SECONDS = float(os.getenv("MOCK_TIMEOUT_SECONDS", "120"))
+# Seed of the random generator, for reproducible latency and error sequences. Unset seeds randomly.
+MOCK_SEED = os.getenv("MOCK_SEED")
+
+# Seconds a batch stays 'in_progress' before its results are available.
+MOCK_BATCH_DELAY = float(os.getenv("MOCK_BATCH_DELAY", "1"))
+# Fraction of batch requests that fail with a server error (0..1).
+MOCK_BATCH_ERROR_RATE = float(os.getenv("MOCK_BATCH_ERROR_RATE", "0"))
+
+app = FastAPI(title='Mock LLM API')
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+# Settings that can be changed at runtime via PUT /mock/config
+config = {
+    "latency_distribution": MOCK_LATENCY_DISTRIBUTION,
+    "latency_median": MOCK_LATENCY_MEDIAN,
+    "latency_sigma": MOCK_LATENCY_SIGMA,
+    "latency_per_1k_tokens": MOCK_LATENCY_PER_1K_TOKENS,
+    "latency_max": MOCK_LATENCY_MAX,
+    "error_rate": MOCK_ERROR_RATE,
+    "rate_limit_rate": MOCK_RATE_LIMIT_RATE,
+    "timeout_rate": MOCK_TIMEOUT_RATE,
+    "timeout_seconds": MOCK_TIMEOUT_SECONDS,
+}
+rng = random.Random(int(MOCK_SEED) if MOCK_SEED is not None else None)
+
+stats = {"requests": 0, "succeeded": 0, "server_errors": 0, "rate_limited": 0, "timeouts": 0,
+         "prompt_tokens": 0, "completion_tokens": 0}
+# Rolling window of recent latencies, used for the percentiles in /mock/stats
+latencies = deque(maxlen=10000)
+
+# Uploaded and generated files, and batches, by id. Everything is kept in memory.
+files = {}
+batches = {}
+# Running batch tasks, referenced until they finish so they aren't garbage-collected mid-way
+batch_tasks = set()
+
+
+def sample_latency():
+    """
+    Returns:
+        float: Seconds the next chat completion takes before its per-token part (see total_latency),
+            drawn from the configured distribution.
+    """
+    distribution, median = config["latency_distribution"], config["latency_median"]
+    if distribution == 'fixed':
+        return median
+    if distribution == 'uniform':
+        return rng.uniform(0, 2 * median)
+    if distribution == 'exponential':
+        return rng.expovariate(math.log(2) / median) if median > 0 else 0.0
+    return rng.lognormvariate(math.log(median), config["latency_sigma"]) if median > 0 else 0.0
+
+
+def total_latency(sampled, prompt_tokens):
+    """
+    Returns:
+        float: Seconds a chat completion takes: the `sampled` latency plus the per-token part, capped at latency_max.
+    """
+    return min(sampled + config["latency_per_1k_tokens"] * prompt_tokens / 1000, config["latency_max"])
+
+
+def _error(status_code, message, error_type, code, headers=None):
+    # Error body in the format of the OpenAI API, so clients raise their usual exceptions
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": error_type, "param": None, "code": code}},
+        headers=headers,
+    )
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    start = time.perf_counter()
+
+    # All random draws of a request happen here, on the event loop and in arrival order, so with
+    # MOCK_SEED the outcomes and latencies don't depend on how worker threads are scheduled
+    draw = rng.random()
+    sampled_latency = sample_latency()
+    if draw < config["rate_limit_rate"]:
+        stats["rate_limited"] += 1
+        return _error(429, "Rate limit reached (mock).", "requests", "rate_limit_exceeded", {"retry-after": "1"})
+    draw -= config["rate_limit_rate"]
+    if draw < config["error_rate"]:
+        await asyncio.sleep(total_latency(sampled_latency, 0))
+        stats["server_errors"] += 1
+        return _error(500, "The server had an error while processing your request (mock).", "server_error", None)
+    draw -= config["error_rate"]
+    if draw < config["timeout_rate"]:
+        stats["timeouts"] += 1
+        await asyncio.sleep(config["timeout_seconds"])
+
+    # Identifying image samples decodes the image, which would block the event loop under load
+    response = await asyncio.to_thread(lambda: chat_completion(body, canned_content(body)))
+    latency = total_latency(sampled_latency, response["usage"]["prompt_tokens"])
+    await asyncio.sleep(max(0.0, latency - (time.perf_counter() - start)))
+
+    stats["succeeded"] += 1
+    stats["prompt_tokens"] += response["usage"]["prompt_tokens"]
+    stats["completion_tokens"] += response["usage"]["completion_tokens"]
+    latencies.append(time.perf_counter() - start)
+    return response
+
+
+@app.get("/mock/stats")
+async def mock_stats():
+    ordered = sorted(latencies)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] if ordered else None
+
+    return {**stats, "latency_p50": percentile(0.50), "latency_p95": percentile(0.95), "latency_p99": percentile(0.99)}
+
+
+@app.get("/mock/config")
+async def get_config():
+    return config
+
+
+@app.put("/mock/config")
+async def update_config(changes: dict):
+    unknown = set(changes) - set(config)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown settings: {', '.join(sorted(unknown))}.")
+    if changes.get("latency_distribution", config["latency_distribution"]) not in LATENCY_DISTRIBUTIONS:
+        raise HTTPException(status_code=400, detail=f"latency_distribution must be one of: {', '.join(LATENCY_DISTRIBUTIONS)}.")
+    for key, value in changes.items():
+        config[key] = value if key == "latency_distribution" else float(value)
+    return config
+
+
+class BatchRequest(BaseModel):
+    input_file_id: str
+    endpoint: str
+    completion_window: str
+    metadata: dict = None
+
+
+def _store_file(filename, purpose, content):
+    file_id = f"file-{uuid.uuid4().hex}"
+    files[file_id] = {
+        "object": {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        },
+        "content": content,
+    }
+    return files[file_id]["object"]
+
+
+@app.post("/v1/files")
+async def create_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    return _store_file(file.filename, purpose, await file.read())
+
+
+@app.get("/v1/files/{file_id}")
+async def retrieve_file(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="No such file.")
+    return files[file_id]["object"]
+
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="No such file.")
+    return Response(content=files[file_id]["content"], media_type="application/octet-stream")
+
+
+def _answer_line(line, fail):
+    request = json.loads(line)
+    result = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"]}
+    if fail:
+        result["response"] = None
+        result["error"] = {"code": "server_error", "message": "Mock server error."}
+        return False, result
+    body = request["body"]
+    result["response"] = {
+        "status_code": 200,
+        "request_id": uuid.uuid4().hex,
+        "body": chat_completion(body, canned_content(body)),
+    }
+    result["error"] = None
+    return True, result
+
+
+async def _process_batch(batch_id):
+    batch = batches[batch_id]
+    batch["status"] = "in_progress"
+    batch["in_progress_at"] = int(time.time())
+    await asyncio.sleep(MOCK_BATCH_DELAY)
+    if batch["status"] != "in_progress":
+        return
+
+    lines = [line for line in files[batch["input_file_id"]]["content"].decode().splitlines() if line]
+    # Failures are drawn on the event loop, before any line goes to a worker thread, so they are
+    # reproducible with MOCK_SEED
+    failures = [rng.random() < MOCK_BATCH_ERROR_RATE for _ in lines]
+    outputs, errors = [], []
+    for line, fail in zip(lines, failures):
+        # Decoding the images of a line is CPU work; keep it off the event loop
+        ok, result = await asyncio.to_thread(_answer_line, line, fail)
+        (outputs if ok else errors).append(json.dumps(result))
+
+    if outputs:
+        batch["output_file_id"] = _store_file("batch_output.jsonl", "batch_output", "\n".join(outputs).encode())["id"]
+    if errors:
+        batch["error_file_id"] = _store_file("batch_errors.jsonl", "batch_output", "\n".join(errors).encode())["id"]
+    batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+
+
+@app.post("/v1/batches")
+async def create_batch(request: BatchRequest):
+    if request.input_file_id not in files:
+        raise HTTPException(status_code=404, detail="No such file.")
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    now = int(time.time())
+    batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": request.endpoint,
+        "input_file_id": request.input_file_id,
+        "completion_window": request.completion_window,
+        "status": "validating",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": now,
+        "expires_at": now + 86400,
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        "metadata": request.metadata,
+    }
+    task = asyncio.create_task(_process_batch(batch_id))
+    batch_tasks.add(task)
+    task.add_done_callback(batch_tasks.discard)
+    return batches[batch_id]
+
+
+@app.get("/v1/batches/{batch_id}")
+async def retrieve_batch(batch_id: str):
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="No such batch.")
+    return batches[batch_id]
+
+
+@app.post("/v1/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="No such batch.")
+    batch = batches[batch_id]
+    if batch["status"] in ("validating", "in_progress"):
+        batch["status"] = "cancelled"
+        batch["cancelled_at"] = int(time.time())
+    return batch
+
+
+# Run the mock API directly with uvicorn if this python file is executed
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8080)
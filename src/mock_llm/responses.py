@@ -0,0 +1,304 @@
+import base64
+import glob
+import io
+import json
+import os
+import re
+import time
+import uuid
+
+import numpy as np
+from PIL import Image
+
+from src.backend.utils.layout import crop_to_header
+from src.backend.utils.preprocessing import vision_image_tokens
+from src.backend.utils.street_suffixes import STREET_SUFFIXES
+
+# Directory with the sample documents whose canned extractions are returned (see SAMPLE_EXTRACTIONS).
+MOCK_SAMPLES_DIR = os.getenv("MOCK_SAMPLES_DIR", os.path.join("data", "documents"))
+
+_EMPTY_EXTRACTION = {
+    "extracted_first_name": "",
+    "extracted_last_name": "",
+    "extracted_client_street_name": "",
+    "extracted_client_street_number": "",
+    "extracted_client_postal_code": "",
+    "extracted_client_city": "",
+    "extracted_bank_street_name": "",
+    "extracted_bank_street_number": "",
+    "extracted_bank_postal_code": "",
+    "extracted_bank_city": "",
+    "document_date": "",
+}
+
+# What a vision model reads from each sample document, and words that identify the sample in OCR text.
+# scan_5 and scan_6 are blank tax forms without a client.
+SAMPLE_EXTRACTIONS = {
+    "scan_1.jpg": {
+        "keywords": ["brownsville", "courage", "valley farms", "santa monica"],
+        "extraction": {
+            **_EMPTY_EXTRACTION,
+            "extracted_first_name": "John",
+            "extracted_last_name": "Smith",
+            "extracted_client_street_name": "Courage St",
+            "extracted_client_street_number": "2450",
+            "extracted_client_postal_code": "78521",
+            "extracted_client_city": "Brownsville",
+            "extracted_bank_street_name": "Valley Farms Street",
+            "extracted_bank_street_number": "231",
+            "extracted_bank_postal_code": "90403",
+            "extracted_bank_city": "Santa Monica",
+        },
+    },
+    "scan_2.jpg": {
+        "keywords": ["moshayi", "capitec", "stellenbosch", "johannesburg", "stuart place"],
+        "extraction": {
+            **_EMPTY_EXTRACTION,
+            "extracted_first_name": "Itumeleny",
+            "extracted_last_name": "Moshayi",
+            "extracted_client_street_name": "Stuart Place",
+            "extracted_client_street_number": "1",
+            "extracted_client_postal_code": "2195",
+            "extracted_client_city": "Johannesburg",
+            "extracted_bank_street_name": "Quantum Street",
+            "extracted_bank_street_number": "1",
+            "extracted_bank_postal_code": "7600",
+            "extracted_bank_city": "Stellenbosch",
+            "document_date": "07/01/2019",
+        },
+    },
+    "scan_3.jpg": {
+        "keywords": ["derrek", "alexander", "fall breeze", "elk grove", "chase"],
+        "extraction": {
+            **_EMPTY_EXTRACTION,
+            "extracted_first_name": "Derrek",
+            "extracted_last_name": "Alexander",
+            "extracted_client_street_name": "Fall Breeze Ct",
+            "extracted_client_street_number": "6817",
+            "extracted_client_postal_code": "95758",
+            "extracted_client_city": "Elk Grove",
+            "extracted_bank_street_name": "P O Box",
+            "extracted_bank_street_number": "182050",
+            "extracted_bank_postal_code": "77001",
+            "extracted_bank_city": "Houston",
+            "document_date": "October 31, 2019",
+        },
+    },
+    "scan_4.jpg": {
+        "keywords": ["lasso", "abraham", "finance bank", "photography"],
+        "extraction": {
+            **_EMPTY_EXTRACTION,
+            "extracted_first_name": "Bean",
+            "extracted_last_name": "Lasso",
+            "extracted_client_street_name": "Abraham Street",
+            "extracted_client_street_number": "123",
+            "extracted_client_postal_code": "12345-6789",
+            "extracted_client_city": "Austin City",
+            "extracted_bank_street_name": "Second Street",
+            "extracted_bank_street_number": "0987",
+            "extracted_bank_postal_code": "12345-6789",
+            "extracted_bank_city": "Austin",
+            "document_date": "06/30/2022",
+        },
+    },
+    "scan_5.jpg": {"keywords": ["form no.16", "form no. 16", "salaries", "tax regime"], "extraction": _EMPTY_EXTRACTION},
+    "scan_6.jpg": {"keywords": ["16a", "deductor", "deductee"], "extraction": _EMPTY_EXTRACTION},
+}
+
+# Images whose average hash differs from every sample in more than this fraction of bits are unknown
+_MAX_HASH_DISTANCE = 0.25
+_HASH_SIZE = 16
+
+_sample_hashes = None
+
+
+def average_hash(image):
+    """
+    Returns:
+        numpy.ndarray: 16x16 bits telling which cells of the image are brighter than the image's mean.
+            Robust to resizing, JPEG re-encoding and contrast enhancement around the mean, so the
+            backend's preprocessed uploads still match the original sample.
+    """
+    cells = np.asarray(image.convert("L").resize((_HASH_SIZE, _HASH_SIZE), Image.BILINEAR), dtype=np.float32)
+    return cells > cells.mean()
+
+
+def _load_sample_hashes():
+    # Full page and header crop of every sample, since the backend may send either
+    global _sample_hashes
+    if _sample_hashes is None:
+        _sample_hashes = []
+        for path in glob.glob(os.path.join(MOCK_SAMPLES_DIR, "*")):
+            name = os.path.basename(path)
+            if name not in SAMPLE_EXTRACTIONS:
+                continue
+            image = Image.open(path).convert("RGB")
+            _sample_hashes.append((name, average_hash(image)))
+            _sample_hashes.append((name, average_hash(crop_to_header(image))))
+    return _sample_hashes
+
+
+def _message_parts(body):
+    """Yields the text and image-URL parts of all messages of a request."""
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            yield "text", content
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    yield "text", part.get("text", "")
+                elif part.get("type") == "image_url":
+                    yield "image_url", part.get("image_url", {}).get("url", "")
+
+
+def identify_sample(body):
+    """
+    Finds the sample document a request is about: by the closest average hash for image requests,
+    by the most keywords found in the OCR text otherwise.
+
+    Returns:
+        str or None: The sample's file name, or None if the document is unknown.
+    """
+    text = ""
+    for kind, value in _message_parts(body):
+        if kind == "image_url" and value.startswith("data:"):
+            image = Image.open(io.BytesIO(base64.b64decode(value.split(",", 1)[1])))
+            image_hash = average_hash(image)
+            distances = [(np.count_nonzero(image_hash != sample_hash) / image_hash.size, name)
+                         for name, sample_hash in _load_sample_hashes()]
+            if distances:
+                distance, name = min(distances)
+                if distance <= _MAX_HASH_DISTANCE:
+                    return name
+            return None
+        if kind == "text":
+            text += value.lower() + "\n"
+
+    hits = {name: sum(keyword in text for keyword in sample["keywords"]) for name, sample in SAMPLE_EXTRACTIONS.items()}
+    name = max(hits, key=hits.get)
+    return name if hits[name] else None
+
+
+_EXTRACTED_KEYS = {
+    "first_name": "extracted_first_name",
+    "last_name": "extracted_last_name",
+    "street_name": "extracted_client_street_name",
+    "street_number": "extracted_client_street_number",
+    "postal_code": "extracted_client_postal_code",
+    "city": "extracted_client_city",
+}
+
+
+def sample_user_data(sample):
+    """
+    Returns:
+        dict: User input that matches the sample's canned extraction (empty fields for unknown samples),
+            for benchmarks and load tests that should exercise the comparison like a real customer.
+    """
+    extraction = SAMPLE_EXTRACTIONS.get(sample, {}).get("extraction", _EMPTY_EXTRACTION)
+    return {field: extraction[key] for field, key in _EXTRACTED_KEYS.items()}
+
+
+def _normalize(value):
+    words = re.findall(r"[a-z0-9]+", str(value).lower())
+    return " ".join(STREET_SUFFIXES.get(word, word) for word in words)
+
+
+def _field_matches(user_data, extracted_data):
+    # The extracted side is keyed by extraction keys (extraction schema) or by plain field names (comparison prompt)
+    return {
+        field: _normalize(user_data.get(field, "")) == _normalize(extracted_data.get(field, extracted_data.get(key, "")))
+        for field, key in _EXTRACTED_KEYS.items()
+    }
+
+
+def _is_verified(field_matches):
+    required = ("first_name", "last_name", "street_name", "street_number")
+    return all(field_matches[field] for field in required) and (field_matches["postal_code"] or field_matches["city"])
+
+
+def _prompt_json(body, label):
+    """Reads the JSON object that follows e.g. 'User Data:' in the request's text."""
+    for kind, value in _message_parts(body):
+        if kind == "text" and f"{label}:" in value:
+            try:
+                return json.JSONDecoder().raw_decode(value.split(f"{label}:", 1)[1].strip())[0]
+            except ValueError:
+                return None
+    return None
+
+
+def canned_content(body):
+    """
+    Builds an answer that satisfies the JSON schema the request asks for.
+    - Extraction schemas: the canned extraction of the identified sample (empty for unknown documents).
+    - Single-call verification: additionally a per-field verdict against the user data in the prompt.
+    - Comparison: whether the user data and the extracted data in the prompt are equal after
+      normalization, with either city or postal code sufficing.
+
+    Args:
+        body (dict): The body of a chat completion request.
+
+    Returns:
+        dict: The parsed JSON content of the answer.
+    """
+    schema = body.get("response_format", {}).get("json_schema", {}).get("schema", {})
+    properties = schema.get("properties", {})
+
+    if "extracted_first_name" not in properties:
+        user_data = _prompt_json(body, "User Data") or {}
+        extracted_data = _prompt_json(body, "Extracted Data") or {}
+        return {"is_verified": _is_verified(_field_matches(user_data, extracted_data))}
+
+    sample = identify_sample(body)
+    extraction = SAMPLE_EXTRACTIONS[sample]["extraction"] if sample else _EMPTY_EXTRACTION
+    content = {key: value for key, value in extraction.items() if key in properties}
+    if "field_matches" in properties:
+        field_matches = _field_matches(_prompt_json(body, "User Data") or {}, extraction)
+        content["field_matches"] = field_matches
+        content["is_verified"] = _is_verified(field_matches)
+    return content
+
+
+def estimate_prompt_tokens(body):
+    """
+    Returns:
+        int: A rough prompt token count: 4 characters per token for text, plus the high-detail tile cost per image.
+    """
+    tokens = 0
+    for kind, value in _message_parts(body):
+        if kind == "text":
+            tokens += len(value) // 4
+        elif value.startswith("data:"):
+            image = Image.open(io.BytesIO(base64.b64decode(value.split(",", 1)[1])))
+            tokens += vision_image_tokens(*image.size)
+    return tokens
+
+
+def chat_completion(body, content):
+    """
+    Returns:
+        dict: A chat completion response whose message holds `content` as JSON.
+    """
+    text = json.dumps(content)
+    prompt_tokens = estimate_prompt_tokens(body)
+    completion_tokens = len(text) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": text, "refusal": None},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
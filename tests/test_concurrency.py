@@ -0,0 +1,75 @@
+"""
+Checks that /process_document requests overlap on the event loop: with LLM calls that just sleep,
+two concurrent requests must take about as long as one, not as long as both.
+Tesseract is not needed, the OCR call is stubbed out as well.
+"""
+import asyncio
+import io
+import os
+import time
+
+import httpx
+from PIL import Image
+
+# The backend modules refuse to import without an API key; no real call is made here.
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+# Both requests upload the same image, so the extraction cache would short-circuit the second one
+os.environ.setdefault("EXTRACTION_CACHE_SIZE", "0")
+
+from src.backend.api import main as backend_main
+from src.backend.services import document_processor
+from src.benchmarks.concurrency import FakeAsyncOpenAI, _post
+
+LLM_LATENCY = 0.5
+
+
+class CountingFakeAsyncOpenAI(FakeAsyncOpenAI):
+    """FakeAsyncOpenAI that counts its chat completions."""
+
+    def __init__(self, latency, **kwargs):
+        super().__init__(latency, **kwargs)
+        self.calls = 0
+
+    async def _create(self, **kwargs):
+        self.calls += 1
+        return await super()._create(**kwargs)
+
+
+def _stub_ocr(client, file_bytes, region='full', page=None, debug=None):
+    return [{"role": "user", "content": "John Smith, 2450 Coventry Avenue, 78521 Brownsville"}]
+
+
+def _sample_image():
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 600), "white").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+async def _run_concurrent(fake_client, n_requests):
+    """
+    Returns:
+        tuple: Wall time of `n_requests` concurrent requests, and the LLM calls a single request makes.
+    """
+    file_bytes = _sample_image()
+    transport = httpx.ASGITransport(app=backend_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend", timeout=None) as client:
+        # Warm-up, so imports and thread start-up don't count
+        await _post(client, file_bytes)
+        calls_per_request = fake_client.calls
+
+        start = time.perf_counter()
+        await asyncio.gather(*(_post(client, file_bytes) for _ in range(n_requests)))
+        return time.perf_counter() - start, calls_per_request
+
+
+def test_requests_overlap(monkeypatch):
+    fake_client = CountingFakeAsyncOpenAI(LLM_LATENCY)
+    monkeypatch.setattr(backend_main, "client", fake_client)
+    monkeypatch.setattr(document_processor, "ocr_img_processing", _stub_ocr)
+
+    wall, calls_per_request = asyncio.run(_run_concurrent(fake_client, 2))
+
+    # Run one after the other, the two requests would wait on the LLM twice as long as one
+    single = calls_per_request * LLM_LATENCY
+    assert calls_per_request >= 1
+    assert wall < 1.5 * single